@@ -1,11 +1,39 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils import timezone
-from .models import Post, News, Category, Tag, Comment
+from datetime import timedelta
+from django.db.models import Avg, Count, Max, Q, Sum
+from . import page_cache
+from .models import Post, News, Category, Tag, Comment, Reaction, EmailNotificationJob, EmailDelivery, ViewCounterFlush
+from .view_buffer import buffer as view_buffer
+
+def change_status(queryset, status):
+    """
+    Меняет статус постов через save(), а не UPDATE по queryset: сигналы смены статуса
+    обновляют статистику и ленты подписок, save() - версию карточки и версии страниц в кэше.
+    Возвращает количество изменённых постов
+    """
+    posts = list(queryset.exclude(status=status))
+    with transaction.atomic():
+        for post in posts:
+            post.status = status
+            post.save(update_fields=['status', 'updated_at'])
+    return len(posts)
+
+def update_news(queryset, **values):
+    """
+    UPDATE новостей по queryset. Сигналов он не отправляет, поэтому версии страниц в кэше
+    (списки с главной и страницы постов новостей) сдвигаются здесь. Возвращает количество новостей
+    """
+    post_ids = list(queryset.values_list('post_item_id', flat=True))
+    updated = queryset.update(**values)
+    page_cache.touch_posts(post_ids)
+    return updated
 
 # Actions для массовой публикации/снятия с публикации
 def make_published(modeladmin, request, queryset):
     # Публикуем только те посты, которые еще не опубликованы
-    updated = queryset.filter(status='draft').update(status='published')
+    updated = change_status(queryset, 'published')
     
     if updated == 1:
         message = "1 пост был опубликован"
@@ -19,7 +47,7 @@ make_published.short_description = "Опубликовать выбранные
 
 def make_draft(modeladmin, request, queryset):
     # Переводим в черновик только опубликованные посты
-    updated = queryset.filter(status='published').update(status='draft')
+    updated = change_status(queryset, 'draft')
     
     if updated == 1:
         message = "1 пост переведен в черновик"
@@ -37,7 +65,10 @@ class PostAdmin(admin.ModelAdmin):
     list_display = ['title', 'status', 'category', 'author', 'created_at', 'views']
     list_filter = ['status', 'category', 'author', 'created_at']
     search_fields = ['title', 'text']
-    readonly_fields = ['slug', 'views', 'created_at', 'updated_at']
+    readonly_fields = [
+        'slug', 'views', 'created_at', 'updated_at',
+        'likes_count', 'dislikes_count', 'favorites_count', 'comments_count', 'trending_score'
+    ]
     actions = [make_published, make_draft]
     
     fieldsets = (
@@ -48,16 +79,19 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('status', 'author')
         }),
         ('Статистика', {
-            'fields': ('views', 'created_at', 'updated_at', 'slug'),
+            'fields': (
+                'views', 'likes_count', 'dislikes_count', 'favorites_count', 'comments_count',
+                'trending_score', 'created_at', 'updated_at', 'slug'
+            ),
             'classes': ('collapse',)
         }),
-        ('Лайки и избранное', {
-            'fields': ('liked_users', 'disliked_users', 'favorites', 'viewed_users'),
+        ('Избранное и просмотры', {
+            'fields': ('favorites', 'viewed_users'),
             'classes': ('collapse',)
         }),
     )
     
-    filter_horizontal = ['tags', 'liked_users', 'disliked_users', 'favorites', 'viewed_users']
+    filter_horizontal = ['tags', 'favorites', 'viewed_users']
     
     def save_model(self, request, obj, form, change):
         if not obj.pk:  # Если это новый пост
@@ -74,9 +108,9 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug']
+    list_display = ['name', 'slug', 'posts_count']
     search_fields = ['name']
-    readonly_fields = ['slug']
+    readonly_fields = ['slug', 'posts_count']
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -89,6 +123,23 @@ class CommentAdmin(admin.ModelAdmin):
         return obj.text[:50] + '...' if len(obj.text) > 50 else obj.text
     short_text.short_description = 'Текст комментария'
 
+@admin.register(Reaction)
+class ReactionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'post', 'kind', 'created_at']
+    list_filter = ['kind']
+    search_fields = ['user__username', 'post__title']
+    raw_id_fields = ['post', 'user']
+
+    # Реакции меняются через blog.reactions (вместе со счётчиками поста), здесь только просмотр
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
     list_display = ['post_title', 'is_important', 'news_type', 'pinned', 'email_notifications_sent', 'post_status']
@@ -108,19 +159,89 @@ class NewsAdmin(admin.ModelAdmin):
     actions = ['mark_as_important', 'unmark_as_important', 'mark_pinned']
     
     def mark_as_important(self, request, queryset):
-        updated = queryset.update(is_important=True)
+        updated = update_news(queryset, is_important=True)
         self.message_user(request, f"{updated} новостей отмечены как важные")
     mark_as_important.short_description = "Отметить как важные"
     
     def unmark_as_important(self, request, queryset):
-        updated = queryset.update(is_important=False)
+        updated = update_news(queryset, is_important=False)
         self.message_user(request, f"{updated} новостей сняты с отметки 'важные'")
     unmark_as_important.short_description = "Снять отметку 'важные'"
     
     def mark_pinned(self, request, queryset):
         # Снимаем закрепление со всех других новостей
-        News.objects.filter(pinned=True).update(pinned=False)
+        update_news(News.objects.filter(pinned=True), pinned=False)
         # Закрепляем выбранные
-        updated = queryset.update(pinned=True)
+        updated = update_news(queryset, pinned=True)
         self.message_user(request, f"{updated} новостей закреплены")
-    mark_pinned.short_description = "Закрепить выбранные новости"
\ No newline at end of file
+    mark_pinned.short_description = "Закрепить выбранные новости"
+
+
+class EmailDeliveryInline(admin.TabularInline):
+    model = EmailDelivery
+    fields = ['email', 'status', 'attempts', 'last_error', 'sent_at']
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+    max_num = 0
+    show_change_link = False
+
+    def get_queryset(self, request):
+        # Показываем только проблемные доставки, успешных могут быть тысячи
+        return super().get_queryset(request).exclude(status='sent')
+
+@admin.register(EmailNotificationJob)
+class EmailNotificationJobAdmin(admin.ModelAdmin):
+    list_display = ['news', 'status', 'sent_count', 'failed_count', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['news', 'status', 'attempts', 'last_error', 'created_at', 'started_at', 'finished_at']
+    inlines = [EmailDeliveryInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('news__post_item').annotate(
+            sent=Count('deliveries', filter=Q(deliveries__status='sent')),
+            failed=Count('deliveries', filter=Q(deliveries__status='failed')),
+        )
+
+    def sent_count(self, obj):
+        return obj.sent
+    sent_count.short_description = 'Отправлено'
+    sent_count.admin_order_field = 'sent'
+
+    def failed_count(self, obj):
+        return obj.failed
+    failed_count.short_description = 'С ошибкой'
+    failed_count.admin_order_field = 'failed'
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ViewCounterFlush)
+class ViewCounterFlushAdmin(admin.ModelAdmin):
+    list_display = ['flushed_at', 'process', 'posts', 'views', 'viewers', 'lag', 'duration']
+    list_filter = ['process']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Сводка задержки сброса за последний час и состояние буфера текущего процесса
+        last_hour = ViewCounterFlush.objects.filter(flushed_at__gte=timezone.now() - timedelta(hours=1))
+        last_flush = ViewCounterFlush.objects.first()
+
+        extra_context = extra_context or {}
+        extra_context['flush_summary'] = last_hour.aggregate(
+            flushes=Count('id'),
+            views=Sum('views'),
+            avg_lag=Avg('lag'),
+            max_lag=Max('lag'),
+            max_duration=Max('duration'),
+        )
+        extra_context['seconds_since_flush'] = (
+            (timezone.now() - last_flush.flushed_at).total_seconds() if last_flush else None
+        )
+        extra_context['buffer_stats'] = view_buffer.stats()
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,167 @@
+"""
+Автодополнение тегов и категорий (AutocompleteView, поле тегов в форме поста).
+
+Индекс хранится в памяти процесса: отсортированный массив ключей (имя в нижнем регистре и слаг),
+поиск по префиксу - bisect и проход по совпадающему диапазону, без запросов к базе.
+Варианты ранжируются по использованию: количество постов у тега (Tag.posts_count) или категории.
+
+Индекс строится при первом запросе и затем обновляется по месту: сигналы сохранения и удаления
+Tag/Category, создание тегов в blog/tags.py и изменение их счётчиков. Изменения из других процессов
+и UPDATE по queryset подхватываются полной перестройкой раз в AUTOCOMPLETE_MAX_AGE секунд.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Category, Tag
+
+KINDS = {
+    'tag': Tag,
+    'category': Category,
+}
+
+
+def normalize(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+class Entry:
+    def __init__(self, kind, object_id, name, slug, weight):
+        self.kind = kind
+        self.id = object_id
+        self.name = name
+        self.slug = slug
+        self.weight = weight
+
+    def keys(self):
+        return {normalize(self.name), self.slug} - {''}
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'id': self.id,
+            'name': self.name,
+            'slug': self.slug,
+            'count': self.weight,
+            'url': KINDS[self.kind](name=self.name, slug=self.slug).get_absolute_url(),
+        }
+
+
+def load_entries():
+    entries = [
+        Entry('tag', tag_id, name, slug, posts_count)
+        for tag_id, name, slug, posts_count in Tag.objects.values_list('id', 'name', 'slug', 'posts_count')
+    ]
+    # Категорий мало - количество постов считается при перестройке
+    entries += [
+        Entry('category', category_id, name, slug, posts_count)
+        for category_id, name, slug, posts_count in Category.objects.annotate(
+            posts_count=Count('posts')
+        ).values_list('id', 'name', 'slug', 'posts_count')
+    ]
+    return entries
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Отсортированные (ключ, вид, id) и записи по (вид, id)
+        self.keys = []
+        self.entries = {}
+        self.built_at = None
+
+    def build(self):
+        entries = load_entries()
+        keys = sorted((key, entry.kind, entry.id) for entry in entries for key in entry.keys())
+        with self.lock:
+            self.keys, self.entries = keys, {(entry.kind, entry.id): entry for entry in entries}
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None:
+            self.build()
+        elif time.monotonic() - self.built_at > settings.AUTOCOMPLETE_MAX_AGE:
+            # Пока перестройка идёт в одном потоке, остальные отвечают по текущему индексу
+            self.built_at = time.monotonic()
+            self.build()
+
+    def put(self, kind, object_id, name, slug, weight=None):
+        """Добавляет или обновляет запись; weight=None - оставить прежний вес"""
+        if self.built_at is None:
+            return
+
+        with self.lock:
+            old = self.entries.get((kind, object_id))
+            if weight is None:
+                weight = old.weight if old else 0
+            if old:
+                self._remove_keys(old)
+
+            entry = self.entries[(kind, object_id)] = Entry(kind, object_id, name, slug, weight)
+            for key in entry.keys():
+                insort(self.keys, (key, kind, object_id))
+
+    def remove(self, kind, object_id):
+        with self.lock:
+            entry = self.entries.pop((kind, object_id), None)
+            if entry:
+                self._remove_keys(entry)
+
+    def change_weight(self, kind, object_ids, delta):
+        with self.lock:
+            for object_id in object_ids:
+                entry = self.entries.get((kind, object_id))
+                if entry:
+                    entry.weight = max(entry.weight + delta, 0)
+
+    def _remove_keys(self, entry):
+        for key in entry.keys():
+            position = bisect_left(self.keys, (key, entry.kind, entry.id))
+            if position < len(self.keys) and self.keys[position] == (key, entry.kind, entry.id):
+                del self.keys[position]
+
+    def search(self, prefix, kinds=None, limit=10):
+        """Не больше limit записей, ключ которых начинается с prefix, самые используемые первыми"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_built()
+
+        keys, entries = self.keys, self.entries
+        found = {}
+        position = bisect_left(keys, (prefix,))
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            _, kind, object_id = keys[position]
+            entry = entries.get((kind, object_id))
+            if entry and (kinds is None or kind in kinds):
+                found[(kind, object_id)] = entry
+            position += 1
+
+        return heapq.nsmallest(limit, found.values(), key=lambda entry: (-entry.weight, len(entry.name), entry.name))
+
+
+index = PrefixIndex()
+
+
+def index_tags(tags):
+    """Для тегов, созданных без сигналов (bulk_create), - после фиксации транзакции"""
+    rows = [(tag.id, tag.name, tag.slug, tag.posts_count) for tag in tags]
+
+    def put_tags():
+        for row in rows:
+            index.put('tag', *row)
+
+    transaction.on_commit(put_tags)
+
+
+def change_tag_weights(tag_ids, delta):
+    tag_ids = list(tag_ids)
+    transaction.on_commit(lambda: index.change_weight('tag', tag_ids, delta))
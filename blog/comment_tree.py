@@ -0,0 +1,126 @@
+"""
+Загрузка дерева комментариев по материализованному пути (Comment.path).
+
+Корневые комментарии читаются порцией по курсору, затем все их потомки до заданной
+глубины - одним запросом по диапазонам path с присоединёнными авторами.
+Дерево собирается в Python: у каждого комментария появляется список children.
+Если ответы загружены не полностью (ограничение глубины или количества),
+у комментария есть more_replies_cursor для кнопки "Показать ещё ответы".
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+from .pagination import apaginate_keyset, encode_cursor, paginate_keyset
+
+# Корневые комментарии - сначала новые
+ROOTS_ORDERING = ('-created_at', '-id')
+# Ответы - в порядке добавления (совпадает с порядком path)
+REPLIES_ORDERING = ('id',)
+
+
+def max_depth():
+    """Сколько уровней ответов загружается вместе с комментарием"""
+    return getattr(settings, 'COMMENTS_TREE_MAX_DEPTH', 4)
+
+
+def max_nodes():
+    """Максимум ответов, загружаемых одним запросом для порции комментариев"""
+    return getattr(settings, 'COMMENTS_TREE_MAX_NODES', 200)
+
+
+def tree_queryset(queryset):
+    return queryset.select_related('author', 'parent__author')
+
+
+def descendants_queryset(comments):
+    """
+    Потомки комментариев порции до max_depth() уровней, в порядке path.
+    Все комментарии порции находятся на одном уровне (корни или ответы одному комментарию).
+    """
+    # Общий диапазон путей порции внутри поста - один проход по индексу (post, path) в нужном
+    # порядке, без сортировки объединения диапазонов во временном B-дереве
+    paths = sorted(comment.path for comment in comments)
+    return tree_queryset(Comment.objects.filter(
+        Q(path__gte=paths[0], path__lt=paths[-1] + ':'),
+        reduce(or_, [Comment.subtree_filter(path) for path in paths]),
+        post_id=comments[0].post_id,
+        depth__gt=comments[0].depth,
+        depth__lte=comments[0].depth + max_depth()
+    )).order_by('path')[:max_nodes()]
+
+
+def build_tree(comments, descendants):
+    """Раскладывает потомков по спискам children и отмечает неполностью загруженные ветки"""
+    nodes = {comment.id: comment for comment in comments}
+
+    for comment in comments:
+        comment.children = []
+
+    for comment in descendants:
+        parent = nodes.get(comment.parent_id)
+        # Родитель мог не попасть в выборку из-за ограничения количества
+        if parent is None:
+            continue
+        comment.children = []
+        parent.children.append(comment)
+        nodes[comment.id] = comment
+
+    for comment in nodes.values():
+        comment.more_replies_cursor = None
+        comment.has_more_replies = len(comment.children) < comment.replies_count
+        if comment.has_more_replies and comment.children:
+            comment.more_replies_cursor = encode_cursor(comment.children[-1], REPLIES_ORDERING)
+
+    return comments
+
+
+def attach_descendants(comments):
+    """Загружает потомков комментариев одним запросом и собирает дерево"""
+    comments = list(comments)
+    descendants = descendants_queryset(comments) if comments else []
+    return build_tree(comments, descendants)
+
+
+async def aattach_descendants(comments):
+    """attach_descendants для async view"""
+    descendants = [comment async for comment in descendants_queryset(comments)] if comments else []
+    return build_tree(comments, descendants)
+
+
+def load_root_comments(post, limit, cursor=None, offset=0):
+    """Порция корневых комментариев поста вместе с деревьями ответов"""
+    roots, has_more, next_cursor = paginate_keyset(
+        tree_queryset(post.comments.filter(parent__isnull=True)),
+        ROOTS_ORDERING,
+        limit,
+        cursor=cursor,
+        offset=offset
+    )
+    return attach_descendants(roots), has_more, next_cursor
+
+
+async def aload_root_comments(post_id, limit, cursor=None, offset=0):
+    """load_root_comments для async view"""
+    roots, has_more, next_cursor = await apaginate_keyset(
+        tree_queryset(Comment.objects.filter(post_id=post_id, parent__isnull=True)),
+        ROOTS_ORDERING,
+        limit,
+        cursor=cursor,
+        offset=offset
+    )
+    return await aattach_descendants(roots), has_more, next_cursor
+
+
+def load_replies(comment, limit, cursor=None):
+    """Следующая порция прямых ответов на комментарий вместе с их поддеревьями"""
+    replies, has_more, next_cursor = paginate_keyset(
+        tree_queryset(comment.replies.all()),
+        REPLIES_ORDERING,
+        limit,
+        cursor=cursor
+    )
+    return attach_descendants(replies), has_more, next_cursor
@@ -0,0 +1,180 @@
+"""
+Сценарии запросов ко всем URL приложений blog и users для служебных команд
+(benchmark_endpoints - замеры времени, check_query_plans - планы SQL-запросов).
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from users import urls as users_urls
+from . import urls as blog_urls
+from .models import Post, Comment, Category, Tag
+
+User = get_user_model()
+
+
+def endpoint(name, url, method='get', data=None, client='user', setup=None, label=None):
+    """
+    Описание замеряемого запроса. url - строка или функция без аргументов
+    (для ссылок с одноразовыми токенами, которые нужно строить перед каждым запросом).
+    """
+    return {
+        'name': name,
+        'label': label or name,
+        'url': url,
+        'method': method,
+        'data': data or {},
+        'client': client,
+        'setup': setup,
+    }
+
+
+def token_url(name, user):
+    def build():
+        return reverse(name, kwargs={
+            'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
+            'token': default_token_generator.make_token(user),
+        })
+    return build
+
+
+def build_endpoints():
+    """
+    Сценарии запросов ко всем URL blog и users на данных из базы: (клиенты, список сценариев).
+    Запросы меняют данные (лайки, комментарии, подписки) - выполнять их нужно в откатываемой транзакции.
+    """
+    post = (
+        Post.objects.filter(status='published', news_item__isnull=True)
+        .select_related('author', 'category')
+        .order_by('-comments_count', '-id')
+        .first()
+    )
+    if post is None:
+        raise CommandError("В базе нет опубликованных постов - сначала выполните seed_data")
+
+    user = post.author
+    author = User.objects.filter(posts__status='published').exclude(id=user.id).first() or user
+    comment = (
+        Comment.objects.filter(post=post).order_by('-replies_count', 'id').first()
+    )
+    category = post.category or Category.objects.first()
+    tag = post.tags.first() or Tag.objects.first()
+
+    clients = {
+        'anonymous': Client(raise_request_exception=False),
+        'user': Client(raise_request_exception=False),
+        'logout': Client(raise_request_exception=False),
+    }
+    clients['user'].force_login(user)
+
+    def login_again():
+        clients['logout'].force_login(user)
+
+    endpoints = [
+        endpoint('blog:main_page', reverse('blog:main_page'), client='anonymous'),
+        endpoint('blog:post_list', reverse('blog:post_list'), client='anonymous', label='blog:post_list[anonymous]'),
+        *[
+            endpoint(
+                'blog:post_list', reverse('blog:post_list'), data={'filter': feed},
+                label=f'blog:post_list[{feed}]'
+            )
+            for feed in ('all', 'trending', 'popular', 'following')
+        ],
+        endpoint('blog:load_more_posts', reverse('blog:load_more_posts'), data={'offset': 6}),
+        endpoint('blog:post_search', reverse('blog:post_search'), data={'search': 'python'}),
+        endpoint('blog:new_post', reverse('blog:new_post')),
+        endpoint('blog:edit_post', reverse('blog:edit_post', args=[post.id])),
+        endpoint('blog:remove_post', reverse('blog:remove_post', args=[post.id])),
+        endpoint(
+            'blog:post_detail', reverse('blog:post_detail', args=[post.slug]), client='anonymous',
+            label='blog:post_detail[anonymous]'
+        ),
+        endpoint('blog:post_detail', reverse('blog:post_detail', args=[post.slug])),
+        *[
+            endpoint(
+                'blog:post_react', reverse('blog:post_react', args=[post.id]), method='post',
+                data={'kind': kind}, label=f'blog:post_react[{kind}]'
+            )
+            for kind in ('like', 'dislike')
+        ],
+        endpoint('blog:post_favorite_toggle', reverse('blog:post_favorite_toggle', args=[post.id]), method='post'),
+        endpoint(
+            'blog:add_comment', reverse('blog:add_comment', args=[post.id]), method='post',
+            data={'text': 'Комментарий для замера', 'parent_id': comment.id if comment else ''}
+        ),
+        endpoint('blog:load_more_comments', reverse('blog:load_more_comments', args=[post.id]), data={'offset': 0}),
+        endpoint('blog:autocomplete', reverse('blog:autocomplete'), client='anonymous', data={'q': 'т'}),
+        endpoint(
+            'blog:toggle_important_news_subscription', reverse('blog:toggle_important_news_subscription'),
+            method='post'
+        ),
+
+        endpoint('users:register', reverse('users:register'), client='anonymous'),
+        endpoint('users:activate_account', token_url('users:activate_account', user), client='anonymous'),
+        endpoint('users:login', reverse('users:login'), client='anonymous'),
+        endpoint('users:logout', reverse('users:logout'), method='post', client='logout', setup=login_again),
+        endpoint(
+            'users:set_phone_number', reverse('users:set_phone_number'), method='post',
+            data={'phone_number': '+79990000000'}
+        ),
+        endpoint('users:mark_phone_number_as_verified', reverse('users:mark_phone_number_as_verified'), method='post'),
+        endpoint('users:password_change', reverse('users:password_change')),
+        endpoint('users:password_change_done', reverse('users:password_change_done')),
+        endpoint('users:password_reset', reverse('users:password_reset'), client='anonymous'),
+        endpoint(
+            'users:password_reset_instructions_sent', reverse('users:password_reset_instructions_sent'),
+            client='anonymous'
+        ),
+        endpoint('users:password_reset_set_new', token_url('users:password_reset_set_new', user), client='anonymous'),
+        endpoint('users:password_reset_complete', reverse('users:password_reset_complete'), client='anonymous'),
+        endpoint('users:profile_password_reset', reverse('users:profile_password_reset')),
+        endpoint(
+            'users:profile_password_reset_instructions_sent',
+            reverse('users:profile_password_reset_instructions_sent')
+        ),
+        endpoint('users:toggle_theme', reverse('users:toggle_theme'), method='post'),
+        endpoint('users:favorite_posts', reverse('users:favorite_posts')),
+        endpoint('users:settings', reverse('users:settings')),
+        endpoint('users:follow', reverse('users:follow', args=[author.username]), method='post'),
+        endpoint('users:unfollow', reverse('users:unfollow', args=[author.username]), method='post'),
+        endpoint(
+            'users:profile', reverse('users:profile', args=[author.username]), client='anonymous',
+            label='users:profile[anonymous]'
+        ),
+        endpoint('users:profile', reverse('users:profile', args=[author.username])),
+    ]
+
+    if category:
+        endpoints.append(endpoint('blog:category_posts', reverse('blog:category_posts', args=[category.slug])))
+    if tag:
+        endpoints.append(endpoint('blog:tag_posts', reverse('blog:tag_posts', args=[tag.slug])))
+    if comment:
+        endpoints.append(endpoint(
+            'blog:load_more_replies', reverse('blog:load_more_replies', args=[post.id, comment.id])
+        ))
+
+    return clients, endpoints
+
+
+
+def uncovered_urls(endpoints):
+    """URL приложений, для которых нет сценария"""
+    covered = {item['name'] for item in endpoints}
+    return [
+        f'{module.app_name}:{pattern.name}'
+        for module in (blog_urls, users_urls)
+        for pattern in module.urlpatterns
+        if pattern.name and f'{module.app_name}:{pattern.name}' not in covered
+    ]
+
+
+def perform(clients, item):
+    """Выполняет запрос сценария, возвращает ответ"""
+    if item['setup']:
+        item['setup']()
+    url = item['url']() if callable(item['url']) else item['url']
+    return getattr(clients[item['client']], item['method'])(url, item['data'])
@@ -0,0 +1,198 @@
+import re
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import CharField, Value, aprefetch_related_objects, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .view_buffer import buffer as view_buffer
+
+User = get_user_model()
+
+VIEWED = 'viewed'
+FAVORITE = 'favorite'
+
+
+# Поля карточки, в которые подставляется состояние пользователя
+VIEWER_FIELDS = ('own_badge', 'viewed_badge', 'favorite_disabled', 'is_authenticated', 'favorite_icon')
+
+
+def feed_queryset(queryset):
+    """
+    Подгружает связанные объекты, которые выводит карточка поста.
+    Теги подгружаются только для карточек, которых нет в кэше (render_post_cards).
+    """
+    return queryset.select_related('category')
+
+
+def viewer_state_queryset(posts, user):
+    """Пары (id поста, VIEWED или FAVORITE) для постов порции - одним запросом"""
+    user_filter = {f'{User._meta.model_name}_id': user.id, 'post_id__in': [post.id for post in posts]}
+
+    viewed = Post.viewed_users.through.objects.filter(**user_filter).values_list(
+        'post_id', Value(VIEWED, output_field=CharField())
+    )
+    favorites = Post.favorites.through.objects.filter(**user_filter).values_list(
+        'post_id', Value(FAVORITE, output_field=CharField())
+    )
+
+    return viewed.union(favorites, all=True)
+
+
+def apply_viewer_state(posts, user, rows):
+    viewed_ids = set()
+    favorite_ids = set()
+
+    for post_id, kind in rows:
+        (viewed_ids if kind == VIEWED else favorite_ids).add(post_id)
+
+    for post in posts:
+        post.is_own = user.is_authenticated and post.author_id == user.id
+        # Просмотры, ещё не сброшенные из буфера, тоже учитываем
+        post.is_viewed = post.id in viewed_ids or (
+            user.is_authenticated and view_buffer.is_viewed(post.id, user.id)
+        )
+        post.is_favorite = post.id in favorite_ids
+
+    return posts
+
+
+def attach_viewer_state(posts, user):
+    """
+    Проставляет постам флаги для карточки (is_own, is_viewed, is_favorite).
+    Просмотренные и избранные посты пользователя из порции определяются одним запросом,
+    без загрузки списков пользователей каждого поста.
+    """
+    posts = list(posts)
+    rows = viewer_state_queryset(posts, user) if user.is_authenticated and posts else []
+    return apply_viewer_state(posts, user, rows)
+
+
+async def aattach_viewer_state(posts, user):
+    """attach_viewer_state для async view"""
+    rows = [row async for row in viewer_state_queryset(posts, user)] if user.is_authenticated and posts else []
+    return apply_viewer_state(posts, user, rows)
+
+
+def card_cache_key(post):
+    return f'post_card:{post.id}:{post.card_version}'
+
+
+def render_card_template(post):
+    """
+    Рендерит карточку с метками на месте полей VIEWER_FIELDS и режет её по меткам:
+    [HTML, поле, HTML, поле, ..., HTML]. Метки содержат случайный токен рендера, поэтому текст
+    из заголовка или тегов поста не может совпасть с меткой
+    """
+    token = secrets.token_hex(8)
+    markers = {field: mark_safe(f'[[post-card:{token}:{field}]]') for field in VIEWER_FIELDS}
+    html = render_to_string("blog/includes/post_container.html", {"post": post, "viewer": markers})
+    return re.split(rf'\[\[post-card:{token}:(\w+)\]\]', html)
+
+
+def viewer_overlay(post, request, user, badges):
+    """Значения меток карточки для текущего пользователя"""
+    show_own_badge = post.is_own and request.resolver_match and request.resolver_match.url_name != 'profile'
+    return {
+        'own_badge': badges['own'] if show_own_badge else '',
+        'viewed_badge': badges['viewed'] if post.is_viewed else '',
+        'favorite_disabled': 'disabled' if post.is_own else '',
+        'is_authenticated': 'true' if user.is_authenticated else 'false',
+        'favorite_icon': 'bi-bookmark-fill' if post.is_favorite else 'bi-bookmark',
+    }
+
+
+def render_card_templates(posts):
+    """Общая для всех пользователей часть карточек: {ключ кэша: части карточки}. Теги должны быть подгружены"""
+    return {card_cache_key(post): render_card_template(post) for post in posts}
+
+
+def fill_viewer_markers(posts, request, user, cached):
+    """Подставляет в карточки из cached состояние пользователя"""
+    badges = {
+        'own': render_to_string("blog/includes/post_badges/own.html"),
+        'viewed': render_to_string("blog/includes/post_badges/viewed.html"),
+    }
+
+    cards = []
+    for post in posts:
+        parts = list(cached[card_cache_key(post)])
+        overlay = viewer_overlay(post, request, user, badges)
+        # Нечётные части - имена полей, подставляются только на свои места
+        parts[1::2] = [overlay[field] for field in parts[1::2]]
+        cards.append(mark_safe(''.join(parts)))
+
+    return cards
+
+
+def card_cache_timeout():
+    return getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 24 * 3600)
+
+
+def render_post_cards(posts, request):
+    """
+    HTML карточек постов (список строк в порядке posts).
+    Общая для всех часть карточки берётся из кэша по версии поста (Post.card_version),
+    недостающие карточки рендерятся и кэшируются, затем подставляется состояние пользователя.
+    Посты должны пройти attach_viewer_state.
+    """
+    posts = list(posts)
+    cached = cache.get_many([card_cache_key(post) for post in posts])
+
+    missing = [post for post in posts if card_cache_key(post) not in cached]
+    if missing:
+        prefetch_related_objects(missing, 'tags')
+        rendered = render_card_templates(missing)
+        cache.set_many(rendered, card_cache_timeout())
+        cached.update(rendered)
+
+    return fill_viewer_markers(posts, request, request.user, cached)
+
+
+async def arender_post_cards(posts, request, user):
+    """render_post_cards для async view: пользователь передаётся уже загруженным (request.auser())"""
+    cached = await cache.aget_many([card_cache_key(post) for post in posts])
+
+    missing = [post for post in posts if card_cache_key(post) not in cached]
+    if missing:
+        await aprefetch_related_objects(missing, 'tags')
+        rendered = render_card_templates(missing)
+        await cache.aset_many(rendered, card_cache_timeout())
+        cached.update(rendered)
+
+    return fill_viewer_markers(posts, request, user, cached)
+
+
+def attach_post_cards(posts, request):
+    """Проставляет постам готовый HTML карточки (post.card_html) для тега {% post_card %}"""
+    posts = attach_viewer_state(posts, request.user)
+    for post, html in zip(posts, render_post_cards(posts, request)):
+        post.card_html = html
+    return posts
+
+
+async def aattach_post_cards(posts, request, user):
+    """attach_post_cards для async view"""
+    posts = await aattach_viewer_state(posts, user)
+    for post, html in zip(posts, await arender_post_cards(posts, request, user)):
+        post.card_html = html
+    return posts
+
+
+class PostFeedMixin:
+    """
+    Миксин для ListView с карточками постов: проставляет постам страницы флаги текущего
+    пользователя и HTML карточек. Сам queryset view оборачивает в feed_queryset().
+    """
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        context_object_name = self.get_context_object_name(context['object_list'])
+        context[context_object_name] = attach_post_cards(context[context_object_name], self.request)
+
+        return context
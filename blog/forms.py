@@ -1,4 +1,5 @@
 from django import forms
+from django.urls import reverse_lazy
 
 from .models import Post
 
@@ -8,7 +9,11 @@ class PostForm(forms.ModelForm):
         required=False,
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': 'Введите теги через запятую'
+            'placeholder': 'Введите теги через запятую',
+            # Подсказки существующих тегов (blog/js/pages/post_form.js)
+            'list': 'tagSuggestions',
+            'autocomplete': 'off',
+            'data-autocomplete-url': reverse_lazy('blog:autocomplete'),
         }),
         label="Теги"
     )
@@ -0,0 +1,185 @@
+"""
+Варианты изображений постов и аватаров пользователей.
+
+Загрузка в запросе сохраняет только оригинал. Варианты строит команда process_images (вне запроса):
+уменьшенные копии нескольких ширин в WebP и JPEG, без EXIF (ориентация из EXIF применяется заранее).
+Описание хранится в JSON-поле модели рядом с картинкой:
+{'source': имя оригинала, 'width': ..., 'height': ..., 'variants': {'webp': [{'name', 'width', 'height'}, ...], ...}}
+Пустой словарь - варианты ещё не построены, шаблоны выводят оригинал (см. тег responsive_image).
+Описание записывает только process_images: при замене картинки его сбрасывают сигналы отдельным UPDATE,
+а файлы старых вариантов удаляются.
+"""
+import logging
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from users.cache import forget_user
+
+from . import page_cache
+from .models import Post
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Формат варианта -> (формат Pillow, расширение, MIME-тип)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+
+def image_specs():
+    """
+    Поля с картинками: (модель, поле картинки, JSON-поле вариантов, ширины вариантов,
+    дополнительные поля UPDATE при записи вариантов)
+    """
+    return [
+        # Карточка поста кэшируется по версии - после появления вариантов её нужно перерисовать
+        (Post, 'image', 'image_variants', settings.POST_IMAGE_WIDTHS, {'card_version': F('card_version') + 1}),
+        (User, 'avatar', 'avatar_variants', settings.AVATAR_IMAGE_WIDTHS, {}),
+    ]
+
+
+def variant_names(data):
+    return [variant['name'] for variants in data.get('variants', {}).values() for variant in variants]
+
+
+def delete_variant_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def remember_image(instance, field):
+    """Для post_init: имя картинки на момент загрузки (None, если поле не загружено)"""
+    value = instance.__dict__.get(field)
+    setattr(instance, f'_loaded_{field}', getattr(value, 'name', value))
+
+
+def reset_variants(instance, field, variants_field):
+    """
+    Для pre_save: при замене или удалении картинки сбрасывает описание вариантов, файлы старых вариантов
+    удаляются после фиксации транзакции. Если картинка не менялась, описание не трогается: его могла
+    записать process_images уже после загрузки объекта
+    """
+    if instance._state.adding:
+        return
+
+    model = type(instance)
+    name = getattr(instance, field).name or ''
+    loaded = getattr(instance, f'_loaded_{field}', None)
+    if loaded is None:
+        loaded = model.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    if (loaded or '') == name:
+        return
+
+    # Описание в памяти могло устареть - файлы вариантов берутся из базы
+    data = model.objects.filter(pk=instance.pk).values_list(variants_field, flat=True).first() or {}
+    setattr(instance, variants_field, {})
+    setattr(instance, f'_reset_{variants_field}', True)
+    names = variant_names(data)
+    if names:
+        transaction.on_commit(lambda: delete_variant_files(names))
+
+
+def clear_variants(instance, field, variants_field):
+    """
+    Для post_save: сброшенное описание записывается отдельным UPDATE - обычное сохранение поста
+    его не пишет (Post.save)
+    """
+    name = getattr(instance, field).name or ''
+    setattr(instance, f'_loaded_{field}', name)
+    if instance.__dict__.pop(f'_reset_{variants_field}', False):
+        type(instance).objects.filter(pk=instance.pk, **{field: name}).update(**{variants_field: {}})
+
+
+def prepare(image, image_format):
+    """JPEG не поддерживает прозрачность и палитру, WebP - палитру"""
+    if image_format == 'JPEG':
+        return image.convert('RGB')
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image
+
+
+def build_variants(name, widths):
+    """Строит и сохраняет варианты картинки name, возвращает описание для JSON-поля"""
+    with default_storage.open(name, 'rb') as file, Image.open(file) as original:
+        # Поворот по EXIF применяется к пикселям: сами варианты сохраняются без метаданных
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+
+        path = PurePosixPath(name)
+        variants = {key: [] for key in settings.IMAGE_VARIANT_FORMATS}
+        # Шире оригинала не увеличиваем: самая широкая копия - в размер оригинала
+        for target in sorted({min(target, width) for target in widths}):
+            target_height = max(1, round(height * target / width))
+            resized = image.resize((target, target_height), Image.Resampling.LANCZOS)
+
+            for key in settings.IMAGE_VARIANT_FORMATS:
+                image_format, extension, _ = FORMATS[key]
+                buffer = BytesIO()
+                prepare(resized, image_format).save(
+                    buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True
+                )
+                saved = default_storage.save(
+                    str(path.parent / 'variants' / f'{path.stem}_{target}w.{extension}'),
+                    ContentFile(buffer.getvalue())
+                )
+                variants[key].append({'name': saved, 'width': target, 'height': target_height})
+
+    return {'source': name, 'width': width, 'height': height, 'variants': variants}
+
+
+def process_object(model, obj, field, variants_field, widths, extra_update):
+    name = getattr(obj, field).name
+    try:
+        data = build_variants(name, widths)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+        # Повреждённый или отсутствующий файл не обрабатываем повторно: выводится оригинал
+        logger.warning("Не удалось построить варианты %s: %s", name, error)
+        data = {'source': name, 'error': str(error)}
+
+    # Картинку могли заменить, пока строились варианты - тогда результат не записываем
+    updated = model.objects.filter(pk=obj.pk, **{field: name}).update(**{variants_field: data}, **extra_update)
+    if not updated:
+        delete_variant_files(variant_names(data))
+    elif model is Post:
+        page_cache.touch_posts([obj.pk])
+    elif model is User:
+        # UPDATE не отправляет post_save - закэшированный для аутентификации пользователь сбрасывается явно
+        forget_user(obj.pk)
+    return updated
+
+
+def with_image(model, field):
+    return model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+
+
+def process_pending(batch_size):
+    """Строит варианты для порции ещё не обработанных картинок каждого вида, возвращает их количество"""
+    processed = 0
+    for model, field, variants_field, widths, extra_update in image_specs():
+        queryset = with_image(model, field).exclude(**{f'{variants_field}__has_key': 'source'})
+        for obj in queryset.only('pk', field).order_by('pk')[:batch_size]:
+            processed += process_object(model, obj, field, variants_field, widths, extra_update)
+    return processed
+
+
+def rebuild_all():
+    """Перестраивает варианты всех картинок (после изменения ширин, форматов или качества)"""
+    processed = 0
+    for model, field, variants_field, widths, extra_update in image_specs():
+        for obj in with_image(model, field).only('pk', field, variants_field).order_by('pk').iterator():
+            old_names = variant_names(getattr(obj, variants_field))
+            if process_object(model, obj, field, variants_field, widths, extra_update):
+                delete_variant_files(old_names)
+                processed += 1
+    return processed
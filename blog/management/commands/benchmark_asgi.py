@@ -0,0 +1,199 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from blog.models import Post
+from blog.sqlite_copy import temporary_copy, use_database
+
+User = get_user_model()
+
+
+def build_requests(post):
+    """Сценарии async JSON-эндпоинтов: (метка, метод, путь, параметры)"""
+    return [
+        ('post_react', 'POST', reverse('blog:post_react', args=[post.id]), {'kind': 'like'}),
+        ('post_favorite_toggle', 'POST', reverse('blog:post_favorite_toggle', args=[post.id]), {}),
+        ('add_comment', 'POST', reverse('blog:add_comment', args=[post.id]), {'text': 'Комментарий для замера'}),
+        ('load_more_posts', 'GET', reverse('blog:load_more_posts'), {'offset': 6}),
+        ('load_more_comments', 'GET', reverse('blog:load_more_comments', args=[post.id]), {'offset': 0}),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность async JSON-эндпоинтов (лайки, избранное, комментарии, "
+        "подгрузка постов и комментариев) под WSGI и ASGI при параллельных запросах. Запросы проходят "
+        "через штатные WSGIHandler и ASGIHandler со всеми middleware, без сети. WSGI-сервер моделируется "
+        "пулом потоков (как gunicorn --threads), ASGI - параллельными корутинами в одном цикле событий. "
+        "Запись идёт во временную копию базы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            default='1,8,32',
+            help="Количество одновременных запросов через запятую: для каждого значения - отдельный прогон"
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на эндпоинт в каждом прогоне")
+        parser.add_argument('--only', help="Замерять только эндпоинты, в имени которых есть эта строка")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(value) for value in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency - числа через запятую, например 1,8,32")
+
+        with temporary_copy() as copy, use_database(copy), override_settings(ALLOWED_HOSTS=['testserver']):
+            post = Post.objects.filter(status='published').annotate(
+                roots=Count('comments')
+            ).order_by('-roots', '-id').first()
+            users = list(User.objects.order_by('id')[:max(levels)])
+            if post is None or not users:
+                raise CommandError("В базе нет постов или пользователей - сначала выполните seed_data")
+
+            # У каждого одновременного клиента своя сессия и свой пользователь
+            sessions = []
+            for user in users:
+                client = Client()
+                client.force_login(user)
+                sessions.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+            scenarios = build_requests(post)
+            if options['only']:
+                scenarios = [item for item in scenarios if options['only'] in item[0]]
+
+            wsgi, asgi = WSGIHandler(), ASGIHandler()
+            for label, method, path, params in scenarios:
+                for level in levels:
+                    for server in ('wsgi', 'asgi'):
+                        jobs = [
+                            (method, path, params, sessions[number % len(sessions)])
+                            for number in range(options['requests'])
+                        ]
+                        started = time.perf_counter()
+                        if server == 'wsgi':
+                            results = self.run_wsgi(wsgi, jobs, level)
+                        else:
+                            results = asyncio.run(self.run_asgi(asgi, jobs, level))
+                        self.report(label, server, level, results, time.perf_counter() - started)
+
+    def report(self, label, server, level, results, elapsed):
+        latencies = [latency for status, latency in results]
+        # Редирект на вход или ошибка CSRF - тоже ошибка сценария
+        errors = sum(1 for status, latency in results if status != 200)
+        if len(latencies) > 1:
+            quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        else:
+            quantiles = latencies * 99
+        self.stdout.write(
+            f"{label:<22} | {server} | одновременно {level:>3} | запросов/с {len(results) / elapsed:>8.1f} | "
+            f"p50 {quantiles[49] * 1000:>7.1f} мс | p95 {quantiles[94] * 1000:>7.1f} мс | ошибок {errors}"
+        )
+
+    def request_parts(self, method, path, params, session):
+        """Строка запроса, тело и cookie (сессия и CSRF-токен для POST)"""
+        csrf = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf}'
+        encoded = urlencode(params).encode()
+        if method == 'GET':
+            return encoded.decode(), b'', cookie, csrf
+        return '', encoded, cookie, csrf
+
+    def run_wsgi(self, handler, jobs, level):
+        with ThreadPoolExecutor(max_workers=level) as executor:
+            return list(executor.map(lambda job: self.wsgi_request(handler, *job), jobs))
+
+    def wsgi_request(self, handler, method, path, params, session):
+        query, body, cookie, csrf = self.request_parts(method, path, params, session)
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': cookie,
+            'HTTP_X_CSRFTOKEN': csrf,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+            'wsgi.url_scheme': 'http',
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+        }
+        status = []
+
+        started = time.perf_counter()
+        response = handler(environ, lambda line, headers, exc_info=None: status.append(line))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return int(status[0].split()[0]), time.perf_counter() - started
+
+    async def run_asgi(self, handler, jobs, level):
+        semaphore = asyncio.Semaphore(level)
+
+        async def limited(job):
+            async with semaphore:
+                return await self.asgi_request(handler, *job)
+
+        return await asyncio.gather(*(limited(job) for job in jobs))
+
+    async def asgi_request(self, handler, method, path, params, session):
+        query, body, cookie, csrf = self.request_parts(method, path, params, session)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', cookie.encode()),
+                (b'x-csrftoken', csrf.encode()),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        disconnected = asyncio.Event()
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Клиент не отключается, пока не получит ответ
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                disconnected.set()
+
+        started = time.perf_counter()
+        await handler(scope, receive, send)
+        return status[0], time.perf_counter() - started
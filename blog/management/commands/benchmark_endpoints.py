@@ -0,0 +1,157 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from blog.endpoints import build_endpoints, perform, uncovered_urls
+from blog.models import Post
+from blog.query_budget import record_queries
+from blog.view_buffer import buffer as view_buffer
+
+
+def percentile(quantiles, value):
+    return round(quantiles[value - 1], 3)
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет все URL приложений blog и users через тестовый клиент Django и выводит JSON "
+        "с p50/p95/p99 времени ответа, количеством запросов к базе и пиковой памятью. "
+        "Все изменения в базе откатываются в конце. С --baseline сравнивает результат с сохранённым "
+        "и завершается с ошибкой при регрессии"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help="Замеров на каждый URL")
+        parser.add_argument('--warmup', type=int, default=3, help="Прогревочных запросов на каждый URL")
+        parser.add_argument('--only', help="Замерять только URL, в имени которых есть эта строка")
+        parser.add_argument('--output', help="Файл для JSON-результата (по умолчанию - stdout)")
+        parser.add_argument('--baseline', help="JSON предыдущего замера для сравнения")
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help="Допустимый относительный рост p95 (0.2 = на 20%%)"
+        )
+        parser.add_argument(
+            '--min-delta',
+            type=float,
+            default=2.0,
+            help="Рост p95 меньше этого числа миллисекунд регрессией не считается (шум)"
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError("Для перцентилей нужно хотя бы 2 замера")
+
+        # Представление сохраняется в буфере просмотров - фоновый сброс во время замеров не нужен
+        with override_settings(ALLOWED_HOSTS=['testserver'], VIEW_BUFFER_FLUSH_INTERVAL=3600):
+            with transaction.atomic():
+                self.clients, endpoints = build_endpoints()
+                self.check_coverage(endpoints)
+                if options['only']:
+                    endpoints = [item for item in endpoints if options['only'] in item['label']]
+
+                results = {}
+                for item in endpoints:
+                    results[item['label']] = self.measure(item, options['iterations'], options['warmup'])
+                    self.stderr.write(
+                        f"{item['label']}: p95 {results[item['label']]['p95_ms']} мс, "
+                        f"запросов {results[item['label']]['queries']}"
+                    )
+
+                # Лайки, комментарии, подписки и т. п. из замеров не должны остаться в базе
+                transaction.set_rollback(True)
+            view_buffer.take()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'posts': Post.objects.count(),
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output, encoding='utf-8')
+        else:
+            self.stdout.write(output)
+
+        errors = [label for label, result in results.items() if result['status'] >= 500]
+        if errors:
+            raise CommandError(f"Ошибки сервера: {', '.join(errors)}")
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'], options['min_delta'])
+
+    def check_coverage(self, endpoints):
+        """Предупреждает о URL, которые появились в приложениях, но не попали в замеры"""
+        for name in uncovered_urls(endpoints):
+            self.stderr.write(self.style.WARNING(f"URL {name} не замеряется"))
+
+    def request(self, item):
+        return perform(self.clients, item)
+
+    def measure(self, item, iterations, warmup):
+        for _ in range(warmup):
+            self.request(item)
+
+        timings = []
+        queries = []
+        status = 0
+        for _ in range(iterations):
+            with record_queries() as recorder:
+                started = time.perf_counter()
+                response = self.request(item)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(recorder.count)
+            status = max(status, response.status_code)
+
+        # Память замеряется отдельным запросом: tracemalloc заметно замедляет выполнение
+        tracemalloc.start()
+        try:
+            self.request(item)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+
+        return {
+            'method': item['method'].upper(),
+            'status': status,
+            'p50_ms': percentile(quantiles, 50),
+            'p95_ms': percentile(quantiles, 95),
+            'p99_ms': percentile(quantiles, 99),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baseline_path, tolerance, min_delta):
+        try:
+            baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f"Не удалось прочитать базовый замер {baseline_path}: {error}")
+
+        regressions = []
+        for label, result in results.items():
+            base = baseline.get(label)
+            if base is None:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance) and result['p95_ms'] - base['p95_ms'] > min_delta:
+                regressions.append(f"{label}: p95 {base['p95_ms']} -> {result['p95_ms']} мс")
+            if result['queries'] > base['queries']:
+                regressions.append(f"{label}: запросов {base['queries']} -> {result['queries']}")
+
+        if regressions:
+            raise CommandError("Регрессия относительно базового замера:\n" + '\n'.join(regressions))
+
+        self.stderr.write(self.style.SUCCESS("Регрессий относительно базового замера нет"))
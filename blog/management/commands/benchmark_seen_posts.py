@@ -0,0 +1,115 @@
+import random
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog import view_buffer
+from blog.models import Post
+from blog.seen_posts import SEEN_POSTS_COOKIE
+from blog.sqlite_copy import temporary_copy, use_database
+
+
+def session_writes(queries):
+    return sum(
+        1 for query in queries
+        if 'django_session' in query['sql'] and query['sql'].startswith(('INSERT', 'UPDATE'))
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает хранение просмотренных постов: ключи post_<id>_viewed в сессии (как было) и подписанная "
+        "cookie (blog/seen_posts.py). Для сессии ключи пишутся в SessionStore так же, как это делал "
+        "PostDetailView; для cookie посты открываются настоящими запросами анонимного посетителя. "
+        "Выводит итоговый размер хранилища, число записей в таблицу сессий и объём записанных данных. "
+        "Запросы идут во временную копию базы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--views',
+            default='10,100,500',
+            help="Количество открытых постов через запятую: для каждого значения - отдельный прогон"
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора случайных чисел")
+
+    def handle(self, *args, **options):
+        try:
+            counts = [int(value) for value in options['views'].split(',')]
+        except ValueError:
+            raise CommandError("--views - числа через запятую, например 10,100,500")
+
+        overrides = override_settings(ALLOWED_HOSTS=['testserver'], VIEW_BUFFER_FLUSH_INTERVAL=3600)
+        with temporary_copy() as copy, use_database(copy), overrides:
+            slugs = list(Post.objects.filter(status='published', news_item__isnull=True).values_list('slug', flat=True))
+            if len(slugs) < max(counts):
+                raise CommandError(f"В базе меньше {max(counts)} опубликованных постов - выполните seed_data")
+
+            rnd = random.Random(options['seed'])
+            for count in counts:
+                sample = rnd.sample(slugs, count)
+                self.report('сессия', count, self.run_session(sample))
+                self.report('cookie', count, self.run_cookie(sample))
+            # Просмотры из замера не должны попасть в базу
+            view_buffer.buffer.take()
+
+    def report(self, label, count, result):
+        self.stdout.write(
+            f"{label:<7} | постов {count:>5} | размер {result['size']:>7} Б | "
+            f"записей сессии {result['writes']:>5} | записано {result['written'] / 1024:>9.1f} КБ | "
+            f"записей при повторном просмотре {result['repeat_writes']}"
+        )
+
+    def run_session(self, slugs):
+        """Прежняя схема: ключ на каждый пост, после каждого просмотра сессия сохраняется целиком"""
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        posts = dict(Post.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+        written = 0
+        with CaptureQueriesContext(connection) as queries:
+            for slug in slugs:
+                store[f'post_{posts[slug]}_viewed'] = True
+                store.save()
+                written += len(store.encode(store._get_session()))
+        size = len(store.encode(store._get_session()))
+        store.delete()
+
+        # Повторный просмотр ключ не менял - сессия не сохранялась
+        return {
+            'size': size,
+            'writes': session_writes(queries.captured_queries),
+            'written': written,
+            'repeat_writes': 0,
+        }
+
+    def run_cookie(self, slugs):
+        client = Client()
+        urls = [reverse('blog:post_detail', args=[slug]) for slug in slugs]
+        written = 0
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: статус {response.status_code}")
+                if SEEN_POSTS_COOKIE in response.cookies:
+                    written += len(response.cookies[SEEN_POSTS_COOKIE].value)
+        writes = session_writes(queries.captured_queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            repeat_writes = 0
+            for url in urls:
+                response = client.get(url)
+                repeat_writes += SEEN_POSTS_COOKIE in response.cookies
+        repeat_writes += session_writes(queries.captured_queries)
+
+        # Cookie пишется в браузер, а не в базу: "записано" - сколько байт cookie ушло в ответах
+        return {
+            'size': len(client.cookies[SEEN_POSTS_COOKIE].value),
+            'writes': writes,
+            'written': written,
+            'repeat_writes': repeat_writes,
+        }
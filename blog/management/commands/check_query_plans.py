@@ -0,0 +1,123 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from blog.endpoints import build_endpoints, perform, uncovered_urls
+from blog.query_budget import sql_shape
+from blog.search import SearchResults
+from blog.view_buffer import buffer as view_buffer
+
+# Полный проход по таблице: "SCAN blog_posts" без USING INDEX (проход по индексу - "SCAN ... USING INDEX")
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+TEMP_BTREE_RE = re.compile(r'^USE TEMP B-TREE')
+# Проход по виртуальной таблице (FTS5): допустим только как внешний цикл, иначе MATCH
+# выполняется заново для каждой строки внешнего цикла
+VIRTUAL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)? VIRTUAL TABLE')
+LOOP_RE = re.compile(r'^(?:SCAN|SEARCH) ')
+
+# Таблицы, которые можно читать целиком: небольшие справочники, выводимые полностью
+ALLOWED_FULL_SCANS = {
+    'blog_categories': "список категорий целиком в форме поста и в поиске",
+    'blog_tags': "список тегов целиком в форме поста",
+}
+
+# Допустимые сортировки во временном B-дереве: фрагмент SQL запроса -> причина
+ALLOWED_TEMP_BTREES = {
+    'bm25(': "ранжирование по релевантности FTS5: сортируются только найденные совпадения",
+    '"blog_posts_favorites"."customuser_id" = ': "избранное одного пользователя, найденное по индексу",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет все URL приложений blog и users, собирает их SELECT-запросы и проверяет планы "
+        "(EXPLAIN QUERY PLAN). Завершается с ошибкой, если запрос читает таблицу целиком, "
+        "проходит по виртуальной таблице (FTS5) во вложенном цикле "
+        "или сортирует выборку во временном B-дереве. Изменения в базе откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="Печатать планы всех запросов")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Проверка планов поддерживается только для SQLite (EXPLAIN QUERY PLAN)")
+
+        queries = {}
+
+        def capture(label):
+            def wrapper(execute, sql, params, many, context):
+                if not many and sql.lstrip().upper().startswith('SELECT'):
+                    queries.setdefault((label, sql_shape(sql)), (label, sql, params))
+                return execute(sql, params, many, context)
+            return wrapper
+
+        with override_settings(ALLOWED_HOSTS=['testserver'], VIEW_BUFFER_FLUSH_INTERVAL=3600):
+            with transaction.atomic():
+                clients, endpoints = build_endpoints()
+                for name in uncovered_urls(endpoints):
+                    self.stderr.write(self.style.WARNING(f"URL {name} не проверяется"))
+
+                for item in endpoints:
+                    with connection.execute_wrapper(capture(item['name'])):
+                        perform(clients, item)
+
+                # Запросы поиска по всем колонкам индекса: подсчёт и страница результатов
+                with connection.execute_wrapper(capture('search')):
+                    results = SearchResults('python', search_category=True, search_tag=True)
+                    results.count()
+                    results[0:10]
+
+                problems = []
+                for label, sql, params in queries.values():
+                    plan = self.explain(sql, params)
+                    found = self.plan_problems(sql, plan)
+                    if found or options['verbose_plans']:
+                        self.stdout.write(f"\n{label}: {sql}\n" + '\n'.join(f'    {line}' for _, _, line in plan))
+                    problems += [f"{label}: {problem}" for problem in found]
+
+                transaction.set_rollback(True)
+            view_buffer.take()
+
+        if problems:
+            raise CommandError("Неэффективные планы запросов:\n" + '\n'.join(problems))
+
+        self.stdout.write(self.style.SUCCESS(f"Проверено запросов: {len(queries)}, проблем в планах нет"))
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            # Строки плана: (id, parent, notused, detail)
+            return [(row[0], row[1], row[3]) for row in cursor.fetchall()]
+
+    def plan_problems(self, sql, plan):
+        problems = []
+        details = {line_id: line for line_id, parent, line in plan}
+        parents = {line_id: parent for line_id, parent, line in plan}
+        # Циклы по уровням плана: второй и следующие циклы одного уровня вложены в предыдущие
+        loops = {}
+
+        for line_id, parent, line in plan:
+            if LOOP_RE.match(line):
+                outer = loops.setdefault(parent, [])
+                virtual = VIRTUAL_SCAN_RE.match(line)
+                if virtual and (outer or self.in_correlated_subquery(line_id, details, parents)):
+                    problems.append(f"проход по виртуальной таблице {virtual.group(1)} на каждую строку внешнего цикла")
+                outer.append(line)
+
+            scan = FULL_SCAN_RE.match(line)
+            if scan and scan.group(1) not in ALLOWED_FULL_SCANS:
+                problems.append(f"полный проход по таблице {scan.group(1)}")
+            if TEMP_BTREE_RE.match(line) and not any(fragment in sql for fragment in ALLOWED_TEMP_BTREES):
+                problems.append(f"сортировка во временном B-дереве ({line})")
+        return problems
+
+    def in_correlated_subquery(self, line_id, details, parents):
+        parent = parents.get(line_id)
+        while parent in details:
+            if details[parent].startswith('CORRELATED'):
+                return True
+            parent = parents.get(parent)
+        return False
@@ -0,0 +1,66 @@
+from itertools import batched
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.models import Post, Reaction
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит лайки и дизлайки из устаревших таблиц Post.liked_users/disliked_users в Reaction "
+        "и пересчитывает счётчики постов. Повторный запуск безопасен: если устаревшие таблицы пусты, "
+        "команда ничего не делает"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help="Количество реакций, вставляемых одним запросом"
+        )
+        parser.add_argument(
+            '--clear-legacy',
+            action='store_true',
+            help="После переноса очистить устаревшие таблицы"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_field = f'{User._meta.model_name}_id'
+        legacy = (Post.liked_users.through, Post.disliked_users.through)
+
+        if not any(through.objects.exists() for through in legacy):
+            self.stdout.write("Устаревших реакций нет")
+            return
+
+        before = Reaction.objects.count()
+
+        # Лайки переносятся первыми: если пользователь оказался в обеих таблицах
+        # (гонка в старых представлениях), остаётся лайк, дизлайк отбрасывается уникальным индексом
+        for kind, through in zip(('like', 'dislike'), legacy):
+            rows = through.objects.order_by('id').values_list('post_id', user_field)
+            for chunk in batched(rows.iterator(chunk_size=batch_size), batch_size):
+                with transaction.atomic():
+                    Reaction.objects.bulk_create(
+                        [Reaction(post_id=post_id, user_id=user_id, kind=kind) for post_id, user_id in chunk],
+                        ignore_conflicts=True
+                    )
+
+        self.stdout.write(f"Перенесено реакций: {Reaction.objects.count() - before}")
+
+        if options['clear_legacy']:
+            with transaction.atomic():
+                for through in legacy:
+                    through.objects.all().delete()
+            self.stdout.write("Устаревшие таблицы очищены")
+
+        # Счётчики считаются по Reaction: пары из обеих таблиц учитываются один раз
+        call_command('rebuild_post_counters', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS("Перенос реакций завершён"))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.images import process_pending, rebuild_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит уменьшенные варианты (WebP и JPEG, без EXIF) картинок постов и аватаров, "
+        "для которых их ещё нет: новых загрузок и уже существующих файлов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help="Сколько картинок каждого вида обрабатывать за один проход"
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Работать постоянно, проверяя новые загрузки каждые --interval секунд"
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help="Пауза между проверками в режиме --loop"
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Перестроить варианты всех картинок (после изменения ширин, форматов или качества)"
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(self.style.SUCCESS(f"Перестроено картинок: {rebuild_all()}"))
+            return
+
+        while True:
+            # Накопившиеся картинки обрабатываются порциями, пока очередь не опустеет
+            total = 0
+            while processed := process_pending(options['batch_size']):
+                total += processed
+            if total or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Обработано картинок: {total}"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает материализованные пути, глубину и количество ответов у комментариев"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Количество комментариев, обновляемых одним запросом"
+        )
+        parser.add_argument(
+            '--if-needed',
+            action='store_true',
+            help="Пересчитать, только если есть комментарии без пути (созданные до перехода на path, для деплоя)"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['if_needed'] and not Comment.objects.filter(path='').exists():
+            self.stdout.write("Пути комментариев уже заполнены")
+            return
+
+        # Родитель всегда создаётся раньше ответа, поэтому при обходе по id его путь уже известен
+        comments = Comment.objects.order_by('id').values_list('id', 'parent_id', 'path', 'depth', 'replies_count')
+
+        paths = {}
+        depths = {}
+        replies_counts = {}
+        current = {}
+
+        for comment_id, parent_id, path, depth, replies_count in comments.iterator(chunk_size=batch_size):
+            parent_path = paths.get(parent_id, '') if parent_id else ''
+            paths[comment_id] = Comment.build_path(parent_path, comment_id)
+            depths[comment_id] = depths[parent_id] + 1 if parent_id in depths else 0
+            replies_counts.setdefault(comment_id, 0)
+            if parent_id:
+                replies_counts[parent_id] = replies_counts.get(parent_id, 0) + 1
+            current[comment_id] = (path, depth, replies_count)
+
+        changed = [
+            Comment(id=comment_id, path=paths[comment_id], depth=depths[comment_id],
+                    replies_count=replies_counts[comment_id])
+            for comment_id, values in current.items()
+            if values != (paths[comment_id], depths[comment_id], replies_counts[comment_id])
+        ]
+
+        with transaction.atomic():
+            Comment.objects.bulk_update(changed, ['path', 'depth', 'replies_count'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено комментариев: {len(changed)}"))
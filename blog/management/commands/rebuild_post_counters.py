@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from blog import page_cache, tags
+from blog.models import Post, Comment, Reaction, Tag
+
+
+def count_subquery(model, **filters):
+    """Подзапрос с количеством строк model, относящихся к текущему посту"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(post_id=OuterRef('pk'), **filters)
+            .values('post_id')
+            .annotate(total=Count('*'))
+            .values('total')
+        ),
+        0
+    )
+
+
+def actual_tag_posts_count():
+    return Coalesce(
+        Subquery(
+            # Как в Tag.posts_count: только опубликованные посты, кроме новостей
+            Post.tags.through.objects.filter(tag_id=OuterRef('pk'), post__in=tags.counted_posts())
+            .values('tag_id')
+            .annotate(total=Count('*'))
+            .values('total')
+        ),
+        0
+    )
+
+
+def actual_counters():
+    return {
+        'likes_count': count_subquery(Reaction, kind='like'),
+        'dislikes_count': count_subquery(Reaction, kind='dislike'),
+        'favorites_count': count_subquery(Post.favorites.through),
+        'comments_count': count_subquery(Comment),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает разошедшиеся счётчики постов (лайки, дизлайки, избранное, комментарии) "
+        "и количество постов у тегов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Количество постов, обновляемых одним запросом"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Ищем посты, у которых хотя бы один счётчик не совпадает с реальными данными
+        drift = Q()
+        for field in Post.COUNTER_FIELDS:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+
+        drifted_ids = list(
+            Post.objects
+            .annotate(**{f'actual_{field}': value for field, value in actual_counters().items()})
+            .filter(drift)
+            .values_list('id', flat=True)
+        )
+
+        # Пересчёт выполняется в самом UPDATE, поэтому параллельные изменения не теряются
+        for start in range(0, len(drifted_ids), batch_size):
+            Post.objects.filter(id__in=drifted_ids[start:start + batch_size]).update(
+                **actual_counters(), trending_dirty=True, card_version=F('card_version') + 1
+            )
+        page_cache.touch_posts(drifted_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Исправлено постов: {len(drifted_ids)}"))
+
+        # Тегов немного - пересчитываются одним UPDATE
+        fixed_tags = Tag.objects.exclude(posts_count=actual_tag_posts_count()).update(
+            posts_count=actual_tag_posts_count()
+        )
+        self.stdout.write(self.style.SUCCESS(f"Исправлено тегов: {fixed_tags}"))
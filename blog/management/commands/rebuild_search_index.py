@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import search
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс постов (SQLite FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-empty',
+            action='store_true',
+            help="Собрать индекс, только если он пуст, а посты есть (для деплоя)"
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError("Полнотекстовый индекс поддерживается только для SQLite")
+
+        if options['if_empty'] and not (search.is_index_empty() and Post.objects.exists()):
+            self.stdout.write("Индекс уже построен")
+            return
+
+        indexed = search.rebuild_search_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано постов: {indexed}"))
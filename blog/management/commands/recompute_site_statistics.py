@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import SiteStatistics
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитывает снимок статистики сайта (запускать периодически, например из cron)"
+
+    def handle(self, *args, **options):
+        before = SiteStatistics.objects.filter(id=SiteStatistics.SNAPSHOT_ID).first()
+        after = SiteStatistics.recompute()
+
+        if before is not None:
+            for field in ('total_posts', 'total_authors', 'total_comments',
+                          'total_favorites', 'total_views', 'total_likes'):
+                drift = getattr(after, field) - getattr(before, field)
+                if drift:
+                    self.stdout.write(f"{field}: расхождение {drift:+}")
+
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересчитана: {after}"))
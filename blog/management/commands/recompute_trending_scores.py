@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import page_cache
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает рейтинг постов для ленты \"В тренде\" (по умолчанию только у изменившихся постов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Пересчитать все посты (например, после изменения весов или периода полураспада)"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Количество постов, обновляемых одним запросом"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['id', 'created_at', *getattr(settings, 'TRENDING_WEIGHTS', {})]
+
+        queryset = Post.objects.all() if options['all'] else Post.objects.filter(trending_dirty=True)
+        updated = 0
+        last_id = 0
+
+        while True:
+            batch_ids = list(
+                queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch_ids:
+                break
+            last_id = batch_ids[-1]
+
+            # Флаг снимается до чтения счётчиков: изменение, пришедшее во время пересчёта,
+            # снова пометит пост, и он будет пересчитан при следующем запуске
+            Post.objects.filter(id__in=batch_ids).update(trending_dirty=False)
+
+            posts = list(Post.objects.filter(id__in=batch_ids).only(*fields))
+            for post in posts:
+                post.trending_score = post.calculate_trending_score()
+
+            Post.objects.bulk_update(posts, ['trending_score'])
+            updated += len(posts)
+
+        if updated:
+            # Порядок ленты "В тренде" изменился
+            page_cache.touch(page_cache.LISTS)
+
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано рейтингов: {updated}"))
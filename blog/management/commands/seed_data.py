@@ -0,0 +1,282 @@
+import random
+import time
+from datetime import timedelta
+from itertools import batched
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.text import slugify
+from unidecode import unidecode
+
+from blog import search
+from blog.models import Post, News, Category, Tag, Comment, Reaction
+
+User = get_user_model()
+
+WORDS = (
+    'python django sqlite индекс запрос кэш лента пост комментарий автор тег категория '
+    'новость производительность база данных страница сервер время память поиск рейтинг '
+    'подписка избранное просмотр лайк ответ транзакция миграция шаблон модель форма'
+).split()
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными для нагрузочных замеров: пользователи, категории, теги, "
+        "посты, новости, деревья комментариев, лайки, дизлайки, избранное и просмотры"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Количество пользователей")
+        parser.add_argument('--categories', type=int, default=20, help="Количество категорий")
+        parser.add_argument('--tags', type=int, default=200, help="Количество тегов")
+        parser.add_argument('--posts', type=int, default=10000, help="Количество постов")
+        parser.add_argument('--news', type=int, default=100, help="Сколько постов сделать новостями")
+        parser.add_argument('--comments', type=int, default=30000, help="Количество комментариев")
+        parser.add_argument(
+            '--comment-depth',
+            type=int,
+            default=5,
+            help="Глубина веток комментариев (каждая ветка - цепочка ответов этой длины)"
+        )
+        parser.add_argument('--reactions', type=int, default=100000, help="Количество лайков и дизлайков")
+        parser.add_argument('--favorites', type=int, default=20000, help="Количество добавлений в избранное")
+        parser.add_argument('--views', type=int, default=100000, help="Количество пар \"пост - просмотревший\"")
+        parser.add_argument('--days', type=int, default=365, help="За сколько дней распределены даты постов")
+        parser.add_argument('--prefix', default='seed', help="Префикс имён пользователей и заголовков")
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора случайных чисел")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help="Количество строк, вставляемых одним запросом"
+        )
+        parser.add_argument(
+            '--skip-search-index',
+            action='store_true',
+            help="Не пересобирать полнотекстовый индекс (его можно пересобрать позже командой rebuild_search_index)"
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Данные с префиксом \"{prefix}\" уже есть в базе, укажите другой --prefix")
+        if options['news'] > options['posts']:
+            raise CommandError("Новостей не может быть больше, чем постов")
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = prefix
+        self.now = timezone.now()
+
+        started = time.monotonic()
+
+        user_ids = self.create_users(options['users'])
+        category_ids = self.create_named(Category, 'Категория', options['categories'])
+        tag_ids = self.create_named(Tag, 'Тег', options['tags'])
+        post_ids = self.create_posts(options['posts'], options['days'], user_ids, category_ids, tag_ids)
+        self.create_news(post_ids[:options['news']])
+        self.create_comments(options['comments'], options['comment_depth'], post_ids, user_ids)
+        self.create_reactions(options['reactions'], post_ids, user_ids)
+        self.create_pairs(Post.favorites.through, 'избранное', options['favorites'], post_ids, user_ids)
+        self.create_pairs(Post.viewed_users.through, 'просмотры', options['views'], post_ids, user_ids)
+        self.update_views(post_ids)
+        self.reset_sequences()
+
+        # bulk_create не вызывает save() и сигналы: счётчики, рейтинги, статистика
+        # и поисковый индекс пересчитываются штатными командами
+        call_command('rebuild_post_counters', stdout=self.stdout)
+        call_command('recompute_trending_scores', all=True, stdout=self.stdout)
+        call_command('recompute_site_statistics', stdout=self.stdout)
+        if search.is_enabled() and not options['skip_search_index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.monotonic() - started:.1f} с"))
+
+    def report(self, label, count):
+        self.stdout.write(f"{label}: {count}")
+
+    def bulk_create(self, model, objects, **kwargs):
+        """Вставляет объекты порциями по batch_size, каждая порция - отдельная транзакция"""
+        for chunk in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, **kwargs)
+
+    def words(self, count):
+        return ' '.join(self.random.choices(WORDS, k=count))
+
+    def create_users(self, count):
+        start = next_id(User)
+        # Хэш пароля считается один раз: PBKDF2 для каждого пользователя занял бы часы
+        password = make_password('password')
+        self.bulk_create(User, (
+            User(
+                id=start + i,
+                username=f'{self.prefix}_{start + i}',
+                email=f'{self.prefix}_{start + i}@example.com',
+                password=password,
+                subscribed_to_important_news=self.random.random() < 0.1,
+            )
+            for i in range(count)
+        ))
+        self.report("Пользователи", count)
+        return list(range(start, start + count))
+
+    def create_named(self, model, label, count):
+        start = next_id(model)
+        self.bulk_create(model, (
+            model(id=start + i, name=f'{label} {self.prefix} {start + i}', slug=slugify(f'{self.prefix}-{start + i}'))
+            for i in range(count)
+        ))
+        self.report(model._meta.verbose_name_plural, count)
+        return list(range(start, start + count))
+
+    def create_posts(self, count, days, user_ids, category_ids, tag_ids):
+        if count and not user_ids:
+            raise CommandError("Для постов нужны пользователи")
+
+        start = next_id(Post)
+        period = timedelta(days=days).total_seconds()
+        through = Post.tags.through
+
+        for chunk in batched(range(start, start + count), self.batch_size):
+            posts = []
+            post_tags = []
+            for post_id in chunk:
+                title = f'{self.prefix} {post_id} {self.words(4)}'
+                posts.append(Post(
+                    id=post_id,
+                    title=title,
+                    slug=slugify(unidecode(title))[:200],
+                    text=self.words(self.random.randint(30, 150)),
+                    author_id=self.random.choice(user_ids),
+                    category_id=self.random.choice(category_ids) if category_ids else None,
+                    status='published' if self.random.random() < 0.95 else 'draft',
+                ))
+                for tag_id in self.random.sample(tag_ids, min(len(tag_ids), self.random.randint(0, 3))):
+                    post_tags.append(through(post_id=post_id, tag_id=tag_id))
+
+            with transaction.atomic():
+                Post.objects.bulk_create(posts)
+                through.objects.bulk_create(post_tags)
+
+                # created_at заполняется auto_now_add при вставке - даты раскидываются отдельным UPDATE
+                for post in posts:
+                    post.created_at = self.now - timedelta(seconds=self.random.uniform(0, period))
+                    post.updated_at = post.created_at
+                Post.objects.bulk_update(posts, ['created_at', 'updated_at'])
+
+        self.report("Посты", count)
+        return list(range(start, start + count))
+
+    def create_news(self, post_ids):
+        news_types = [value for value, label in News._meta.get_field('news_type').choices]
+        Post.objects.filter(id__in=post_ids).update(status='published')
+        self.bulk_create(News, (
+            News(
+                post_item_id=post_id,
+                is_important=self.random.random() < 0.2,
+                news_type=self.random.choice(news_types),
+                pinned=False,
+                # Рассылка по синтетическим новостям не нужна
+                email_notifications_sent=True,
+            )
+            for post_id in post_ids
+        ))
+        self.report("Новости", len(post_ids))
+
+    def create_comments(self, count, depth, post_ids, user_ids):
+        """
+        Ветки комментариев - цепочки из depth ответов. id назначаются заранее,
+        поэтому путь, глубина и количество ответов заполняются сразу, без rebuild_comment_tree.
+        """
+        depth = max(depth, 1)
+        next_comment_id = next_id(Comment)
+        created = 0
+
+        while created < count:
+            comments = []
+            for _ in range(min(self.batch_size, count - created) // depth or 1):
+                post_id = self.random.choice(post_ids)
+                length = min(depth, count - created)
+                parent_id, path = None, ''
+                for level in range(length):
+                    comment_id = next_comment_id
+                    next_comment_id += 1
+                    path = Comment.build_path(path, comment_id)
+                    comments.append(Comment(
+                        id=comment_id,
+                        post_id=post_id,
+                        author_id=self.random.choice(user_ids),
+                        parent_id=parent_id,
+                        text=self.words(self.random.randint(5, 40)),
+                        path=path,
+                        depth=level,
+                        replies_count=1 if level < length - 1 else 0,
+                    ))
+                    parent_id = comment_id
+                created += length
+
+            with transaction.atomic():
+                Comment.objects.bulk_create(comments)
+
+        self.report("Комментарии", created)
+
+    def random_pairs(self, count, post_ids, user_ids):
+        for _ in range(count):
+            yield self.random.choice(post_ids), self.random.choice(user_ids)
+
+    def create_reactions(self, count, post_ids, user_ids):
+        """Лайки и дизлайки (примерно 4 к 1). Повторная пара "пост - пользователь" отбрасывается уникальным индексом"""
+        self.bulk_create(
+            Reaction,
+            (
+                Reaction(post_id=post_id, user_id=user_id, kind='like' if self.random.random() < 0.8 else 'dislike')
+                for post_id, user_id in self.random_pairs(count, post_ids, user_ids)
+            ),
+            ignore_conflicts=True
+        )
+        self.report("Лайки и дизлайки (с повторами)", count)
+
+    def create_pairs(self, through, label, count, post_ids, user_ids):
+        user_field = f'{User._meta.model_name}_id'
+        self.bulk_create(
+            through,
+            (
+                through(post_id=post_id, **{user_field: user_id})
+                for post_id, user_id in self.random_pairs(count, post_ids, user_ids)
+            ),
+            ignore_conflicts=True
+        )
+        self.report(f"{label.capitalize()} (с повторами)", count)
+
+    def reset_sequences(self):
+        """id назначались вручную - в PostgreSQL последовательности нужно сдвинуть (в SQLite запрос пустой)"""
+        statements = connection.ops.sequence_reset_sql(no_style(), [User, Category, Tag, Post, News, Comment, Reaction])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def update_views(self, post_ids):
+        """Счётчик просмотров - число просмотревших пользователей плюс анонимные просмотры"""
+        if not post_ids:
+            return
+        viewers = Post.viewed_users.through.objects.filter(post_id=OuterRef('pk'))
+        viewers_count = Coalesce(
+            Subquery(viewers.values('post_id').annotate(total=Count('*')).values('total')),
+            0
+        )
+        for chunk in batched(post_ids, self.batch_size):
+            with transaction.atomic():
+                Post.objects.filter(id__in=chunk).update(views=viewers_count * 3)
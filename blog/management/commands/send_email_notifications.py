@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.notifications import batch_size, process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Отправляет поставленные в очередь email-уведомления о важных новостях"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help="Количество писем, отправляемых через одно SMTP-соединение"
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Работать постоянно, проверяя очередь каждые --interval секунд"
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=30,
+            help="Пауза между проверками очереди в режиме --loop"
+        )
+
+    def handle(self, *args, **options):
+        size = options['batch_size'] or batch_size()
+
+        while True:
+            jobs, sent = process_pending_jobs(size)
+            if jobs or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Обработано рассылок: {jobs}, отправлено писем: {sent}"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
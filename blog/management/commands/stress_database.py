@@ -0,0 +1,160 @@
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from blog.models import Post, Comment
+from blog.reactions import toggle_reaction
+from blog.sqlite_copy import temporary_copy, use_database
+from blog.view_buffer import write_views
+
+User = get_user_model()
+
+# Сколько постов и пользователей берётся для нагрузки
+SAMPLE_SIZE = 1000
+
+
+def rollback_mode():
+    """Настройки SQLite по умолчанию: журнал отката и BEGIN DEFERRED"""
+    return {'OPTIONS': {'init_command': 'PRAGMA journal_mode=DELETE'}, 'CONN_MAX_AGE': 0}
+
+
+def concurrent_mode():
+    return {'OPTIONS': settings.SQLITE_CONCURRENT_OPTIONS, 'CONN_MAX_AGE': settings.SQLITE_CONN_MAX_AGE}
+
+
+MODES = {
+    'rollback': rollback_mode,
+    'wal': concurrent_mode,
+}
+
+
+class WorkerStats:
+    def __init__(self):
+        self.latencies = []
+        self.locked = 0
+
+
+def write_view(rnd, posts, users):
+    post, user = rnd.choice(posts), rnd.choice(users)
+    write_views({post.id: 1}, {(post.id, user.id)})
+
+
+def write_reaction(rnd, posts, users):
+    toggle_reaction(rnd.choice(posts), rnd.choice(users), rnd.choice(('like', 'dislike')))
+
+
+def write_comment(rnd, posts, users):
+    with transaction.atomic():
+        Comment.objects.create(post=rnd.choice(posts), author=rnd.choice(users), text='Нагрузочный комментарий')
+
+
+def read_feed(rnd, posts, users):
+    list(Post.objects.filter(status='published').order_by('-created_at').values_list('id', 'title')[:10])
+
+
+# Запись просмотров, лайки и комментарии - те же функции, что вызывают view и буфер просмотров
+WRITE_OPERATIONS = (write_view, write_reaction, write_comment)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест SQLite: параллельные писатели (просмотры, лайки, комментарии) и читатели ленты "
+        "на временной копии базы. Выводит пропускную способность, задержки и число ошибок "
+        "\"database is locked\" для журнала отката и для режима WAL (SQLITE_CONCURRENT_OPTIONS)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            default='1,4,16',
+            help="Количество потоков записи через запятую: для каждого значения - отдельный прогон"
+        )
+        parser.add_argument('--readers', type=int, default=4, help="Количество потоков чтения ленты")
+        parser.add_argument('--duration', type=float, default=5.0, help="Длительность одного прогона в секундах")
+        parser.add_argument(
+            '--mode',
+            choices=[*MODES, 'both'],
+            default='both',
+            help="Режим базы: rollback - настройки SQLite по умолчанию, wal - режим из настроек проекта"
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора случайных чисел")
+
+    def handle(self, *args, **options):
+        try:
+            writers = [int(value) for value in options['writers'].split(',')]
+        except ValueError:
+            raise CommandError("--writers - числа через запятую, например 1,4,16")
+
+        modes = list(MODES) if options['mode'] == 'both' else [options['mode']]
+
+        # Все записи идут в копию: рабочая база не меняется
+        with temporary_copy() as copy:
+            for mode in modes:
+                for count in writers:
+                    with use_database(copy, **MODES[mode]()):
+                        result = self.run(count, options['readers'], options['duration'], options['seed'])
+                    self.stdout.write(
+                        f"{mode:>8} | писателей {count:>3} | записей/с {result['writes_per_second']:>8.1f} | "
+                        f"чтений/с {result['reads_per_second']:>8.1f} | "
+                        f"p95 записи {result['write_p95_ms']:>8.1f} мс | ошибок locked {result['locked']}"
+                    )
+
+    def run(self, writers, readers, duration, seed):
+        posts = list(Post.objects.only('id')[:SAMPLE_SIZE])
+        users = list(User.objects.only('id')[:SAMPLE_SIZE])
+        if not posts or not users:
+            raise CommandError("В базе нет постов или пользователей - сначала выполните seed_data")
+        connections.close_all()
+
+        stop = threading.Event()
+        write_stats = [WorkerStats() for _ in range(writers)]
+        read_stats = [WorkerStats() for _ in range(readers)]
+        threads = [
+            threading.Thread(target=self.work, args=(WRITE_OPERATIONS, stats, stop, posts, users, seed + i))
+            for i, stats in enumerate(write_stats)
+        ] + [
+            threading.Thread(target=self.work, args=((read_feed,), stats, stop, posts, users, seed - i - 1))
+            for i, stats in enumerate(read_stats)
+        ]
+
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        write_latencies = [latency for stats in write_stats for latency in stats.latencies]
+        return {
+            'writes_per_second': len(write_latencies) / duration,
+            'reads_per_second': sum(len(stats.latencies) for stats in read_stats) / duration,
+            'write_p95_ms': (
+                statistics.quantiles(write_latencies, n=100, method='inclusive')[94] * 1000
+                if len(write_latencies) > 1 else 0
+            ),
+            'locked': sum(stats.locked for stats in write_stats + read_stats),
+        }
+
+    def work(self, operations, stats, stop, posts, users, seed):
+        rnd = random.Random(seed)
+        try:
+            while not stop.is_set():
+                operation = rnd.choice(operations)
+                started = time.perf_counter()
+                try:
+                    operation(rnd, posts, users)
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    stats.locked += 1
+                else:
+                    stats.latencies.append(time.perf_counter() - started)
+        finally:
+            # У каждого потока своё подключение
+            connection.close()
@@ -1,5 +1,12 @@
-from django.db import models
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.text import slugify
 from unidecode import unidecode
 from django.urls import reverse
@@ -24,23 +31,27 @@ class Post(models.Model):
     tags = models.ManyToManyField("Tag", related_name='posts', blank=True, verbose_name='Теги')
     text = models.TextField(verbose_name="Текст")
     image = models.ImageField(upload_to="post_images/", null=True, blank=True)
+    # Уменьшенные копии картинки и её размеры (blog/images.py), строятся командой process_images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты картинки")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата последнего изменения")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts') # можно указать SET_NULL
     status = models.CharField(choices=STATUS_CHOICES, default='draft', verbose_name="Статус")
     views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
     viewed_users = models.ManyToManyField(User, blank=True, related_name='viewed_posts', verbose_name="Просмотрено пользователями")
+    # Устаревшие таблицы лайков и дизлайков: реакции хранятся в Reaction. Больше не пишутся,
+    # остаются только как источник для команды migrate_reactions и будут удалены после переноса
     liked_users = models.ManyToManyField(
         User,
-        related_name="liked_posts",
+        related_name="legacy_liked_posts",
         blank=True,
-        verbose_name="Лайки"
+        verbose_name="Лайки (устаревшее)"
     )
     disliked_users = models.ManyToManyField(
         User,
-        related_name="disliked_posts",
+        related_name="legacy_disliked_posts",
         blank=True,
-        verbose_name="Дизлайки"
+        verbose_name="Дизлайки (устаревшее)"
     )
     favorites = models.ManyToManyField(
         User,
@@ -49,19 +60,95 @@ class Post(models.Model):
         verbose_name="В избранном у"
     )
 
+    # Денормализованные счётчики, обновляются сигналами в той же транзакции, что и изменение M2M/комментариев
+    likes_count = models.PositiveIntegerField(default=0, verbose_name="Количество лайков")
+    dislikes_count = models.PositiveIntegerField(default=0, verbose_name="Количество дизлайков")
+    favorites_count = models.PositiveIntegerField(default=0, verbose_name="Количество добавлений в избранное")
+    comments_count = models.PositiveIntegerField(default=0, verbose_name="Количество комментариев")
+
+    # Рейтинг для ленты "В тренде": ln(1 + вес активности) + λ * время создания.
+    # Это логарифм активности, затухающей как exp(-λ * возраст): порядок постов тот же,
+    # но значение не нужно пересчитывать с течением времени - только при изменении счётчиков.
+    # Пересчитывается командой recompute_trending_scores для постов с trending_dirty
+    trending_score = models.FloatField(default=0, verbose_name="Рейтинг в тренде")
+    trending_dirty = models.BooleanField(default=True, verbose_name="Рейтинг требует пересчёта")
+
+    # Версия кэшированной карточки поста (blog/feeds.py): увеличивается при сохранении поста,
+    # изменении счётчиков, тегов, категории
+    card_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Версия карточки")
+
+    COUNTER_FIELDS = ('likes_count', 'dislikes_count', 'favorites_count', 'comments_count')
+    # Просмотры копятся в буфере (blog/view_buffer.py) и записываются пачкой
+    BUFFERED_FIELDS = ('views',)
+    TRENDING_FIELDS = ('trending_score', 'trending_dirty')
+    # Описание вариантов картинки пишет process_images (blog/images.py), при замене картинки - сигналы
+    IMAGE_VARIANT_FIELDS = ('image_variants',)
+    TRENDING_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.get_fixed_timezone(0))
+
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = "Посты"
         db_table = "blog_posts"
+        indexes = [
+            # Лента "В тренде" (-trending_score, -id) читается обратным проходом по индексу,
+            # id в конце индекса служит тай-брейкером
+            models.Index(fields=['status', 'trending_score'], name='post_status_trending_idx'),
+            # Рейтинг ленты "Популярное" (-favorites_count, -created_at, -id): счётчик обновляется
+            # сигналами при добавлении в избранное, а страница по курсору - диапазон этого индекса
+            models.Index(fields=['status', 'favorites_count', 'created_at'], name='post_status_popular_idx'),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(trending_dirty=True),
+                name='post_trending_dirty_idx'
+            ),
+            # Лента "Все" и поиск без FTS: опубликованные посты от новых к старым
+            models.Index(fields=['status', 'created_at'], name='post_status_created_idx'),
+            # Посты категории (страница категории)
+            models.Index(fields=['category', 'status', 'created_at'], name='post_category_created_idx'),
+            # Посты автора: профиль, последние посты при подписке, посты "крупных" авторов в ленте подписок
+            models.Index(fields=['author', 'created_at'], name='post_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def calculate_trending_score(self):
+        """Рейтинг в тренде по текущим значениям счётчиков (веса и период полураспада - в настройках)"""
+        weights = getattr(settings, 'TRENDING_WEIGHTS', {})
+        half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+        activity = sum(getattr(self, field) * weight for field, weight in weights.items())
+        created_at = self.created_at or timezone.now()
+        created = (created_at - self.TRENDING_EPOCH).total_seconds()
+        return math.log1p(max(activity, 0)) + math.log(2) * created / half_life
     
     def save(self, *args, **kwargs):
         self.slug = slugify(unidecode(self.title))
 
+        # Счётчики меняются только через F()-выражения, а варианты картинки - командой process_images,
+        # поэтому при обычном сохранении существующего поста не перезаписываем их значениями из памяти
+        # (они могли устареть)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in (
+                    self.COUNTER_FIELDS + self.BUFFERED_FIELDS + self.TRENDING_FIELDS + self.IMAGE_VARIANT_FIELDS
+                )
+            ]
+
+        if self._state.adding:
+            self.trending_score = self.calculate_trending_score()
+        else:
+            # Закэшированная карточка поста устаревает
+            self.card_version = F('card_version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'card_version'}
+
         super().save(*args, **kwargs)
 
+        if not isinstance(self.card_version, int):
+            self.refresh_from_db(fields=['card_version'])
+
         # Проверяем, опубликован ли пост, есть ли у этого поста связанная новость и закреплена ли она
         if self.status == "published" and hasattr(self, 'news_item') and self.news_item.pinned:
             # Снимаем закрепление с других новостей
@@ -127,12 +214,30 @@ class Category(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название')
     slug = models.SlugField(unique=True, editable=False, verbose_name='Слаг')
+    # Количество опубликованных постов с тегом (без новостей, blog/tags.py), поддерживается сигналами
+    # m2m_changed, сменой статуса и удалением постов - облако тегов строится без агрегации
+    posts_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество постов')
+
+    COUNTER_FIELDS = ('posts_count',)
 
     def save(self, *args, **kwargs):
         self.slug = slugify(unidecode(self.name))
 
+        # Счётчик меняется только через F()-выражения (blog/tags.py), поэтому при обычном сохранении
+        # существующего тега (например, переименовании) не перезаписываем его значением из памяти
+        updating = not self._state.adding
+        if updating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+
         super().save(*args, **kwargs)
 
+        # Вес в индексе подсказок берётся из posts_count после фиксации транзакции
+        if updating:
+            self.refresh_from_db(fields=list(self.COUNTER_FIELDS))
+
     def __str__(self):
         return f'#{self.name}'
     
@@ -151,6 +256,35 @@ class Comment(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name="replies")
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Материализованный путь: id всех предков и самого комментария по PATH_SEGMENT_LENGTH цифр.
+    # Сортировка по path даёт обход дерева в глубину, а поддерево - это диапазон path
+    path = models.CharField(max_length=1000, db_index=True, editable=False, default='', verbose_name="Путь в дереве")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Глубина")
+    replies_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество ответов")
+
+    PATH_SEGMENT_LENGTH = 10
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        self.depth = self.parent.depth + 1 if self.parent_id else 0
+
+        # Путь содержит собственный id, поэтому дописываем его сразу после вставки в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = self.build_path(self.parent.path if self.parent_id else '', self.id)
+            Comment.objects.filter(id=self.id).update(path=self.path)
+
+    @classmethod
+    def build_path(cls, parent_path, comment_id):
+        return f'{parent_path}{comment_id:0{cls.PATH_SEGMENT_LENGTH}d}'
+
+    @classmethod
+    def subtree_filter(cls, path):
+        """Условие на поддерево (включая сам комментарий): диапазон [path, path + ':'), ':' идёт после цифр"""
+        return models.Q(path__gte=path, path__lt=path + ':')
 
     def __str__(self):
         if self.parent:
@@ -164,3 +298,243 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = "Комментарии"
         db_table = "blog_comments"
+        indexes = [
+            # Корневые комментарии поста от новых к старым: частичный индекс только по корням
+            models.Index(
+                fields=['post', 'created_at'],
+                condition=models.Q(parent__isnull=True),
+                name='comment_post_roots_idx'
+            ),
+            # Поддеревья порции комментариев поста в порядке path (blog/comment_tree.py)
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
+
+
+class Reaction(models.Model):
+    """
+    Лайк или дизлайк пользователя. Уникальность (post, user) не даёт одному пользователю
+    одновременно лайкнуть и дизлайкнуть пост; переключение - в blog/reactions.py.
+    """
+    KIND_CHOICES = [
+        ('like', 'Лайк'),
+        ('dislike', 'Дизлайк'),
+    ]
+    # Вид реакции -> поле счётчика в Post
+    COUNTER_FIELDS = {
+        'like': 'likes_count',
+        'dislike': 'dislikes_count',
+    }
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reactions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reactions')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Реакция")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Реакция'
+        verbose_name_plural = "Реакции"
+        db_table = "blog_reactions"
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_reaction'),
+        ]
+        indexes = [
+            # Реакции пользователя (например, его лайки)
+            models.Index(fields=['user', 'kind', 'post'], name='reaction_user_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> {self.post}: {self.get_kind_display()}"
+
+
+class SiteStatistics(models.Model):
+    """
+    Снимок общей статистики сайта для страницы со списком постов.
+    Поддерживается дельтами из сигналов (blog/signals.py) и периодически
+    пересчитывается целиком командой recompute_site_statistics.
+    Учитываются только опубликованные посты, не являющиеся новостями.
+    """
+    total_posts = models.PositiveIntegerField(default=0, verbose_name="Постов")
+    total_authors = models.PositiveIntegerField(default=0, verbose_name="Авторов")
+    total_comments = models.PositiveIntegerField(default=0, verbose_name="Комментариев")
+    total_favorites = models.PositiveIntegerField(default=0, verbose_name="Добавлений в избранное")
+    total_views = models.PositiveBigIntegerField(default=0, verbose_name="Просмотров")
+    total_likes = models.PositiveIntegerField(default=0, verbose_name="Лайков")
+    recomputed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата полного пересчёта")
+
+    SNAPSHOT_ID = 1
+
+    class Meta:
+        verbose_name = 'Статистика сайта'
+        verbose_name_plural = "Статистика сайта"
+        db_table = "blog_site_statistics"
+
+    def __str__(self):
+        return f"Статистика: {self.total_posts} постов, {self.total_authors} авторов"
+
+    @staticmethod
+    def counted_posts():
+        """Посты, которые входят в статистику"""
+        return Post.objects.filter(status="published", news_item__isnull=True)
+
+    @classmethod
+    def load(cls):
+        """Возвращает снимок, при первом обращении рассчитывая его"""
+        snapshot = cls.objects.filter(id=cls.SNAPSHOT_ID).first()
+        if snapshot is None:
+            snapshot = cls.recompute()
+        return snapshot
+
+    @classmethod
+    def recompute(cls):
+        """Полный пересчёт статистики одним агрегирующим запросом"""
+        totals = cls.counted_posts().aggregate(
+            total_posts=Count('id'),
+            total_authors=Count('author', distinct=True),
+            total_comments=Coalesce(Sum('comments_count'), 0),
+            total_favorites=Coalesce(Sum('favorites_count'), 0),
+            total_views=Coalesce(Sum('views'), 0),
+            total_likes=Coalesce(Sum('likes_count'), 0),
+        )
+        snapshot, _ = cls.objects.update_or_create(
+            id=cls.SNAPSHOT_ID,
+            defaults={**totals, 'recomputed_at': timezone.now()}
+        )
+        return snapshot
+
+    @classmethod
+    def apply_delta(cls, **deltas):
+        """Атомарно прибавляет дельты к полям снимка"""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        cls.objects.filter(id=cls.SNAPSHOT_ID).update(**{
+            field: Greatest(F(field) + delta, Value(0))
+            for field, delta in deltas.items()
+        })
+
+    @classmethod
+    def apply_posts_delta(cls, post_ids, field, delta_per_post):
+        """
+        Прибавляет delta_per_post к полю за каждый учитываемый пост из post_ids.
+        Проверка поста выполняется подзапросом внутри того же UPDATE.
+        """
+        if not post_ids or not delta_per_post:
+            return
+
+        counted = Coalesce(
+            Subquery(
+                cls.counted_posts()
+                .filter(id__in=post_ids)
+                .order_by()
+                .values('status')
+                .annotate(total=Count('id'))
+                .values('total')[:1]
+            ),
+            0
+        )
+        cls.objects.filter(id=cls.SNAPSHOT_ID).update(**{
+            field: Greatest(F(field) + counted * delta_per_post, Value(0))
+        })
+
+
+class EmailNotificationJob(models.Model):
+    """Задание (outbox) на рассылку уведомления о важной новости, выполняется командой send_email_notifications"""
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        # Выполнено, но часть писем не доставлена за EMAIL_NOTIFICATIONS_MAX_ATTEMPTS попыток
+        ('failed', 'Выполнено с ошибками'),
+    )
+
+    news = models.OneToOneField(News, on_delete=models.CASCADE, related_name='email_job', verbose_name="Новость")
+    status = models.CharField(choices=STATUS_CHOICES, default='pending', db_index=True, verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Запусков")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало последнего запуска")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+
+    class Meta:
+        verbose_name = 'Рассылка уведомлений'
+        verbose_name_plural = "Рассылки уведомлений"
+        db_table = "blog_email_notification_jobs"
+
+    def __str__(self):
+        return f"Рассылка: {self.news}"
+
+
+class EmailDelivery(models.Model):
+    """Состояние доставки письма рассылки одному получателю"""
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    job = models.ForeignKey(EmailNotificationJob, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='email_deliveries')
+    email = models.EmailField()
+    status = models.CharField(choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = 'Доставка письма'
+        verbose_name_plural = "Доставки писем"
+        db_table = "blog_email_deliveries"
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'user'], name='unique_email_delivery_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.email}: {self.get_status_display()}"
+
+
+class ViewCounterFlush(models.Model):
+    """Запись о сбросе буфера просмотров в базу (для мониторинга задержки)"""
+    flushed_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Время сброса")
+    process = models.CharField(max_length=100, verbose_name="Процесс")
+    posts = models.PositiveIntegerField(verbose_name="Постов")
+    views = models.PositiveIntegerField(verbose_name="Просмотров")
+    viewers = models.PositiveIntegerField(verbose_name="Пар пост-пользователь")
+    lag = models.FloatField(verbose_name="Задержка, с")
+    duration = models.FloatField(verbose_name="Длительность, мс")
+
+    class Meta:
+        verbose_name = 'Сброс счётчика просмотров'
+        verbose_name_plural = "Сбросы счётчика просмотров"
+        db_table = "blog_view_counter_flushes"
+        ordering = ['-flushed_at']
+
+    def __str__(self):
+        return f"{self.flushed_at:%d.%m.%Y %H:%M:%S} ({self.process})"
+
+
+class TimelineEntry(models.Model):
+    """
+    Пост в ленте подписок пользователя (fan-out при публикации, blog/timeline.py).
+    Дата создания поста скопирована, чтобы лента читалась одним проходом по индексу.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = "Записи ленты подписок"
+        db_table = "blog_timeline_entries"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'post'], name='timeline_user_created_idx'),
+            # Удаление постов автора из ленты при отписке
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.post}"
@@ -0,0 +1,177 @@
+"""
+Рассылка уведомлений о важных новостях через outbox.
+
+Сигнал публикации поста только ставит задание (EmailNotificationJob) в той же транзакции,
+письма отправляет команда send_email_notifications. Подписчики читаются порциями через iterator(),
+на каждую порцию открывается одно SMTP-соединение. Состояние доставки хранится по каждому
+получателю (EmailDelivery), поэтому повторный запуск отправляет только недоставленные письма.
+"""
+from datetime import timedelta
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import News, EmailNotificationJob, EmailDelivery
+
+User = get_user_model()
+
+
+def batch_size():
+    """Сколько писем отправляется через одно SMTP-соединение"""
+    return getattr(settings, 'EMAIL_NOTIFICATIONS_BATCH_SIZE', 100)
+
+
+def max_attempts():
+    """Сколько раз пытаемся доставить письмо одному получателю"""
+    return getattr(settings, 'EMAIL_NOTIFICATIONS_MAX_ATTEMPTS', 5)
+
+
+def stale_timeout():
+    """Через сколько секунд задание в статусе running считается брошенным упавшим воркером"""
+    return getattr(settings, 'EMAIL_NOTIFICATIONS_STALE_TIMEOUT', 3600)
+
+
+def enqueue_important_news(news):
+    """Ставит рассылку по новости в очередь (повторный вызов не создаёт второе задание)"""
+    return EmailNotificationJob.objects.get_or_create(news=news)[0]
+
+
+def build_message(news):
+    """Тема и HTML письма - одинаковые для всех получателей, поэтому рендерятся один раз"""
+    subject = f"🔔 Важная новость: {news.post_item.title}"
+    html_message = render_to_string('blog/emails/important_news_notification.html', {
+        'news': news,
+        'site_url': settings.SITE_URL
+    })
+    return subject, html_message
+
+
+def subscribers():
+    return (
+        User.objects.filter(subscribed_to_important_news=True, email__isnull=False)
+        .exclude(email='')
+        .order_by('id')
+        .values_list('id', 'email')
+    )
+
+
+def claim_jobs():
+    """Задания, которые можно взять в работу: ожидающие и зависшие после падения воркера"""
+    stale_before = timezone.now() - timedelta(seconds=stale_timeout())
+    return EmailNotificationJob.objects.filter(
+        Q(status='pending') | Q(status='running', started_at__lt=stale_before)
+    ).order_by('created_at', 'id')
+
+
+def send_batch(deliveries, subject, html_message):
+    """Отправляет порцию писем через одно соединение и сохраняет результат по каждому получателю"""
+    now = timezone.now()
+    connection = get_connection()
+
+    try:
+        connection.open()
+    except Exception as error:
+        # Соединение не открылось - вся порция считается неудачной попыткой
+        for delivery in deliveries:
+            delivery.attempts += 1
+            delivery.status = 'failed'
+            delivery.last_error = str(error)
+    else:
+        try:
+            for delivery in deliveries:
+                message = EmailMultiAlternatives(
+                    subject=subject,
+                    body="",
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[delivery.email],
+                )
+                message.attach_alternative(html_message, 'text/html')
+
+                delivery.attempts += 1
+                try:
+                    # Соединение уже открыто, send_messages его не закрывает
+                    connection.send_messages([message])
+                except Exception as error:
+                    delivery.status = 'failed'
+                    delivery.last_error = str(error)
+                else:
+                    delivery.status = 'sent'
+                    delivery.last_error = ''
+                    delivery.sent_at = now
+        finally:
+            connection.close()
+
+    EmailDelivery.objects.bulk_update(deliveries, ['status', 'attempts', 'last_error', 'sent_at'])
+
+    return sum(delivery.status == 'sent' for delivery in deliveries)
+
+
+def process_job(job, size=None):
+    """
+    Выполняет рассылку по заданию. Возвращает количество отправленных писем.
+    email_notifications_sent у новости выставляется, только когда не осталось писем для повтора.
+    """
+    size = size or batch_size()
+    news = News.objects.select_related('post_item').get(id=job.news_id)
+
+    # Новость сняли с публикации или с отметки "важная" - задание отменяется,
+    # при повторной публикации сигнал поставит его заново
+    if not news.is_important or news.post_item.status != 'published':
+        job.delete()
+        return 0
+
+    # Захватываем задание условным UPDATE, чтобы два воркера не отправили одни и те же письма
+    claimed = claim_jobs().filter(id=job.id).update(
+        status='running', started_at=timezone.now(), attempts=job.attempts + 1
+    )
+    if not claimed:
+        return 0
+
+    subject, html_message = build_message(news)
+    limit = max_attempts()
+    sent = 0
+
+    for chunk in batched(subscribers().iterator(chunk_size=size), size):
+        EmailDelivery.objects.bulk_create(
+            [EmailDelivery(job=job, user_id=user_id, email=email) for user_id, email in chunk],
+            ignore_conflicts=True
+        )
+        deliveries = list(
+            job.deliveries.filter(user_id__in=[user_id for user_id, email in chunk], attempts__lt=limit)
+            .exclude(status='sent')
+        )
+        if deliveries:
+            sent += send_batch(deliveries, subject, html_message)
+
+    retry = job.deliveries.exclude(status='sent').filter(attempts__lt=limit).count()
+
+    if retry:
+        EmailNotificationJob.objects.filter(id=job.id).update(
+            status='pending', last_error=f"Не доставлено писем: {retry}"
+        )
+    else:
+        # Письма, исчерпавшие попытки, больше не отправляются - задание завершается, но с отметкой о них
+        failed = job.deliveries.filter(status='failed').count()
+        EmailNotificationJob.objects.filter(id=job.id).update(
+            status='failed' if failed else 'done',
+            last_error=f"Не доставлено писем после {limit} попыток: {failed}" if failed else '',
+            finished_at=timezone.now()
+        )
+        News.objects.filter(id=news.id).update(email_notifications_sent=True)
+
+    return sent
+
+
+def process_pending_jobs(size=None):
+    """Обрабатывает все задания очереди, возвращает (заданий, писем)"""
+    jobs = 0
+    sent = 0
+    for job in claim_jobs():
+        sent += process_job(job, size)
+        jobs += 1
+    return jobs, sent
@@ -0,0 +1,175 @@
+"""
+Кэш страниц целиком для анонимных посетителей и условные GET (ETag / Last-Modified).
+
+Главная, лента, категории, теги и страница поста (AnonymousPageCacheMixin) для анонимного посетителя
+берутся из кэша по ключу: полный URL (с filter и номером страницы), тема оформления и версии данных.
+Версия - время последнего изменения (timestamp) в кэше:
+- site - категории и теги (их названия выводятся на всех страницах);
+- lists - любой пост (списки постов, главная);
+- post:<id> - конкретный пост, его комментарии и реакции (страница поста).
+Изменения не удаляют страницы, а сдвигают версии (touch_*, после фиксации транзакции) - старые ключи
+больше не запрашиваются и вытесняются по PAGE_CACHE_TIMEOUT. Из тех же версий строятся ETag и
+Last-Modified, поэтому повторная проверка страницы браузером (304) не требует ни рендера, ни кэша страниц.
+
+Версии хранятся в CACHES['shared'], общем для всех процессов: изменение, сделанное в одном процессе,
+сбрасывает страницы и ETag во всех. Сами страницы - в кэше по умолчанию (у каждого процесса свои копии,
+но ключи содержат версии, поэтому устаревшую страницу не отдаст ни один процесс).
+
+Число просмотров на закэшированной странице поста может отставать на PAGE_CACHE_TIMEOUT секунд:
+счётчик меняется буфером просмотров без сдвига версий.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+SITE = 'site'
+LISTS = 'lists'
+
+
+def version_cache():
+    return caches['shared']
+
+
+def version_key(name):
+    return f'page_cache:version:{name}'
+
+
+def post_version(post_id):
+    return f'post:{post_id}'
+
+
+def touch(*names):
+    """Сдвигает версии после фиксации транзакции (внутри незафиксированной - читатель закэшировал бы старое)"""
+    keys = [version_key(name) for name in names]
+    transaction.on_commit(lambda: version_cache().set_many(dict.fromkeys(keys, time.time()), None))
+
+
+def touch_posts(post_ids):
+    touch(LISTS, *(post_version(post_id) for post_id in post_ids))
+
+
+def touch_site():
+    touch(SITE, LISTS)
+
+
+def get_versions(names):
+    """Версии по именам; отсутствующие в кэше (вытеснены, первый запуск) считаются изменёнными сейчас"""
+    versions = version_cache().get_many([version_key(name) for name in names])
+    missing = {version_key(name): time.time() for name in names if version_key(name) not in versions}
+    if missing:
+        version_cache().set_many(missing, None)
+        versions.update(missing)
+    return [versions[version_key(name)] for name in names]
+
+
+def is_cacheable(request):
+    if not settings.PAGE_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+        return False
+    # Сообщения выводятся один раз - такую страницу нельзя ни отдать из кэша, ни сохранить
+    if CookieStorage.cookie_name in request.COOKIES:
+        return False
+    return not request.user.is_authenticated
+
+
+def theme(request):
+    # Тема анонимного посетителя - только в сессии (как в users.context_processors.current_theme)
+    return request.session.get('theme', 'dark')
+
+
+def is_storable(request, response):
+    messages = getattr(request, '_messages', None)
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not getattr(messages, 'used', False)
+        and not request.session.modified
+    )
+
+
+class CachedPage:
+    """Ключ страницы в кэше и её условные заголовки"""
+
+    def __init__(self, request, version_names, modified_at=None):
+        versions = get_versions([SITE, *version_names])
+        parts = [request.get_full_path(), theme(request), *version_names, *map(repr, versions)]
+        digest = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+        self.key = f'page_cache:page:{digest}'
+        self.etag = f'"{digest}"'
+        # Версии - время изменения, поэтому Last-Modified - самая поздняя из них
+        self.last_modified = int(max([*versions, *([modified_at.timestamp()] if modified_at else [])]))
+
+    def conditional_response(self, request):
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def load(self):
+        cached = cache.get(self.key)
+        if cached is None:
+            return None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def store(self, response):
+        cache.set(self.key, (response.content, response['Content-Type']), settings.PAGE_CACHE_TIMEOUT)
+
+    def finish(self, response, state):
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        response['X-Page-Cache'] = state
+        # Браузер каждый раз перепроверяет страницу (обычно это 304)
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        return response
+
+
+class AnonymousPageCacheMixin:
+    """
+    Для анонимных GET: 304 по ETag/Last-Modified, затем страница из кэша, иначе рендер и сохранение.
+    page_cache_versions() - имена версий, от которых зависит страница
+    """
+
+    def page_cache_versions(self):
+        return [LISTS]
+
+    def page_modified_at(self):
+        return None
+
+    def page_cache_hit(self, request, response):
+        """Действия, которые выполняет view и при ответе из кэша (например, учёт просмотра)"""
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        version_names = self.page_cache_versions()
+        if version_names is None:
+            # Страницы нет (404) - обычная обработка
+            return super().dispatch(request, *args, **kwargs)
+
+        page = CachedPage(request, version_names, self.page_modified_at())
+
+        response = page.conditional_response(request)
+        if response is not None:
+            return page.finish(self.page_cache_hit(request, response), 'not-modified')
+
+        response = page.load()
+        if response is not None:
+            # Страница из кэша рендерилась для другого посетителя - CSRF-cookie выдаётся этому
+            get_token(request)
+            return page.finish(self.page_cache_hit(request, response), 'hit')
+
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if is_storable(request, response):
+            page.store(response)
+            return page.finish(response, 'miss')
+        return response
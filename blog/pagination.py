@@ -0,0 +1,91 @@
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'blog.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(obj, ordering):
+    """Непрозрачный (подписанный) курсор со значениями ключа сортировки последнего элемента"""
+    values = []
+    for field in ordering:
+        value = getattr(obj, field.lstrip('-'))
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+
+    return signing.dumps({'o': list(ordering), 'v': values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, model, ordering):
+    """Возвращает значения ключа сортировки из курсора"""
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor("Некорректный курсор")
+
+    if data.get('o') != list(ordering) or len(data.get('v', [])) != len(ordering):
+        raise InvalidCursor("Курсор относится к другой сортировке")
+
+    return [
+        model._meta.get_field(field.lstrip('-')).to_python(value)
+        for field, value in zip(ordering, data['v'])
+    ]
+
+
+def keyset_filter(ordering, values):
+    """
+    Условие "строго после курсора" для составного ключа сортировки:
+    a <= a0 AND ((a < a0) OR (a = a0 AND b < b0) OR ...)
+    Избыточное a <= a0 позволяет базе начать чтение индекса сразу с позиции курсора,
+    поэтому стоимость страницы не зависит от её номера.
+    """
+    first = ordering[0]
+    condition = Q()
+    equal_prefix = {}
+
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal_prefix, **{f'{name}__{lookup}': value})
+        equal_prefix[name] = value
+
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    return bound & condition
+
+
+def keyset_page(queryset, ordering, limit, cursor=None, offset=0):
+    """Срез queryset для порции: limit + 1 строка после курсора (или после offset, если курсора нет)"""
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, queryset.model, ordering)))
+        offset = 0
+
+    return queryset[offset:offset + limit + 1]
+
+
+def keyset_result(items, ordering, limit):
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    next_cursor = encode_cursor(items[-1], ordering) if has_more else None
+
+    return items, has_more, next_cursor
+
+
+def paginate_keyset(queryset, ordering, limit, cursor=None, offset=0):
+    """
+    Возвращает (элементы, есть_ли_ещё, следующий_курсор).
+    Читается limit + 1 строка, поэтому отдельный count() не нужен.
+    Если курсора нет, используется offset (для совместимости со старыми клиентами).
+    """
+    items = list(keyset_page(queryset, ordering, limit, cursor=cursor, offset=offset))
+    return keyset_result(items, ordering, limit)
+
+
+async def apaginate_keyset(queryset, ordering, limit, cursor=None, offset=0):
+    """paginate_keyset для async view (асинхронный ORM)"""
+    items = [item async for item in keyset_page(queryset, ordering, limit, cursor=cursor, offset=offset)]
+    return keyset_result(items, ordering, limit)
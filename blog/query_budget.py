@@ -0,0 +1,113 @@
+"""
+Учёт SQL-запросов по view.
+
+QueryBudgetMiddleware (подключается через QUERY_BUDGET_ENABLED) считает запросы, суммарное время
+в базе и повторяющиеся "формы" SQL для каждого запроса, отдаёт их в заголовках X-Query-*
+и пишет строку в лог query_budget (ротируемый файл, см. LOGGING в настройках).
+QueryBudgetTestMixin - то же самое для тестов: проверка бюджета запросов view.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+logger = logging.getLogger('query_budget')
+
+# Списки параметров разной длины в IN (...) и VALUES (...) считаются одной формой запроса
+PARAMS_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+VALUES_LIST_RE = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+
+
+def sql_shape(sql):
+    """SQL без значений: одинаковые запросы с разными параметрами дают одну форму"""
+    shape = PARAMS_LIST_RE.sub('(...)', sql)
+    return VALUES_LIST_RE.sub(r'\1', shape)
+
+
+class QueryRecorder:
+    """Обёртка execute для всех подключений: количество, время и формы запросов"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Формы запросов, выполненные больше одного раза: {форма: количество}"""
+        return {shape: count for shape, count in self.shapes.items() if count > 1}
+
+
+@contextmanager
+def record_queries():
+    """Записывает запросы ко всем базам внутри блока (подключения открываются лениво)"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.2f}'
+        response['X-Query-Duplicates'] = str(sum(count - 1 for count in duplicates.values()))
+
+        logger.info(json.dumps({
+            'url_name': url_name,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_time_ms': round(recorder.duration * 1000, 2),
+            'duplicates': duplicates,
+        }, ensure_ascii=False))
+
+        return response
+
+
+class QueryBudgetTestMixin:
+    """
+    Для TestCase: with self.assertQueryBudget(5): ...
+    Падает, если запросов больше бюджета, и показывает их формы (удобно искать N+1).
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, max_duplicates=None):
+        with record_queries() as recorder:
+            yield recorder
+
+        details = '\n'.join(f'{count} x {shape}' for shape, count in recorder.shapes.most_common())
+        self.assertLessEqual(
+            recorder.count, budget,
+            f"Выполнено {recorder.count} запросов при бюджете {budget}:\n{details}"
+        )
+        if max_duplicates is not None:
+            duplicated = sum(count - 1 for count in recorder.duplicates.values())
+            self.assertLessEqual(
+                duplicated, max_duplicates,
+                f"Повторяющихся запросов {duplicated} (допустимо {max_duplicates}):\n{details}"
+            )
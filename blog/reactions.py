@@ -0,0 +1,52 @@
+"""
+Лайки и дизлайки (Reaction).
+
+Переключение выполняется одной транзакцией: реакция того же вида снимается (DELETE),
+иначе реакция ставится одним upsert (INSERT ... ON CONFLICT (post, user) DO UPDATE) -
+новая создаётся, реакция другого вида заменяется. Счётчики поста меняются в той же транзакции
+по прежней реакции, которая читается между DELETE и upsert: в SQLite DELETE уже захватил
+блокировку записи, в других базах строку блокирует SELECT ... FOR UPDATE.
+Уникальный индекс (post, user) гарантирует, что параллельные нажатия не оставят
+пользователя одновременно в лайках и дизлайках.
+"""
+from django.db import transaction
+
+from .models import Reaction
+from .signals import change_post_counter
+
+
+def get_reaction(post, user):
+    """Текущая реакция пользователя на пост ('like', 'dislike' или None)"""
+    if not user.is_authenticated:
+        return None
+    return Reaction.objects.filter(post=post, user=user).values_list('kind', flat=True).first()
+
+
+def toggle_reaction(post, user, kind):
+    """Переключает реакцию пользователя на пост, возвращает новую реакцию ('like', 'dislike' или None)"""
+    with transaction.atomic():
+        # Повторное нажатие на ту же кнопку снимает реакцию
+        removed, _ = Reaction.objects.filter(post=post, user=user, kind=kind).delete()
+        if removed:
+            current = None
+            deltas = {kind: -1}
+        else:
+            current = kind
+            previous = Reaction.objects.select_for_update().filter(
+                post=post, user=user
+            ).values_list('kind', flat=True).first()
+            Reaction.objects.bulk_create(
+                [Reaction(post=post, user=user, kind=kind)],
+                update_conflicts=True,
+                unique_fields=['post', 'user'],
+                update_fields=['kind', 'created_at'],
+            )
+            deltas = {kind: 1}
+            if previous:
+                # Реакция другого вида заменена
+                deltas[previous] = -1
+
+        for reaction_kind, delta in deltas.items():
+            change_post_counter([post.id], Reaction.COUNTER_FIELDS[reaction_kind], delta)
+
+    return current
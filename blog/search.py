@@ -0,0 +1,343 @@
+"""
+Полнотекстовый поиск постов на SQLite FTS5.
+
+Текст перед индексацией нормализуется в Python: слова приводятся к нижнему регистру,
+русские слова стеммятся (алгоритм Snowball), затем всё транслитерируется через unidecode.
+Английские слова стеммит токенайзер porter внутри FTS5. Тот же путь проходит и запрос,
+поэтому "Привет", "привета" и "privet" находят один и тот же пост.
+Индекс поддерживается сигналами (blog/signals.py) и пересобирается командой rebuild_search_index.
+"""
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from unidecode import unidecode
+
+from .models import Post, News
+
+SEARCH_TABLE = 'blog_posts_search'
+
+# Колонки индекса и их вес в BM25
+SEARCH_COLUMNS = {
+    'title': 10.0,
+    'text': 1.0,
+    'category': 3.0,
+    'tags': 5.0,
+}
+
+SNIPPET_WORDS = 30
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+# === Стеммер русского языка (Snowball) ===
+
+RU_VOWELS = 'аеиоуыэюя'
+
+RU_PERFECTIVE_GERUND = re.compile(r'(?:(?<=[ая])(?:вшись|вши|в)|(?:ившись|ывшись|ивши|ывши|ив|ыв))$')
+RU_REFLEXIVE = re.compile(r'(?:ся|сь)$')
+RU_ADJECTIVE = (
+    r'(?:ими|ыми|его|ого|ему|ому|ее|ие|ые|ое|ей|ий|ый|ой|ем|им|ым|ом|их|ых|ую|юю|ая|яя|ою|ею)'
+)
+RU_PARTICIPLE = r'(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|(?:ивш|ывш|ующ))'
+RU_ADJECTIVAL = re.compile(rf'(?:{RU_PARTICIPLE})?{RU_ADJECTIVE}$')
+RU_VERB = re.compile(
+    r'(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)'
+    r'|(?:ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю))$'
+)
+RU_NOUN = re.compile(
+    r'(?:иями|ями|ами|ией|иям|ием|иях|ев|ов|ие|ье|еи|ии|ей|ой|ий|ям|ем|ам|ом|ах|ях|ию|ью|ия|ья|а|е|и|й|о|у|ы|ь|ю|я)$'
+)
+RU_SUPERLATIVE = re.compile(r'(?:ейше|ейш)$')
+RU_DERIVATIONAL = re.compile(r'(?:ость|ост)$')
+
+
+def _region_after_vowel_consonant(word, start=0):
+    """Начало региона после первой пары "гласная + согласная" (R1/R2 в терминах Snowball)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in RU_VOWELS and word[i - 1] in RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def russian_stem(word):
+    """Отсекает окончания русского слова по алгоритму Snowball"""
+    word = word.replace('ё', 'е')
+
+    rv_start = next((i + 1 for i, char in enumerate(word) if char in RU_VOWELS), len(word))
+    r1_start = _region_after_vowel_consonant(word)
+    r2_start = _region_after_vowel_consonant(word, r1_start)
+
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    stripped = RU_PERFECTIVE_GERUND.sub('', rv, count=1)
+    if stripped == rv:
+        rv = RU_REFLEXIVE.sub('', rv, count=1)
+        for pattern in (RU_ADJECTIVAL, RU_VERB, RU_NOUN):
+            stripped = pattern.sub('', rv, count=1)
+            if stripped != rv:
+                break
+    rv = stripped
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы только внутри R2
+    match = RU_DERIVATIONAL.search(rv)
+    if match and rv_start + match.start() >= r2_start:
+        rv = rv[:match.start()]
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        without_superlative = RU_SUPERLATIVE.sub('', rv, count=1)
+        if without_superlative != rv:
+            rv = without_superlative[:-1] if without_superlative.endswith('нн') else without_superlative
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+# === Нормализация ===
+
+def normalize_terms(text):
+    """Список нормализованных термов текста"""
+    terms = []
+
+    for word in WORD_RE.findall((text or '').lower()):
+        if CYRILLIC_RE.search(word):
+            word = russian_stem(word)
+        term = re.sub(r'[^a-z0-9]', '', unidecode(word).lower())
+        if term:
+            terms.append(term)
+
+    return terms
+
+
+def normalize(text):
+    return ' '.join(normalize_terms(text))
+
+
+# === Индекс ===
+
+_ready_databases = set()
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def ensure_search_index():
+    """Создаёт таблицу FTS5, если её ещё нет (один раз на процесс и базу)"""
+    database = connection.settings_dict['NAME']
+    if database in _ready_databases:
+        return
+
+    columns = ', '.join(SEARCH_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5({columns}, tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+
+    # Внутри транзакции создание таблицы может быть откачено (например, в тестах)
+    if not connection.in_atomic_block:
+        _ready_databases.add(database)
+
+
+INDEX_BATCH_SIZE = 500
+
+
+def index_posts(post_ids):
+    """Переиндексирует посты (удалённые посты просто убираются из индекса)"""
+    if not is_enabled():
+        return
+
+    post_ids = list(post_ids)
+    for start in range(0, len(post_ids), INDEX_BATCH_SIZE):
+        _index_batch(post_ids[start:start + INDEX_BATCH_SIZE])
+
+
+def _index_batch(post_ids):
+    if not post_ids:
+        return
+
+    ensure_search_index()
+
+    posts = Post.objects.filter(id__in=post_ids).select_related('category').prefetch_related('tags')
+    rows = [
+        (
+            post.id,
+            normalize(post.title),
+            normalize(post.text),
+            normalize(post.category.name if post.category else ''),
+            normalize(' '.join(tag.name for tag in post.tags.all())),
+        )
+        for post in posts
+    ]
+
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", post_ids)
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)",
+            rows
+        )
+
+
+def remove_posts(post_ids):
+    if not is_enabled() or not post_ids:
+        return
+
+    ensure_search_index()
+    post_ids = list(post_ids)
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", post_ids)
+
+
+def is_index_empty():
+    ensure_search_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")
+        return cursor.fetchone() is None
+
+
+def rebuild_search_index():
+    """Полная пересборка индекса, возвращает количество проиндексированных постов"""
+    ensure_search_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    post_ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+    index_posts(post_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+    return len(post_ids)
+
+
+# === Поиск ===
+
+def build_match_query(terms, columns):
+    """Выражение MATCH: все термы (как префиксы) в указанных колонках"""
+    expression = ' AND '.join(f'"{term}"*' for term in terms)
+    return f"{{{' '.join(columns)}}} : ({expression})"
+
+
+def highlight(text, terms, words=SNIPPET_WORDS):
+    """Фрагмент текста вокруг первого совпадения с подсвеченными словами"""
+    tokens = re.split(r'(\w+)', text or '')
+    matched = set()
+
+    for i in range(1, len(tokens), 2):
+        normalized = normalize_terms(tokens[i])
+        if normalized and any(normalized[0].startswith(term) for term in terms):
+            matched.add(i)
+
+    # Слова стоят на нечётных позициях, разделители - на чётных
+    first = min(matched) if matched else 1
+    start = max(first - words, 0)
+    end = min(first + words, len(tokens))
+    start -= start % 2
+
+    parts = []
+    for i in range(start, end):
+        token = escape(tokens[i])
+        parts.append(f'<mark>{token}</mark>' if i in matched else token)
+
+    snippet = ''.join(parts).strip()
+    if start > 0:
+        snippet = '… ' + snippet
+    if end < len(tokens):
+        snippet += ' …'
+
+    return mark_safe(snippet)
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска для Paginator: count() и срезы выполняются
+    запросами к индексу FTS5 с сортировкой по BM25.
+    """
+
+    def __init__(self, query, search_category=False, search_tag=False, prepare_queryset=None):
+        self.terms = list(dict.fromkeys(normalize_terms(query)))
+        self.columns = ['title', 'text']
+        if search_category:
+            self.columns.append('category')
+        if search_tag:
+            self.columns.append('tags')
+        self.prepare_queryset = prepare_queryset
+        self._count = None
+
+    def _from_where(self):
+        post_table = Post._meta.db_table
+        news_table = News._meta.db_table
+        # CROSS JOIN в SQLite фиксирует порядок: внешний цикл - совпадения FTS5, посты ищутся по id.
+        # С обычным JOIN планировщик может пойти от постов по индексу статуса и выполнять MATCH
+        # заново для каждого опубликованного поста
+        return (
+            f"FROM {SEARCH_TABLE} "
+            f"CROSS JOIN {post_table} ON {post_table}.id = {SEARCH_TABLE}.rowid "
+            f"LEFT JOIN {news_table} ON {news_table}.post_item_id = {post_table}.id "
+            f"WHERE {SEARCH_TABLE} MATCH %s "
+            f"AND {post_table}.status = 'published' AND {news_table}.id IS NULL"
+        ), [build_match_query(self.terms, self.columns)]
+
+    def count(self):
+        if self._count is None:
+            if not self.terms:
+                self._count = 0
+            else:
+                ensure_search_index()
+                sql, params = self._from_where()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) {sql}", params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+
+        if not self.terms:
+            return []
+
+        offset = item.start or 0
+        limit = (item.stop - offset) if item.stop is not None else -1
+
+        ensure_search_index()
+        weights = ', '.join(str(weight) for weight in SEARCH_COLUMNS.values())
+        sql, params = self._from_where()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {SEARCH_TABLE}.rowid {sql} "
+                f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                params + [limit, offset]
+            )
+            post_ids = [row[0] for row in cursor.fetchall()]
+
+        queryset = Post.objects.filter(id__in=post_ids)
+        if self.prepare_queryset:
+            queryset = self.prepare_queryset(queryset)
+        posts_by_id = {post.id: post for post in queryset}
+
+        posts = []
+        for post_id in post_ids:
+            if post_id in posts_by_id:
+                post = posts_by_id[post_id]
+                post.search_snippet = highlight(post.text, self.terms)
+                posts.append(post)
+
+        return posts
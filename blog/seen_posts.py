@@ -0,0 +1,98 @@
+"""
+Просмотренные посетителем посты (чтобы повторный просмотр не увеличивал счётчик).
+
+Раньше PostDetailView записывал в сессию ключ post_<id>_viewed на каждый открытый пост: сессия в базе
+росла без ограничений и перезаписывалась целиком при каждом просмотре. Теперь множество id хранится
+в подписанной cookie: отсортированные id кодируются разностями с предыдущим (varint, 1-3 байта на id
+вместо ~25 байт ключа сессии) и base64. Cookie отправляется только при изменении множества,
+повторный просмотр ничего не пишет. Размер ограничен SEEN_POSTS_MAX_IDS: при переполнении забываются
+самые старые посты (с наименьшими id) - их повторный просмотр будет засчитан ещё раз.
+"""
+import base64
+import binascii
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+SEEN_POSTS_COOKIE = 'seen_posts'
+SEEN_POSTS_SALT = 'blog.seen_posts'
+
+
+def encode_ids(ids):
+    """Отсортированные id -> строка: разности соседних id в varint, затем base64 без '='"""
+    data = bytearray()
+    previous = 0
+    for post_id in ids:
+        delta = post_id - previous
+        previous = post_id
+        while delta >= 0x80:
+            data.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def decode_ids(value):
+    """Обратное к encode_ids; повреждённое значение - пустой список"""
+    try:
+        data = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    except (binascii.Error, ValueError):
+        return []
+
+    ids = []
+    current = shift = delta = 0
+    for byte in data:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += delta
+        ids.append(current)
+        shift = delta = 0
+    return ids
+
+
+class SeenPosts:
+    def __init__(self, ids=()):
+        self.ids = sorted(set(ids))
+        self.changed = False
+
+    @classmethod
+    def from_request(cls, request):
+        # Поддельная или устаревшая подпись - как будто cookie нет
+        return cls(decode_ids(request.get_signed_cookie(SEEN_POSTS_COOKIE, '', salt=SEEN_POSTS_SALT)))
+
+    def __contains__(self, post_id):
+        index = bisect_left(self.ids, post_id)
+        return index < len(self.ids) and self.ids[index] == post_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, post_id):
+        """Добавляет пост, возвращает False, если он уже был просмотрен"""
+        if post_id in self:
+            return False
+
+        insort(self.ids, post_id)
+        overflow = len(self.ids) - settings.SEEN_POSTS_MAX_IDS
+        if overflow > 0:
+            del self.ids[:overflow]
+        self.changed = True
+        return True
+
+    def encode(self):
+        return encode_ids(self.ids)
+
+    def save(self, response):
+        """Ставит cookie, только если множество изменилось"""
+        if self.changed:
+            response.set_signed_cookie(
+                SEEN_POSTS_COOKIE,
+                self.encode(),
+                salt=SEEN_POSTS_SALT,
+                max_age=settings.SEEN_POSTS_COOKIE_AGE,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
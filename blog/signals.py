@@ -1,47 +1,416 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 
-from config.settings import DEFAULT_FROM_EMAIL, SITE_URL
-from .models import News, Post
+from . import autocomplete, images, page_cache, search, tags, timeline
+from .notifications import enqueue_important_news
+from .models import News, Post, Comment, SiteStatistics, Category, Tag
 
 User = get_user_model()
 
+# Промежуточная таблица M2M -> поле счётчика в Post
+# (счётчики лайков и дизлайков меняет blog/reactions.py вместе с Reaction)
+REACTION_COUNTER_FIELDS = {
+    Post.favorites.through: 'favorites_count',
+}
+
+# Поле счётчика в Post -> поле снимка статистики
+STATISTICS_FIELDS = {
+    'likes_count': 'total_likes',
+    'favorites_count': 'total_favorites',
+    'comments_count': 'total_comments',
+}
+
+# Поля поста, которые суммируются в статистике
+POST_STATISTICS_FIELDS = {
+    'views': 'total_views',
+    **STATISTICS_FIELDS,
+}
+
+
+def change_post_counter(post_ids, field, delta):
+    """Атомарно изменяет счётчик у постов на delta (не опускаясь ниже нуля)"""
+    if not post_ids or not delta:
+        return
+
+    Post.objects.filter(id__in=post_ids).update(
+        **{field: Greatest(F(field) + delta, Value(0))},
+        trending_dirty=True,
+        card_version=F('card_version') + 1
+    )
+    page_cache.touch_posts(post_ids)
+
+    if field in STATISTICS_FIELDS:
+        SiteStatistics.apply_posts_delta(post_ids, STATISTICS_FIELDS[field], delta)
+
+
+def post_statistics_values(post_id, fields=POST_STATISTICS_FIELDS):
+    """Текущие значения полей поста, если он учитывается в статистике"""
+    return SiteStatistics.counted_posts().filter(id=post_id).values('author_id', *fields).first()
+
+
+def change_site_statistics_for_post(post_id, values, sign):
+    """Добавляет (sign=1) или убирает (sign=-1) вклад поста в статистику сайта"""
+    if values is None:
+        return
+
+    has_other_posts = SiteStatistics.counted_posts().filter(
+        author_id=values['author_id']
+    ).exclude(id=post_id).exists()
+
+    SiteStatistics.apply_delta(
+        total_posts=sign,
+        total_authors=0 if has_other_posts else sign,
+        **{
+            statistics_field: sign * values[field]
+            for field, statistics_field in POST_STATISTICS_FIELDS.items()
+            if field in values
+        }
+    )
+
 
 @receiver(post_save, sender=Post)
 def email_important_news_notifications(sender, instance, **kwargs):
-    """Отправка на email уведомлений при публикации важной новости"""
+    """
+    Постановка в очередь рассылки уведомлений при публикации важной новости.
+    Сами письма отправляет команда send_email_notifications.
+    """
     if (hasattr(instance, 'news_item') and 
         instance.news_item.is_important and 
         instance.status == 'published' and
         not instance.news_item.email_notifications_sent):
-        
-        subscribers = User.objects.filter(subscribed_to_important_news=True)
-        
-        if subscribers.exists():
-            subject = f"🔔 Важная новость: {instance.title}"
-
-            html_message = render_to_string('blog/emails/important_news_notification.html', {
-                'news': instance.news_item,
-                'site_url': SITE_URL
-            })
-            for user in subscribers:
-                # Отправляем email каждому подписчику
-                send_mail(
-                    subject=subject,
-                    message="",
-                    html_message=html_message,
-                    from_email=DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email]
-                )
-        
-        # Помечаем, что уведомления отправлены
-        instance.news_item.email_notifications_sent = True
-        instance.news_item.save(update_fields=['email_notifications_sent'])
+        enqueue_important_news(instance.news_item)
+
+
+@receiver(m2m_changed)
+def update_reaction_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддержка счётчика избранного.
+    m2m_changed отправляется внутри транзакции add()/remove()/clear(),
+    поэтому счётчик меняется атомарно вместе с промежуточной таблицей.
+    """
+    field = REACTION_COUNTER_FIELDS.get(sender)
+    if field is None:
+        return
+
+    if action == 'pre_clear':
+        # Запоминаем затронутые строки до очистки, после неё их уже не узнать
+        if reverse:
+            instance._cleared_post_ids = list(
+                sender.objects.filter(**{f'{User._meta.model_name}_id': instance.pk}).values_list('post_id', flat=True)
+            )
+        else:
+            instance._cleared_count = sender.objects.filter(post_id=instance.pk).count()
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        if reverse:
+            change_post_counter(getattr(instance, '_cleared_post_ids', []), field, -1)
+        else:
+            change_post_counter([instance.pk], field, -getattr(instance, '_cleared_count', 0))
+        return
+
+    delta = len(pk_set) if action == 'post_add' else -len(pk_set)
+
+    if reverse:
+        # user.favorite_posts.add(post1, post2): каждый пост меняется на 1
+        change_post_counter(pk_set, field, 1 if delta > 0 else -1)
+    else:
+        # post.favorites.add(user1, user2): один пост меняется на количество пользователей
+        change_post_counter([instance.pk], field, delta)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        change_post_counter([instance.post_id], 'comments_count', 1)
+
+        if instance.parent_id:
+            Comment.objects.filter(id=instance.parent_id).update(replies_count=F('replies_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    change_post_counter([instance.post_id], 'comments_count', -1)
+
+    if instance.parent_id:
+        Comment.objects.filter(id=instance.parent_id).update(
+            replies_count=Greatest(F('replies_count') - 1, Value(0))
+        )
+
+
+@receiver(post_init, sender=Post)
+def remember_loaded_status(sender, instance, **kwargs):
+    # Статус на момент загрузки нужен, чтобы отследить публикацию/снятие с публикации
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+# Должен выполняться до update_statistics_on_status_change, который обновляет _loaded_status
+@receiver(post_save, sender=Post)
+def update_timelines_on_status_change(sender, instance, created, **kwargs):
+    was_published = not created and instance._loaded_status == 'published'
+    is_published = instance.status == 'published'
+
+    if was_published == is_published:
+        return
+
+    if is_published:
+        # Раскладка по лентам подписчиков - после фиксации транзакции, чтобы не держать блокировку
+        if not hasattr(instance, 'news_item'):
+            transaction.on_commit(lambda: timeline.fan_out_post(instance))
+    else:
+        timeline.remove_post(instance.pk)
+
+
+# Должен выполняться до update_statistics_on_status_change, который обновляет _loaded_status
+@receiver(post_save, sender=Post)
+def update_tag_posts_count_on_status_change(sender, instance, created, **kwargs):
+    # У нового поста ещё нет тегов
+    if created or (instance._loaded_status == 'published') == (instance.status == 'published'):
+        return
+
+    # Теги новости не учитываются ни до, ни после смены статуса
+    if not News.objects.filter(post_item_id=instance.pk).exists():
+        tags.change_tag_posts_count(tags.post_tag_ids(instance.pk), 1 if instance.status == 'published' else -1)
+
+
+@receiver(post_save, sender=Post)
+def update_statistics_on_status_change(sender, instance, created, **kwargs):
+    was_published = not created and instance._loaded_status == 'published'
+    is_published = instance.status == 'published'
+    instance._loaded_status = instance.status
+
+    if was_published == is_published:
+        return
+
+    if is_published:
+        change_site_statistics_for_post(instance.pk, post_statistics_values(instance.pk), 1)
+    else:
+        # Пост уже не учитывается, поэтому берём его значения без фильтра по статусу
+        values = Post.objects.filter(id=instance.pk, news_item__isnull=True).values(
+            'author_id', *POST_STATISTICS_FIELDS
+        ).first()
+        change_site_statistics_for_post(instance.pk, values, -1)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_statistics(sender, instance, **kwargs):
+    # Комментарии удаляются каскадно со своими сигналами, поэтому их здесь не учитываем.
+    # Строки лайков/избранного удаляются без сигналов m2m_changed - их вклад убираем вместе с постом
+    instance._statistics_values = post_statistics_values(
+        instance.pk, fields=[field for field in POST_STATISTICS_FIELDS if field != 'comments_count']
+    )
+
+
+@receiver(post_delete, sender=Post)
+def update_statistics_on_post_delete(sender, instance, **kwargs):
+    change_site_statistics_for_post(instance.pk, getattr(instance, '_statistics_values', None), -1)
+    instance._statistics_values = None
+
+
+@receiver(post_save, sender=News)
+def exclude_news_post_from_statistics(sender, instance, created, **kwargs):
+    # Пост, ставший новостью, больше не учитывается в статистике
+    if created and instance.post_item.status == 'published':
+        values = Post.objects.filter(id=instance.post_item_id).values('author_id', *POST_STATISTICS_FIELDS).first()
+        change_site_statistics_for_post(instance.post_item_id, values, -1)
+
+
+@receiver(post_save, sender=News)
+def exclude_news_post_from_tag_posts_count(sender, instance, created, **kwargs):
+    if created and instance.post_item.status == 'published':
+        tags.change_tag_posts_count(tags.post_tag_ids(instance.post_item_id), -1)
+
+
+@receiver(post_save, sender=News)
+def remove_news_post_from_timelines(sender, instance, created, **kwargs):
+    # Новости не показываются в ленте подписок
+    if created:
+        timeline.remove_post(instance.post_item_id)
+
+
+# Поля поста, от которых зависит поисковый индекс
+SEARCH_FIELDS = {'title', 'text', 'category'}
+
+
+@receiver(post_save, sender=Post)
+def index_post_for_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        search.index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_search(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
+
+
+def bump_card_version(post_ids):
+    """Сбрасывает закэшированные карточки постов (blog/feeds.py) и страницы с ними (blog/page_cache.py)"""
+    Post.objects.filter(id__in=post_ids).update(card_version=F('card_version') + 1)
+    page_cache.touch_posts(post_ids)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_tags_for_search(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_posts([instance.pk])
+            bump_card_version([instance.pk])
+        return
+
+    # tag.posts.add(...) / remove(...) / clear()
+    if action == 'pre_clear':
+        instance._search_post_ids = list(instance.posts.values_list('id', flat=True))
+    elif action == 'post_clear':
+        post_ids = getattr(instance, '_search_post_ids', [])
+        search.index_posts(post_ids)
+        bump_card_version(post_ids)
+    elif action in ('post_add', 'post_remove'):
+        search.index_posts(pk_set)
+        bump_card_version(pk_set)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_tag_posts_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # post.tags.add(...) / remove(...) / clear(): каждый тег меняется на 1, если пост учитывается
+        if action == 'pre_clear':
+            instance._cleared_tag_ids = tags.post_tag_ids(instance.pk) if tags.is_counted(instance) else []
+        elif action == 'post_clear':
+            tags.change_tag_posts_count(getattr(instance, '_cleared_tag_ids', []), -1)
+        elif action in ('post_add', 'post_remove') and tags.is_counted(instance):
+            tags.change_tag_posts_count(pk_set, 1 if action == 'post_add' else -1)
+        return
+
+    # tag.posts.add(...) / remove(...) / clear(): один тег меняется на количество учитываемых постов
+    if action == 'post_clear':
+        Tag.objects.filter(id=instance.pk).update(posts_count=0)
+    elif action in ('post_add', 'post_remove'):
+        counted = tags.counted_posts().filter(id__in=pk_set).count()
+        tags.change_tag_posts_count([instance.pk], counted if action == 'post_add' else -counted)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    # Строки промежуточной таблицы удаляются каскадно, без сигналов m2m_changed
+    instance._deleted_tag_ids = tags.post_tag_ids(instance.pk) if tags.is_counted(instance) else []
+
+
+@receiver(post_delete, sender=Post)
+def update_tag_posts_count_on_post_delete(sender, instance, **kwargs):
+    tags.change_tag_posts_count(getattr(instance, '_deleted_tag_ids', []), -1)
+
+
+@receiver(post_save, sender=Category)
+def index_category_posts_for_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.posts.values_list('id', flat=True))
+        instance.posts.update(card_version=F('card_version') + 1)
+    page_cache.touch_site()
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_posts_for_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.posts.values_list('id', flat=True))
+        instance.posts.update(card_version=F('card_version') + 1)
+    page_cache.touch_site()
+
+
+@receiver(pre_delete, sender=Tag)
+def refresh_cards_on_tag_delete(sender, instance, **kwargs):
+    # Связи с постами удаляются без m2m_changed
+    instance.posts.update(card_version=F('card_version') + 1)
+    page_cache.touch_site()
+
+
+# Должен выполняться до delete_related_post: возвращаем вклад поста,
+# который затем будет убран при его удалении
+@receiver(post_delete, sender=News)
+def include_former_news_post_in_statistics(sender, instance, **kwargs):
+    change_site_statistics_for_post(instance.post_item_id, post_statistics_values(instance.post_item_id), 1)
+
+
+@receiver(post_delete, sender=News)
+def include_former_news_post_in_tag_posts_count(sender, instance, **kwargs):
+    if tags.counted_posts().filter(id=instance.post_item_id).exists():
+        tags.change_tag_posts_count(tags.post_tag_ids(instance.post_item_id), 1)
 
 
 @receiver(post_delete, sender=News)
 def delete_related_post(sender, instance, **kwargs):
     Post.objects.filter(id=instance.post_item_id).delete()
+
+
+@receiver(post_init, sender=Post)
+def remember_post_image(sender, instance, **kwargs):
+    images.remember_image(instance, 'image')
+
+
+@receiver(post_init, sender=User)
+def remember_avatar(sender, instance, **kwargs):
+    images.remember_image(instance, 'avatar')
+
+
+@receiver(pre_save, sender=Post)
+def reset_post_image_variants(sender, instance, **kwargs):
+    images.reset_variants(instance, 'image', 'image_variants')
+
+
+@receiver(pre_save, sender=User)
+def reset_avatar_variants(sender, instance, **kwargs):
+    images.reset_variants(instance, 'avatar', 'avatar_variants')
+
+
+@receiver(post_save, sender=Post)
+def clear_post_image_variants(sender, instance, **kwargs):
+    images.clear_variants(instance, 'image', 'image_variants')
+
+
+@receiver(post_save, sender=User)
+def clear_avatar_variants(sender, instance, **kwargs):
+    images.clear_variants(instance, 'avatar', 'avatar_variants')
+
+
+@receiver(post_delete, sender=Post)
+def delete_post_image_variants(sender, instance, **kwargs):
+    names = images.variant_names(instance.image_variants)
+    if names:
+        transaction.on_commit(lambda: images.delete_variant_files(names))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+def update_autocomplete_index(sender, instance, **kwargs):
+    kind = 'tag' if sender is Tag else 'category'
+    # Вес категории (количество постов) обновляется при перестройке индекса
+    weight = instance.posts_count if sender is Tag else None
+    transaction.on_commit(lambda: autocomplete.index.put(kind, instance.pk, instance.name, instance.slug, weight))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    kind = 'tag' if sender is Tag else 'category'
+    object_id = instance.pk
+    transaction.on_commit(lambda: autocomplete.index.remove(kind, object_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_cached_post_pages(sender, instance, **kwargs):
+    # Изменение счётчиков (change_post_counter) сдвигает версии само, здесь - правка текста и статуса
+    page_cache.touch_posts([instance.pk if sender is Post else instance.post_id])
+
+
+@receiver(post_delete, sender=Category)
+def purge_cached_pages_on_category_delete(sender, instance, **kwargs):
+    page_cache.touch_site()
@@ -0,0 +1,52 @@
+"""
+Временная копия базы SQLite для нагрузочных команд (stress_database, benchmark_asgi).
+
+Команды, которые пишут в базу из нескольких потоков, не могут откатить изменения общей
+транзакцией, поэтому работают с копией: copy_database снимает её через backup API SQLite,
+use_database переключает на неё алиас default во всех потоках.
+"""
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.base import CommandError
+from django.db import connection, connections
+
+
+def copy_database(path):
+    """Снимок рабочей базы через backup API SQLite (консистентен даже во время записи)"""
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+@contextmanager
+def use_database(path, **overrides):
+    """Подключения всех потоков к default открываются к path, overrides дополняют настройки алиаса"""
+    original = connections.settings['default']
+    connections.close_all()
+    connections.settings['default'] = {**original, 'NAME': str(path), **overrides}
+    # Потоки создадут подключения по новым настройкам, текущему потоку подключение заменяется явно
+    connections['default'] = connections.create_connection('default')
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connections.settings['default'] = original
+        connections['default'] = connections.create_connection('default')
+
+
+@contextmanager
+def temporary_copy():
+    """Копия базы во временном каталоге, удаляется после блока. Возвращает путь к копии"""
+    if connection.vendor != 'sqlite':
+        raise CommandError("Команда работает только с SQLite")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'copy.sqlite3'
+        copy_database(path)
+        yield path
@@ -6,7 +6,6 @@ class BatchLoader {
   constructor(containerId) {
     this.container = document.getElementById(containerId);
     this.offset = Number(this.container.dataset.initialOffset);
-    this.hasMore = this.container.dataset.hasMore === 'True';
     this.batchSize = Number(this.container.dataset.batchSize);
     this.loadMoreUrl = this.container.dataset.loadMoreUrl;
     this.triggerType = this.container.dataset.triggerType; // scroll или button
@@ -15,6 +14,40 @@ class BatchLoader {
     this.init();
   }
 
+  // Состояние храним в data-атрибутах контейнера, чтобы его мог сбросить FilterLoader
+  get hasMore() {
+    return this.container.dataset.hasMore === 'True';
+  }
+
+  set hasMore(value) {
+    this.container.dataset.hasMore = value ? 'True' : 'False';
+  }
+
+  get cursor() {
+    return this.container.dataset.nextCursor || '';
+  }
+
+  set cursor(value) {
+    this.container.dataset.nextCursor = value || '';
+  }
+
+  // Параметры запроса: курсор, а для старой разметки без курсора - offset
+  buildParams() {
+    const params = new URLSearchParams();
+
+    if (this.cursor) {
+      params.set('cursor', this.cursor);
+    } else {
+      params.set('offset', this.offset);
+    }
+
+    if (this.container.dataset.filter) {
+      params.set('filter', this.container.dataset.filter);
+    }
+
+    return params;
+  }
+
   init() {
     if (this.triggerType === 'scroll') {
       window.addEventListener('scroll', () => {
@@ -42,13 +75,14 @@ class BatchLoader {
     }
 
     try {
-      const data = await getAction(`${this.loadMoreUrl}?offset=${this.offset}`);
+      const data = await getAction(`${this.loadMoreUrl}?${this.buildParams()}`);
 
       // Форматируем даты
       const html = formatDatesInHTML(data.html);
 
       this.container.insertAdjacentHTML("beforeend", html);
       this.offset += this.batchSize;
+      this.cursor = data.next_cursor;
       this.hasMore = data.has_more;
       
       // Если кнопочная версия и посты ещё есть - возвращаем кнопку
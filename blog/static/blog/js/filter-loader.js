@@ -55,6 +55,11 @@ export default class FilterLoader {
                 setTimeout(() => {
                     this.container.innerHTML = data.html;
                     this.hasMore = data.has_more;
+
+                    // Дальнейшая подгрузка (BatchLoader) продолжается по курсору выбранного фильтра
+                    this.container.dataset.filter = filter;
+                    this.container.dataset.nextCursor = data.next_cursor || '';
+                    this.container.dataset.hasMore = data.has_more ? 'True' : 'False';
                     
                     // Анимация появления
                     this.container.style.opacity = '1';
@@ -0,0 +1,43 @@
+// blog/js/pages/post_form.js
+
+// Подсказки существующих тегов для последнего тега в поле "Теги" (теги перечисляются через запятую)
+const tagsInput = document.querySelector('[data-autocomplete-url]');
+
+if (tagsInput) {
+  const datalist = document.getElementById(tagsInput.getAttribute('list'));
+  let controller = null;
+
+  tagsInput.addEventListener('input', async () => {
+    const parts = tagsInput.value.split(',');
+    const prefix = parts.pop().trim();
+    const entered = parts.map((part) => part.trim()).filter(Boolean);
+
+    if (!prefix) {
+      datalist.replaceChildren();
+      return;
+    }
+
+    // Ответ на предыдущую букву уже не нужен
+    controller?.abort();
+    controller = new AbortController();
+
+    const url = `${tagsInput.dataset.autocompleteUrl}?kind=tag&q=${encodeURIComponent(prefix)}`;
+    let data;
+    try {
+      const response = await fetch(url, { signal: controller.signal });
+      data = await response.json();
+    } catch (error) {
+      return;
+    }
+
+    // Браузер сравнивает подсказку со всем значением поля, поэтому в ней - уже введённые теги и вариант
+    datalist.replaceChildren(...data.results
+      .filter((tag) => !entered.includes(tag.name))
+      .map((tag) => {
+        const option = document.createElement('option');
+        option.value = [...entered, tag.name].join(', ');
+        option.label = `${tag.name} (${tag.count})`;
+        return option;
+      }));
+  });
+}
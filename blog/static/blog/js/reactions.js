@@ -1,5 +1,5 @@
-import { postAction } from "../../../../static/js/utils.js";
-import { formatDate } from "../../../../static/js/format-dates.js";
+import { getAction, postAction } from "../../../../static/js/utils.js";
+import { formatDate, formatDatesInHTML } from "../../../../static/js/format-dates.js";
 
 
 const postReactionsElement = document.querySelector("#postReactions");
@@ -23,7 +23,10 @@ postReactionsElement.addEventListener('click', async (event) => {
 
   const url = btnElement.dataset.url;
 
-  const data = await postAction(url);
+  const formData = new FormData();
+  formData.append('kind', btnElement.dataset.kind);
+
+  const data = await postAction(url, formData);
 
   if (!data) return;
 
@@ -73,6 +76,10 @@ class CommentManager {
       if (e.target.closest('.cancel-reply-btn')) {
         this.handleCancelReplyClick(e.target.closest('.cancel-reply-btn'));
       }
+
+      if (e.target.closest('.load-replies-btn')) {
+        this.handleLoadRepliesClick(e.target.closest('.load-replies-btn'));
+      }
     });
 
     // Обработчики для форм ответов
@@ -151,6 +158,34 @@ class CommentManager {
     replyFormElement.querySelector('textarea').focus();
   }
 
+  // Подгрузка ответов, не вошедших в дерево (ограничение глубины или количества)
+  async handleLoadRepliesClick(loadRepliesBtnElement) {
+    if (loadRepliesBtnElement.disabled) return;
+    loadRepliesBtnElement.disabled = true;
+
+    const params = new URLSearchParams();
+    if (loadRepliesBtnElement.dataset.cursor) {
+      params.set('cursor', loadRepliesBtnElement.dataset.cursor);
+    }
+
+    const data = await getAction(`${loadRepliesBtnElement.dataset.loadRepliesUrl}?${params}`);
+
+    if (!data) {
+      loadRepliesBtnElement.disabled = false;
+      return;
+    }
+
+    const repliesContainerElement = loadRepliesBtnElement.closest('.comment-container').querySelector('.replies');
+    repliesContainerElement.insertAdjacentHTML('beforeend', formatDatesInHTML(data.html));
+
+    if (data.has_more) {
+      loadRepliesBtnElement.dataset.cursor = data.next_cursor;
+      loadRepliesBtnElement.disabled = false;
+    } else {
+      loadRepliesBtnElement.remove();
+    }
+  }
+
   handleCancelReplyClick(cancelBtnElement) {
     const replyFormElement = cancelBtnElement.closest('.reply-form-container');
     replyFormElement.classList.add('d-none');
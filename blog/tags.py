@@ -0,0 +1,99 @@
+"""
+Синхронизация тегов поста при создании и редактировании.
+
+Теги ищутся по слагу (он уникален, имена "Python" и "python" - один тег): существующие - одним SELECT,
+недостающие создаются одним bulk_create(ignore_conflicts=True), после чего выбираются повторно
+(тег мог создать параллельный запрос). У поста добавляется и убирается только разница между
+нужным и текущим набором: промежуточная таблица не перезаписывается целиком. Вместо сигналов
+m2m_changed (по одному на add и remove) поисковый индекс, версия карточки, версии страниц в кэше и Tag.posts_count
+обновляются один раз на всё изменение.
+
+Tag.posts_count учитывает только посты, которые видны на странице тега (counted_posts): теги черновика
+и новости не считаются, при публикации и снятии с публикации (blog/signals.py) счётчики меняются на 1.
+"""
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils.text import slugify
+from unidecode import unidecode
+
+from . import autocomplete, page_cache, search
+from .models import Post, Tag
+
+
+def tag_slug(name):
+    # Так же, как Tag.save()
+    return slugify(unidecode(name))
+
+
+def get_or_create_tags(names):
+    """Теги с именами names (недостающие создаются); имена без слага пропускаются"""
+    names_by_slug = {}
+    for name in names:
+        slug = tag_slug(name)
+        if slug:
+            names_by_slug.setdefault(slug, name)
+
+    if not names_by_slug:
+        return []
+
+    tags = list(Tag.objects.filter(slug__in=names_by_slug))
+    missing = names_by_slug.keys() - {tag.slug for tag in tags}
+    if missing:
+        # bulk_create не вызывает Tag.save(), поэтому слаг задаётся явно
+        Tag.objects.bulk_create([Tag(name=names_by_slug[slug], slug=slug) for slug in missing], ignore_conflicts=True)
+        tags = list(Tag.objects.filter(slug__in=names_by_slug))
+        autocomplete.index_tags([tag for tag in tags if tag.slug in missing])
+
+    return tags
+
+
+def counted_posts():
+    """Посты, которые учитываются в Tag.posts_count: опубликованные, кроме новостей (как на странице тега)"""
+    return Post.objects.filter(status='published', news_item__isnull=True)
+
+
+def is_counted(post):
+    # Черновик не учитывается без запроса к базе
+    return post.status == 'published' and counted_posts().filter(id=post.pk).exists()
+
+
+def post_tag_ids(post_id):
+    return list(Post.tags.through.objects.filter(post_id=post_id).values_list('tag_id', flat=True))
+
+
+def change_tag_posts_count(tag_ids, delta):
+    if tag_ids and delta:
+        Tag.objects.filter(id__in=tag_ids).update(posts_count=Greatest(F('posts_count') + delta, Value(0)))
+        autocomplete.change_tag_weights(tag_ids, delta)
+
+
+def sync_post_tags(post, names):
+    """Приводит теги поста к names. Возвращает id добавленных и убранных тегов"""
+    through = Post.tags.through
+    with transaction.atomic():
+        desired = {tag.id for tag in get_or_create_tags(names)}
+        current = set(through.objects.filter(post_id=post.id).values_list('tag_id', flat=True))
+
+        removed, added = current - desired, desired - current
+        if not removed and not added:
+            return added, removed
+
+        counted = is_counted(post)
+        if removed:
+            through.objects.filter(post_id=post.id, tag_id__in=removed).delete()
+            if counted:
+                change_tag_posts_count(removed, -1)
+        if added:
+            through.objects.bulk_create(
+                [through(post_id=post.id, tag_id=tag_id) for tag_id in added], ignore_conflicts=True
+            )
+            if counted:
+                change_tag_posts_count(added, 1)
+
+        # То же, что делают сигналы m2m_changed для post.tags
+        search.index_posts([post.id])
+        Post.objects.filter(id=post.id).update(card_version=F('card_version') + 1)
+        page_cache.touch_posts([post.id])
+
+    return added, removed
@@ -0,0 +1,13 @@
+from django import template
+
+from ..feeds import attach_post_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """Карточка поста; обычно её HTML уже подготовлен во view через attach_post_cards"""
+    if not hasattr(post, 'card_html'):
+        attach_post_cards([post], context['request'])
+    return post.card_html
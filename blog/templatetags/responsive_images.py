@@ -0,0 +1,35 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from ..images import FORMATS
+
+register = template.Library()
+
+
+@register.inclusion_tag('blog/includes/responsive_image.html')
+def responsive_image(image, variants, alt='', sizes='100vw', css_class='', style='', loading='lazy'):
+    """
+    <picture> с srcset вариантов картинки (blog/images.py) и размерами оригинала.
+    Пока варианты не построены, выводится оригинал.
+    """
+    formats = variants.get('variants', {})
+    srcsets = {
+        key: ', '.join(f"{default_storage.url(item['name'])} {item['width']}w" for item in items)
+        for key, items in formats.items()
+    }
+    # <img> получает JPEG (поддерживается везде), остальные форматы браузер выбирает из <source>
+    fallback = 'jpeg' if 'jpeg' in formats else next(reversed(formats), None)
+    sources = [{'type': FORMATS[key][2], 'srcset': srcset} for key, srcset in srcsets.items() if key != fallback]
+
+    return {
+        'src': default_storage.url(formats[fallback][-1]['name']) if fallback else image.url,
+        'srcset': srcsets.get(fallback, ''),
+        'sources': sources,
+        'width': variants.get('width'),
+        'height': variants.get('height'),
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'loading': loading,
+    }
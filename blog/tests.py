@@ -1,3 +1,1475 @@
-from django.test import TestCase
+import math
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from config.db_router import PIN_COOKIE, replica_reads
+
+from . import autocomplete, feeds, page_cache, search, timeline
+from .models import Post, News, Category, Tag, Comment, Reaction, SiteStatistics, EmailNotificationJob, ViewCounterFlush
+from .models import TimelineEntry
+from .admin import change_status
+from .management.commands import check_query_plans
+from .comment_tree import load_replies, load_root_comments
+from .images import process_pending, variant_names
+from .notifications import claim_jobs, process_job, process_pending_jobs
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_keyset
+from .query_budget import QueryBudgetTestMixin, sql_shape
+from .search import russian_stem
+from .seen_posts import SEEN_POSTS_COOKIE, SeenPosts, decode_ids, encode_ids
+from .tags import get_or_create_tags, sync_post_tags
+from .reactions import toggle_reaction
+from .view_buffer import buffer as view_buffer
+
+User = get_user_model()
+
+# Фоновый сброс буфера просмотров в тестах не нужен: тесты сбрасывают его сами.
+# Общий кэш - в памяти, отдельно от кэша по умолчанию
+TEST_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'VIEW_BUFFER_FLUSH_INTERVAL': 3600,
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+    },
+}
+
+
+def create_dataset():
+    """Небольшой набор данных: авторы, посты с тегами, комментарии с ответами и реакции"""
+    authors = [
+        User.objects.create_user(username=f'author{i}', email=f'author{i}@example.com', password='password')
+        for i in range(3)
+    ]
+    reader = User.objects.create_user(username='reader', email='reader@example.com', password='password')
+
+    categories = [Category.objects.create(name=name) for name in ('Наука', 'Техника')]
+    tags = [Tag.objects.create(name=name) for name in ('python', 'django', 'sqlite')]
+
+    posts = []
+    for i in range(20):
+        post = Post.objects.create(
+            title=f'Пост номер {i}',
+            text=f'Текст поста {i} про python и базы данных',
+            author=authors[i % len(authors)],
+            category=categories[i % len(categories)],
+            status='published'
+        )
+        post.tags.add(*tags[:i % len(tags) + 1])
+        posts.append(post)
+
+    Post.objects.create(title='Черновик', text='Текст', author=authors[0], category=categories[0])
+
+    for post in posts[:5]:
+        toggle_reaction(post, reader, 'like')
+        post.favorites.add(reader)
+
+    for i in range(5):
+        root = Comment.objects.create(post=posts[0], author=authors[i % len(authors)], text=f'Комментарий {i}')
+        reply = Comment.objects.create(post=posts[0], author=reader, parent=root, text=f'Ответ {i}')
+        Comment.objects.create(post=posts[0], author=authors[0], parent=reply, text=f'Ответ на ответ {i}')
+
+    # Строка статистики создаётся первым запросом к сайту - в бюджетах её создание не учитываем
+    SiteStatistics.recompute()
+
+    return authors, reader, posts
+
+
+@override_settings(**TEST_SETTINGS)
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors, cls.reader, cls.posts = create_dataset()
+
+    def setUp(self):
+        cache.clear()
+        caches['shared'].clear()
+
+    def tearDown(self):
+        view_buffer.take()
+
+
+STATISTICS_TOTALS = ('total_posts', 'total_authors', 'total_comments', 'total_favorites', 'total_views', 'total_likes')
+
+
+class CounterSignalTests(QueryBudgetTestCase):
+    def test_favorites_and_comments(self):
+        post = self.posts[6]
+        post.favorites.add(*self.authors)
+        root = Comment.objects.create(post=post, author=self.reader, text='Комментарий')
+        Comment.objects.create(post=post, author=self.authors[0], parent=root, text='Ответ')
+
+        post.refresh_from_db()
+        self.assertEqual((post.favorites_count, post.comments_count), (3, 2))
+        self.assertEqual(Comment.objects.get(id=root.id).replies_count, 1)
+
+        # Ответ удаляется каскадно со своим сигналом
+        root.delete()
+        post.favorites.remove(self.authors[0])
+        post.refresh_from_db()
+        self.assertEqual((post.favorites_count, post.comments_count), (2, 0))
+
+    def test_clear_from_both_sides(self):
+        self.posts[6].favorites.add(self.reader)
+        self.reader.favorite_posts.clear()
+        self.assertFalse(Post.objects.filter(favorites_count__gt=0).exists())
+
+        self.posts[0].favorites.add(*self.authors)
+        self.posts[0].favorites.clear()
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].favorites_count, 0)
+
+
+class SiteStatisticsTests(QueryBudgetTestCase):
+    def totals(self):
+        return SiteStatistics.objects.values(*STATISTICS_TOTALS).get()
+
+    def assertMatchesRecompute(self):
+        totals = self.totals()
+        SiteStatistics.recompute()
+        self.assertEqual(totals, self.totals())
+
+    def test_initial_snapshot(self):
+        self.assertEqual(self.totals(), {
+            'total_posts': 20, 'total_authors': 3, 'total_comments': 15,
+            'total_favorites': 5, 'total_views': 0, 'total_likes': 5,
+        })
+
+    def test_deltas_on_status_changes(self):
+        draft = Post.objects.get(title='Черновик')
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(self.totals()['total_posts'], 21)
+
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='password')
+        post = Post.objects.create(title='Первый пост', text='Текст', author=newcomer, status='published')
+        post.favorites.add(self.reader)
+        self.assertEqual(self.totals()['total_authors'], 4)
+
+        post.status = 'draft'
+        post.save()
+        self.assertEqual(self.totals()['total_authors'], 3)
+        self.assertMatchesRecompute()
+
+    def test_deltas_on_news_and_delete(self):
+        # Лайк, избранное и 15 комментариев поста 0 уходят из статистики вместе с ним
+        News.objects.create(post_item=self.posts[1], is_important=False, news_type='update', pinned=False)
+        self.posts[0].delete()
+        self.assertEqual(self.totals()['total_posts'], 18)
+        self.assertMatchesRecompute()
+
+    def test_counter_deltas_skip_drafts(self):
+        draft = Post.objects.get(title='Черновик')
+        draft.favorites.add(self.reader)
+        Comment.objects.create(post=draft, author=self.reader, text='Комментарий')
+        toggle_reaction(draft, self.reader, 'like')
+        self.assertEqual(self.totals()['total_favorites'], 5)
+        self.assertMatchesRecompute()
+
+
+class KeysetCursorTests(QueryBudgetTestCase):
+    ordering = ('-created_at', '-id')
+
+    def test_roundtrip(self):
+        post = self.posts[3]
+        values = decode_cursor(encode_cursor(post, self.ordering), Post, self.ordering)
+        self.assertEqual(values, [post.created_at, post.id])
+
+    def test_invalid_cursors(self):
+        cursor = encode_cursor(self.posts[3], self.ordering)
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+
+        for broken in ('', 'broken', tampered):
+            with self.subTest(cursor=broken), self.assertRaises(InvalidCursor):
+                decode_cursor(broken, Post, self.ordering)
+        # Курсор другой сортировки
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor, Post, ('-favorites_count', '-created_at', '-id'))
+
+    def test_pages_with_equal_sort_keys(self):
+        # Одинаковое время создания: порядок и границы страниц задаёт id
+        Post.objects.update(created_at=self.posts[0].created_at)
+        queryset = Post.objects.filter(status='published')
+
+        seen, cursor = [], None
+        while True:
+            posts, has_more, cursor = paginate_keyset(queryset, self.ordering, 7, cursor=cursor)
+            seen += [post.id for post in posts]
+            if not has_more:
+                break
+
+        self.assertEqual(seen, sorted((post.id for post in self.posts), reverse=True))
+
+    def test_load_more_with_tampered_cursor(self):
+        response = self.client.get(reverse('blog:post_list'))
+        cursor = response.context['next_cursor']
+        response = self.client.get(reverse('blog:load_more_posts'), {'cursor': cursor.replace(':', ':x', 1)})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchNormalizationTests(TestCase):
+    def test_russian_stem(self):
+        # Ожидаемые основы - как у эталонного Snowball
+        stems = {
+            'книгами': 'книг',
+            'красивая': 'красив',
+            'читать': 'чита',
+            'программирование': 'программирован',
+            'бегущий': 'бегущ',
+            'важнейшие': 'важн',
+            'ёлки': 'елк',
+        }
+        for word, stem in stems.items():
+            with self.subTest(word=word):
+                self.assertEqual(russian_stem(word), stem)
+
+    def test_word_forms_and_transliteration_match(self):
+        self.assertEqual(search.normalize('Привет'), search.normalize('привета'))
+        self.assertEqual(search.normalize('привета'), search.normalize('privet'))
+
+    def test_match_query_has_no_fts_syntax(self):
+        terms = search.normalize_terms('C++ "OR" NEAR( *')
+        self.assertEqual(terms, ['c', 'or', 'near'])
+        self.assertEqual(
+            search.build_match_query(terms, ['title', 'text']),
+            '{title text} : ("c"* AND "or"* AND "near"*)'
+        )
+
+
+class SearchIndexTests(QueryBudgetTestCase):
+    def search(self, query, **kwargs):
+        return [post.title for post in search.SearchResults(query, **kwargs)[:30]]
+
+    def test_finds_published_posts_only(self):
+        self.assertEqual(self.search('номер 3'), ['Пост номер 3'])
+        self.assertEqual(self.search('черновик'), [])
+
+        News.objects.create(post_item=self.posts[3], is_important=False, news_type='update', pinned=False)
+        self.assertEqual(self.search('номер 3'), [])
+
+    def test_index_follows_changes(self):
+        post = self.posts[4]
+        post.title = 'Астероиды'
+        post.save()
+        self.assertEqual(self.search('астероидами'), ['Астероиды'])
+        self.assertEqual(search.SearchResults('номер 4').count(), 0)
+
+        self.assertEqual(self.search('django', search_tag=True).count('Астероиды'), 1)
+        Category.objects.filter(id=post.category_id).update(name='Астрономия')
+        Category.objects.get(id=post.category_id).save()
+        self.assertIn('Астероиды', self.search('астрономия', search_category=True))
+
+    def test_rebuild_if_empty(self):
+        call_command('rebuild_search_index', '--if-empty', stdout=StringIO())
+        self.assertFalse(search.is_index_empty())
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+        self.assertEqual(self.search('номер 3'), [])
+        call_command('rebuild_search_index', '--if-empty', stdout=StringIO())
+        self.assertEqual(self.search('номер 3'), ['Пост номер 3'])
+
+
+class CommentTreeTests(QueryBudgetTestCase):
+    def test_paths(self):
+        root = Comment.objects.filter(post=self.posts[0], parent__isnull=True).first()
+        reply = root.replies.get()
+        nested = reply.replies.get()
+
+        self.assertEqual(root.path, Comment.build_path('', root.id))
+        self.assertEqual(nested.path, root.path + Comment.build_path('', reply.id) + Comment.build_path('', nested.id))
+        self.assertEqual((root.depth, reply.depth, nested.depth), (0, 1, 2))
+        self.assertEqual(
+            list(Comment.objects.filter(Comment.subtree_filter(root.path)).order_by('path')),
+            [root, reply, nested]
+        )
+
+    def test_roots_with_trees(self):
+        roots, has_more, cursor = load_root_comments(self.posts[0], 3)
+        self.assertEqual([root.text for root in roots], ['Комментарий 4', 'Комментарий 3', 'Комментарий 2'])
+        self.assertTrue(has_more)
+        self.assertEqual(roots[0].children[0].text, 'Ответ 4')
+        self.assertEqual(roots[0].children[0].children[0].text, 'Ответ на ответ 4')
+        self.assertFalse(roots[0].has_more_replies)
+
+        roots, has_more, _ = load_root_comments(self.posts[0], 3, cursor=cursor)
+        self.assertEqual([root.text for root in roots], ['Комментарий 1', 'Комментарий 0'])
+        self.assertFalse(has_more)
+
+    @override_settings(COMMENTS_TREE_MAX_DEPTH=1)
+    def test_depth_limit(self):
+        roots, _, _ = load_root_comments(self.posts[0], 5)
+        reply = roots[0].children[0]
+        self.assertEqual(reply.children, [])
+        self.assertTrue(reply.has_more_replies)
+
+    @override_settings(COMMENTS_TREE_MAX_NODES=4)
+    def test_nodes_limit(self):
+        roots, _, _ = load_root_comments(self.posts[0], 5)
+        # Ответы порции читаются в порядке path: два первых корня (по path) - полностью, остальные - без ответов
+        self.assertEqual(sum(not root.has_more_replies for root in roots), 2)
+        self.assertTrue(all(root.children == [] for root in roots if root.has_more_replies))
+
+    def test_load_more_replies(self):
+        root = Comment.objects.create(post=self.posts[1], author=self.reader, text='Корень')
+        for i in range(5):
+            Comment.objects.create(post=self.posts[1], author=self.authors[0], parent=root, text=f'Ответ {i}')
+        root.refresh_from_db()
+
+        roots, _, _ = load_root_comments(self.posts[1], 1)
+        self.assertEqual(len(roots[0].children), 5)
+
+        replies, has_more, cursor = load_replies(root, 2)
+        self.assertEqual([reply.text for reply in replies], ['Ответ 0', 'Ответ 1'])
+        replies, has_more, cursor = load_replies(root, 2, cursor=cursor)
+        self.assertEqual([reply.text for reply in replies], ['Ответ 2', 'Ответ 3'])
+        self.assertTrue(has_more)
+
+    def test_rebuild_legacy_paths(self):
+        Comment.objects.update(path='', depth=0, replies_count=0)
+        call_command('rebuild_comment_tree', '--if-needed', stdout=StringIO())
+
+        roots, _, _ = load_root_comments(self.posts[0], 5)
+        self.assertEqual([len(root.children) for root in roots], [1] * 5)
+        self.assertEqual(roots[0].children[0].children[0].depth, 2)
+
+
+class PostFeedQueryBudgetTests(QueryBudgetTestCase):
+    def test_post_list_anonymous(self):
+        with self.assertQueryBudget(3, max_duplicates=0):
+            response = self.client.get(reverse('blog:post_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), 6)
+
+    def test_post_list_authenticated(self):
+        self.client.force_login(self.reader)
+        for filter_type in ('all', 'trending', 'popular', 'following'):
+            with self.subTest(filter=filter_type):
+                cache.clear()
+                with self.assertQueryBudget(8, max_duplicates=0):
+                    response = self.client.get(reverse('blog:post_list'), {'filter': filter_type})
+                self.assertEqual(response.status_code, 200)
+
+    def test_post_list_reads_cards_from_cache(self):
+        self.client.get(reverse('blog:post_list'))
+        # Карточки уже в кэше: теги не подгружаются
+        with self.assertQueryBudget(2, max_duplicates=0):
+            self.client.get(reverse('blog:post_list'))
+
+    def test_post_list_empty(self):
+        Post.objects.all().delete()
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_load_more_posts(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('blog:post_list'))
+        cursor = response.context['next_cursor']
+
+        with self.assertQueryBudget(5, max_duplicates=0):
+            response = self.client.get(reverse('blog:load_more_posts'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_more'])
+
+    def test_load_more_posts_does_not_repeat_posts(self):
+        seen = []
+        data = {'offset': 0}
+        while True:
+            response = self.client.get(reverse('blog:load_more_posts'), {'filter': 'popular', **data})
+            payload = response.json()
+            seen += [post_id for post_id in range(1, 100) if f'/posts/{post_id}/toggle-favorite/' in payload['html']]
+            if not payload['has_more']:
+                break
+            data = {'cursor': payload['next_cursor']}
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), len(self.posts))
+
+    def test_load_more_posts_invalid_cursor(self):
+        response = self.client.get(reverse('blog:load_more_posts'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_search(self):
+        # Внутри транзакции теста search.ensure_search_index не запоминает таблицу FTS,
+        # поэтому CREATE VIRTUAL TABLE IF NOT EXISTS выполняется дважды
+        with self.assertQueryBudget(6, max_duplicates=1):
+            response = self.client.get(reverse('blog:post_search'), {'search': 'python'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['posts'])
+
+
+class PostCardCacheTests(QueryBudgetTestCase):
+    def render_card(self, post, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or self.reader
+        request.resolver_match = None
+        post = feeds.feed_queryset(Post.objects.all()).get(id=post.id)
+        return feeds.attach_post_cards([post], request)[0].card_html
+
+    def card_version(self, post):
+        return Post.objects.get(id=post.id).card_version
+
+    def test_card_rendered_from_cache(self):
+        post = self.posts[0]
+        first = self.render_card(post)
+        self.assertIsNotNone(cache.get(feeds.card_cache_key(Post.objects.get(id=post.id))))
+        self.assertIn('bi-bookmark-fill', first)
+
+        # Та же карточка из кэша для другого пользователя: своё состояние, теги не подгружаются
+        # (запросы - пост и состояние пользователя)
+        with self.assertNumQueries(2):
+            other = self.render_card(post, self.authors[1])
+        self.assertIn('bi-bookmark"', other)
+        self.assertNotIn('bi-bookmark-fill', other)
+
+    def test_marker_text_in_post(self):
+        post = self.posts[1]
+        post.title = '[[post-card:favorite_icon]] [[post-card:own_badge]]'
+        post.save()
+
+        html = self.render_card(post)
+        self.assertIn('[[post-card:favorite_icon]] [[post-card:own_badge]]', html)
+        self.assertNotIn('[[post-card:', html.replace(post.title, ''))
+
+    def test_card_version_bumps(self):
+        post = self.posts[2]
+        changes = {
+            'save': lambda: Post.objects.get(id=post.id).save(),
+            'counter': lambda: Comment.objects.create(post=post, author=self.reader, text='Новый комментарий'),
+            'favorites': lambda: post.favorites.add(self.authors[0]),
+            'tags': lambda: post.tags.remove(Tag.objects.get(name='python')),
+            'tag rename': lambda: Tag.objects.filter(name='django').first().save(),
+            'category rename': lambda: Category.objects.get(id=post.category_id).save(),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                self.render_card(post)
+                version = self.card_version(post)
+                change()
+                self.assertGreater(self.card_version(post), version)
+
+    def test_changes_rendered(self):
+        post = self.posts[2]
+        self.render_card(post)
+
+        Post.objects.filter(id=post.id).first().tags.remove(Tag.objects.get(name='python'))
+        category = Category.objects.get(id=post.category_id)
+        category.name = 'Переименованная категория'
+        category.save()
+        Comment.objects.create(post=post, author=self.reader, text='Новый комментарий')
+
+        html = self.render_card(post)
+        self.assertNotIn('#python', html)
+        self.assertIn('Переименованная категория', html)
+        self.assertIn(f'{Post.objects.get(id=post.id).comments_count}', html)
+
+
+class PostDetailQueryBudgetTests(QueryBudgetTestCase):
+    def test_post_detail(self):
+        self.client.force_login(self.reader)
+        post = self.posts[0]
+
+        with self.assertQueryBudget(7, max_duplicates=0):
+            response = self.client.get(reverse('blog:post_detail', args=[post.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['comments']), 5)
+
+    def test_post_detail_buffers_views(self):
+        post = self.posts[1]
+        self.client.get(reverse('blog:post_detail', args=[post.slug]))
+        self.client.get(reverse('blog:post_detail', args=[post.slug]))
+
+        post.refresh_from_db()
+        self.assertEqual(post.views, 0)
+
+        view_buffer.flush()
+        post.refresh_from_db()
+        self.assertEqual(post.views, 1)
+
+    def test_post_detail_remembers_views_in_cookie(self):
+        url = reverse('blog:post_detail', args=[self.posts[1].slug])
+        response = self.client.get(url)
+        self.assertIn(SEEN_POSTS_COOKIE, response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+        # Повторный просмотр ничего не пишет
+        response = self.client.get(url)
+        self.assertNotIn(SEEN_POSTS_COOKIE, response.cookies)
+        self.assertEqual(view_buffer.pending_views(self.posts[1].id), 1)
+
+        # Поддельная cookie не учитывается
+        self.client.cookies[SEEN_POSTS_COOKIE] = encode_ids([self.posts[1].id])
+        self.client.get(url)
+        self.assertEqual(view_buffer.pending_views(self.posts[1].id), 2)
+
+
+class ViewBufferTests(QueryBudgetTestCase):
+    def test_flush_writes_views_and_viewers(self):
+        draft = Post.objects.get(title='Черновик')
+        Post.objects.update(trending_dirty=False)
+        for _ in range(3):
+            view_buffer.record(self.posts[0].id, self.reader.id)
+        view_buffer.record(self.posts[1].id)
+        view_buffer.record(draft.id, self.reader.id)
+
+        with self.assertQueryBudget(8):
+            self.assertEqual(view_buffer.flush(), 5)
+
+        views = dict(Post.objects.filter(views__gt=0).values_list('id', 'views'))
+        self.assertEqual(views, {self.posts[0].id: 3, self.posts[1].id: 1, draft.id: 1})
+        self.assertEqual(set(Post.objects.filter(trending_dirty=True).values_list('id', flat=True)), set(views))
+        self.assertEqual(set(self.reader.viewed_posts.values_list('id', flat=True)), {self.posts[0].id, draft.id})
+        # Просмотры черновика в статистику не входят
+        self.assertEqual(SiteStatistics.load().total_views, 4)
+
+        flush = ViewCounterFlush.objects.get()
+        self.assertEqual((flush.posts, flush.views, flush.viewers), (3, 5, 2))
+        self.assertEqual(view_buffer.stats()['posts'], 0)
+        self.assertEqual(view_buffer.flush(), 0)
+
+    def test_repeated_viewer_written_once(self):
+        view_buffer.record(self.posts[0].id, self.reader.id)
+        view_buffer.flush()
+        view_buffer.record(self.posts[0].id, self.reader.id, count_view=False)
+        view_buffer.flush()
+        self.assertEqual(self.reader.viewed_posts.count(), 1)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).views, 1)
+
+    def test_failed_flush_keeps_views(self):
+        view_buffer.record(self.posts[0].id, self.reader.id)
+        with mock.patch('blog.view_buffer.write_views', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('blog.view_buffer', level='ERROR'):
+                self.assertEqual(view_buffer.flush(), 0)
+
+        self.assertEqual(view_buffer.pending_views(self.posts[0].id), 1)
+        self.assertTrue(view_buffer.is_viewed(self.posts[0].id, self.reader.id))
+        self.assertEqual(view_buffer.flush(), 1)
+
+    @override_settings(VIEW_BUFFER_FLUSH_INTERVAL=0)
+    def test_immediate_flush_without_interval(self):
+        view_buffer.record(self.posts[0].id)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).views, 1)
+        self.assertEqual(view_buffer.pending_views(self.posts[0].id), 0)
+
+
+class TrendingScoreTests(QueryBudgetTestCase):
+    def score(self, created_at, **counters):
+        return Post(created_at=created_at, **counters).calculate_trending_score()
+
+    def test_formula(self):
+        created_at = Post.TRENDING_EPOCH
+        # Вес активности: 3 * 2 лайка + 4 * 1 комментарий
+        self.assertAlmostEqual(self.score(created_at, likes_count=2, comments_count=1), math.log(11))
+
+        # Пост моложе на период полураспада равен более старому с вдвое большей (1 + активность)
+        half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+        self.assertAlmostEqual(
+            self.score(created_at + half_life, views=4),
+            self.score(created_at, views=9)
+        )
+
+    def test_new_post_scored_on_creation(self):
+        post = Post.objects.create(title='Новый пост', text='Текст', author=self.authors[0], status='published')
+        self.assertAlmostEqual(post.trending_score, post.calculate_trending_score())
+        self.assertGreater(post.trending_score, self.posts[-1].trending_score)
+
+    def test_dirty_posts_recomputed(self):
+        Post.objects.update(trending_dirty=False)
+        post = self.posts[3]
+        post.favorites.add(*self.authors)
+        self.assertEqual(list(Post.objects.filter(trending_dirty=True)), [post])
+
+        call_command('recompute_trending_scores', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertFalse(post.trending_dirty)
+        self.assertAlmostEqual(post.trending_score, post.calculate_trending_score())
+
+        # Лента "В тренде": активный пост выше более новых
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('blog:post_list'), {'filter': 'trending'})
+        self.assertEqual(response.context['posts'][0], post)
+
+    @override_settings(TRENDING_WEIGHTS={'views': 1})
+    def test_recompute_all(self):
+        Post.objects.update(trending_dirty=False)
+        call_command('recompute_trending_scores', '--all', stdout=StringIO())
+        post = Post.objects.get(id=self.posts[0].id)
+        self.assertAlmostEqual(post.trending_score, self.score(post.created_at))
+
+
+class FollowingFeedTests(QueryBudgetTestCase):
+    def feed_ids(self, user, limit=3):
+        ids, cursor = [], None
+        while True:
+            posts, has_more, cursor = timeline.load_following_feed(user, limit, cursor=cursor)
+            ids += [post.id for post in posts]
+            if not has_more:
+                return ids
+
+    def expected_ids(self, *authors):
+        return list(
+            timeline.feed_posts().filter(author__in=authors).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_follow_backfills_and_unfollow_cleans_up(self):
+        author = self.authors[0]
+        self.assertTrue(timeline.follow(self.reader, author))
+        self.assertFalse(timeline.follow(self.reader, author))
+        self.assertEqual(User.objects.get(id=author.id).followers_count, 1)
+        self.assertEqual(
+            sorted(TimelineEntry.objects.filter(user=self.reader).values_list('post_id', flat=True)),
+            sorted(self.expected_ids(author))
+        )
+
+        self.assertTrue(timeline.unfollow(self.reader, author))
+        self.assertFalse(timeline.unfollow(self.reader, author))
+        self.assertEqual(User.objects.get(id=author.id).followers_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=2)
+    def test_backfill_size(self):
+        timeline.follow(self.reader, self.authors[0])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 2)
+
+    def test_fan_out_on_publish(self):
+        timeline.follow(self.reader, self.authors[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Новый пост', text='Текст', author=self.authors[1], status='published')
+            draft = Post.objects.create(title='Новый черновик', text='Текст', author=self.authors[1])
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertFalse(TimelineEntry.objects.filter(post=draft).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.status = 'published'
+            draft.save()
+        self.assertEqual(self.feed_ids(self.reader)[:2], [draft.id, post.id])
+
+    def test_removed_on_unpublish_and_news(self):
+        timeline.follow(self.reader, self.authors[0])
+        unpublished, news = self.posts[0], self.posts[3]
+
+        unpublished.status = 'draft'
+        unpublished.save()
+        News.objects.create(post_item=news, is_important=False, news_type='update', pinned=False)
+
+        self.assertFalse(TimelineEntry.objects.filter(post__in=[unpublished, news]).exists())
+        self.assertNotIn(unpublished.id, self.feed_ids(self.reader))
+        self.assertNotIn(news.id, self.feed_ids(self.reader))
+
+    def test_admin_status_actions(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin)
+        timeline.follow(self.reader, self.authors[0])
+        post = self.posts[0]
+
+        def run_action(action):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('admin:blog_post_changelist'), {'action': action, '_selected_action': [post.id]})
+
+        run_action('make_draft')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertNotIn(post.id, self.feed_ids(self.reader))
+        self.assertEqual(SiteStatistics.load().total_posts, 19)
+
+        run_action('make_published')
+        self.assertIn(post.id, self.feed_ids(self.reader))
+        self.assertEqual(SiteStatistics.load().total_posts, 20)
+
+    def test_stale_entries_hidden(self):
+        timeline.follow(self.reader, self.authors[0])
+        # UPDATE без сигналов оставляет запись в ленте
+        Post.objects.filter(id=self.posts[0].id).update(status='draft')
+        self.assertNotIn(self.posts[0].id, self.feed_ids(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_paging_across_fan_out_and_pull(self):
+        # authors[0] становится "крупным" (2 подписчика) уже после раскладки постов для reader:
+        # его посты есть и в TimelineEntry, и среди дочитываемых - повторов быть не должно
+        timeline.follow(self.reader, self.authors[0])
+        timeline.follow(self.authors[2], self.authors[0])
+        timeline.follow(self.reader, self.authors[1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pulled = Post.objects.create(title='Пост крупного автора', text='Текст', author=self.authors[0], status='published')
+        self.assertFalse(TimelineEntry.objects.filter(post=pulled).exists())
+
+        # Одинаковое время создания у части постов: порядок внутри задаёт id
+        Post.objects.filter(id__in=[self.posts[0].id, self.posts[1].id]).update(created_at=self.posts[4].created_at)
+        TimelineEntry.objects.filter(post_id__in=[self.posts[0].id, self.posts[1].id]).update(
+            created_at=self.posts[4].created_at
+        )
+
+        for limit in (1, 3, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.feed_ids(self.reader, limit), self.expected_ids(self.authors[0], self.authors[1]))
+
+
+class SeenPostsTests(TestCase):
+    def test_encoding_roundtrip(self):
+        ids = [1, 2, 127, 128, 300, 16384, 10 ** 9]
+        self.assertEqual(decode_ids(encode_ids(ids)), ids)
+        self.assertEqual(decode_ids('не base64'), [])
+
+    @override_settings(SEEN_POSTS_MAX_IDS=3)
+    def test_oldest_posts_forgotten(self):
+        seen = SeenPosts([5, 1, 3])
+        self.assertFalse(seen.add(3))
+        self.assertFalse(seen.changed)
+
+        self.assertTrue(seen.add(4))
+        self.assertEqual(seen.ids, [3, 4, 5])
+        self.assertNotIn(1, seen)
+
+
+class TagSyncTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        # У поста 2 теги python, django и sqlite
+        self.post = self.posts[2]
+        self.client.force_login(self.post.author)
+
+    def edit(self, tags):
+        return self.client.post(reverse('blog:edit_post', args=[self.post.id]), {
+            'title': self.post.title,
+            'text': self.post.text,
+            'category': self.post.category_id,
+            'tags_input': tags,
+        })
+
+    def test_posts_count(self):
+        self.assertEqual(dict(Tag.objects.values_list('name', 'posts_count')), {'python': 20, 'django': 13, 'sqlite': 6})
+
+        self.post.tags.clear()
+        Tag.objects.get(name='python').posts.remove(self.posts[0])
+        self.posts[3].delete()
+        self.assertEqual(dict(Tag.objects.values_list('name', 'posts_count')), {'python': 17, 'django': 12, 'sqlite': 5})
+
+    def test_posts_count_published_only(self):
+        def counts():
+            return dict(Tag.objects.values_list('name', 'posts_count'))
+
+        python = Tag.objects.get(name='python')
+        draft = Post.objects.get(title='Черновик')
+        draft.tags.add(python)
+        python.posts.add(draft)
+        sync_post_tags(draft, ['python', 'django'])
+        self.assertEqual(counts(), {'python': 20, 'django': 13, 'sqlite': 6})
+
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(counts(), {'python': 21, 'django': 14, 'sqlite': 6})
+
+        # Снятие с публикации (как в админке) и пост, ставший новостью
+        change_status(Post.objects.filter(id__in=[draft.id, self.posts[0].id]), 'draft')
+        news = News.objects.create(post_item=self.posts[3], is_important=False, news_type='update', pinned=False)
+        self.assertEqual(counts(), {'python': 18, 'django': 13, 'sqlite': 6})
+
+        news.delete()
+        self.assertFalse(Post.objects.filter(id=self.posts[3].id).exists())
+        self.assertEqual(counts(), {'python': 18, 'django': 13, 'sqlite': 6})
+
+        # Пост-новость удаляется вместе с новостью каскадом
+        News.objects.create(post_item=self.posts[6], is_important=False, news_type='update', pinned=False)
+        self.posts[6].delete()
+        self.posts[1].delete()
+        draft.delete()
+        self.assertEqual(counts(), {'python': 16, 'django': 12, 'sqlite': 6})
+
+        out = StringIO()
+        call_command('rebuild_post_counters', stdout=out)
+        self.assertIn('Исправлено тегов: 0', out.getvalue())
+
+    def test_rename_keeps_posts_count(self):
+        tag = Tag.objects.get(name='sqlite')
+        # Счётчик изменился после загрузки тега (например, в форме админки)
+        self.posts[2].tags.remove(tag)
+
+        tag.name = 'SQLite'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(Tag.objects.get(id=tag.id).posts_count, 5)
+        self.assertEqual(tag.posts_count, 5)
+
+    def test_edit_changes_only_delta(self):
+        through = Post.tags.through
+        kept = set(through.objects.filter(post=self.post, tag__name__in=['python', 'django']).values_list('id', flat=True))
+
+        with self.assertQueryBudget(30):
+            response = self.edit('python, Django, rust, go')
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(set(self.post.tags.values_list('name', flat=True)), {'python', 'django', 'rust', 'go'})
+        # Оставшиеся теги не удалялись и не вставлялись заново
+        self.assertTrue(kept <= set(through.objects.filter(post=self.post).values_list('id', flat=True)))
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'posts_count')),
+            {'python': 20, 'django': 13, 'sqlite': 5, 'rust': 1, 'go': 1}
+        )
+
+    def test_edit_without_changes(self):
+        with self.assertQueryBudget(17) as recorder:
+            self.edit('sqlite, django, python')
+        self.assertFalse([sql for sql in recorder.shapes if 'blog_posts_tags' in sql and 'SELECT' not in sql])
+
+    def test_budget_does_not_depend_on_tag_count(self):
+        names = [f'tag{i}' for i in range(10)]
+        with self.assertQueryBudget(30):
+            self.edit(', '.join(names))
+        self.assertEqual(set(self.post.tags.values_list('name', flat=True)), set(names))
+
+    def test_tags_with_same_slug(self):
+        tags = get_or_create_tags(['Rust', 'rust', 'RUST', '???'])
+        self.assertEqual([tag.slug for tag in tags], ['rust'])
+        self.assertEqual(get_or_create_tags(['rust'])[0].id, tags[0].id)
+
+
+class AutocompleteTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete.index.reset()
+
+    def suggest(self, **params):
+        response = self.client.get(reverse('blog:autocomplete'), params)
+        return [(item['kind'], item['name'], item['count']) for item in response.json()['results']]
+
+    def test_ranked_by_usage_without_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Pytest')
+            Category.objects.create(name='Python')
+        self.assertEqual(
+            self.suggest(q='PY'),
+            [('tag', 'python', 20), ('tag', 'Pytest', 0), ('category', 'Python', 0)]
+        )
+
+        with self.assertQueryBudget(0):
+            self.assertEqual(self.suggest(q='те', kind='category'), [('category', 'Техника', 10)])
+
+    def test_incremental_updates(self):
+        self.suggest(q='r')
+        post = self.posts[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_post_tags(post, ['rust', 'python'])
+        self.assertEqual(self.suggest(q='ru'), [('tag', 'rust', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_post_tags(post, ['python'])
+            Tag.objects.filter(name='sqlite').delete()
+        self.assertEqual(self.suggest(q='ru'), [('tag', 'rust', 0)])
+        self.assertEqual(self.suggest(q='sql'), [])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('blog:autocomplete'), {'q': 'py', 'kind': 'user'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('blog:autocomplete'), {'q': 'py', 'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.suggest(q=' '), [])
+
+
+class PageCacheTests(QueryBudgetTestCase):
+    def test_anonymous_pages_served_from_cache(self):
+        urls = [
+            reverse('blog:main_page'),
+            reverse('blog:post_list') + '?filter=popular',
+            self.posts[0].category.get_absolute_url(),
+            self.posts[0].tags.first().get_absolute_url(),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+            with self.assertQueryBudget(0):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'hit')
+            self.assertEqual(response.status_code, 200)
+
+        # Страница поста: из базы только id и время изменения по слагу
+        url = reverse('blog:post_detail', args=[self.posts[0].slug])
+        self.client.get(url)
+        with self.assertQueryBudget(1):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Комментарий 0')
+
+    def test_conditional_get(self):
+        url = reverse('blog:post_detail', args=[self.posts[1].slug])
+        response = self.client.get(url)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(view_buffer.pending_views(self.posts[1].id), 1)
+
+    def test_purged_when_post_changes(self):
+        post = self.posts[10]
+        url = reverse('blog:post_detail', args=[post.slug])
+        etag = self.client.get(url)['ETag']
+        list_url = reverse('blog:post_list')
+        self.client.get(list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_reaction(post, self.reader, 'like')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response.context['likes_count'], 1)
+        self.assertEqual(self.client.get(list_url)['X-Page-Cache'], 'miss')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=post, author=self.reader, text='Новый комментарий')
+        self.assertContains(self.client.get(url), 'Новый комментарий')
+
+        # Другие посты не сбрасываются
+        other_url = reverse('blog:post_detail', args=[self.posts[11].slug])
+        self.client.get(other_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_reaction(post, self.reader, 'dislike')
+        self.assertEqual(self.client.get(other_url)['X-Page-Cache'], 'hit')
+
+    def test_theme_in_key(self):
+        url = reverse('blog:post_list')
+        self.client.get(url)
+        self.client.post(reverse('users:toggle_theme'))
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response.context['current_theme'], 'light')
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertNotIn('ETag', response)
+
+    def test_versions_in_shared_cache(self):
+        list_url = reverse('blog:post_list')
+        self.client.get(list_url)
+        key = page_cache.version_key(page_cache.LISTS)
+        self.assertIsNone(cache.get(key))
+
+        # Версию сдвинул другой процесс: в общем кэше она новая, страница этого процесса устарела
+        caches['shared'].set(key, caches['shared'].get(key) + 1, None)
+        self.assertEqual(self.client.get(list_url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(list_url)['X-Page-Cache'], 'hit')
+
+    def test_purged_by_admin_actions(self):
+        admin_client = self.client_class()
+        admin_client.force_login(
+            User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        )
+
+        def run_action(model, action, ids):
+            with self.captureOnCommitCallbacks(execute=True):
+                admin_client.post(reverse(f'admin:blog_{model}_changelist'), {'action': action, '_selected_action': ids})
+
+        post = self.posts[12]
+        url = reverse('blog:post_detail', args=[post.slug])
+        list_url = reverse('blog:post_list')
+        etag = self.client.get(url)['ETag']
+        self.client.get(list_url)
+
+        run_action('post', 'make_draft', [post.id])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        etag = response['ETag']
+        response = self.client.get(list_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertNotIn(post, response.context['posts'])
+
+        run_action('post', 'make_published', [post.id])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Действия с новостями - UPDATE без сигналов
+        news = News.objects.create(post_item=self.posts[13], is_important=False, news_type='update', pinned=False)
+        main_url = reverse('blog:main_page')
+        self.client.get(main_url)
+        self.assertEqual(self.client.get(main_url)['X-Page-Cache'], 'hit')
+        for action in ('mark_pinned', 'mark_as_important'):
+            with self.subTest(action=action):
+                run_action('news', action, [news.id])
+                self.assertEqual(self.client.get(main_url)['X-Page-Cache'], 'miss')
+
+
+class ToggleQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.reader)
+        self.post = self.posts[10]
+
+    def react(self, kind):
+        return self.client.post(reverse('blog:post_react', args=[self.post.id]), {'kind': kind}).json()
+
+    def test_like_toggle(self):
+        # Реакции ещё нет: DELETE ничего не находит, SELECT прежней реакции, затем upsert
+        with self.assertQueryBudget(11):
+            response = self.client.post(reverse('blog:post_react', args=[self.post.id]), {'kind': 'like'})
+        self.assertEqual(response.json()['likes_count'], 1)
+        self.assertEqual(response.json()['reaction'], 'like')
+
+    def test_reaction_transitions(self):
+        self.assertEqual(self.react('dislike')['reaction'], 'dislike')
+
+        # Лайк заменяет дизлайк, а не добавляется к нему
+        data = self.react('like')
+        self.assertEqual((data['reaction'], data['likes_count'], data['dislikes_count']), ('like', 1, 0))
+        self.assertEqual(Reaction.objects.filter(post=self.post, user=self.reader).count(), 1)
+
+        # Повторный лайк снимает реакцию
+        data = self.react('like')
+        self.assertEqual((data['reaction'], data['likes_count'], data['dislikes_count']), (None, 0, 0))
+        self.assertFalse(Reaction.objects.filter(post=self.post, user=self.reader).exists())
+
+    def test_reaction_replaced_by_upsert(self):
+        self.react('dislike')
+        with CaptureQueriesContext(connection) as queries:
+            toggle_reaction(self.post, self.reader, 'like')
+
+        reaction_writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT INTO "blog_reactions"', 'UPDATE "blog_reactions"'))
+        ]
+        self.assertEqual(len(reaction_writes), 1)
+        self.assertIn('ON CONFLICT', reaction_writes[0])
+        self.assertEqual(Reaction.objects.get(post=self.post, user=self.reader).kind, 'like')
+
+    def test_reaction_unknown_kind(self):
+        response = self.client.post(reverse('blog:post_react', args=[self.post.id]), {'kind': 'love'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reaction_requires_login(self):
+        self.client.logout()
+        response = self.client.post(reverse('blog:post_react', args=[self.post.id]), {'kind': 'like'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_favorite_toggle(self):
+        with self.assertQueryBudget(11):
+            response = self.client.post(reverse('blog:post_favorite_toggle', args=[self.post.id]))
+        self.assertTrue(response.json()['is_favorite'])
+        self.assertEqual(response.json()['favorites_count'], 1)
+
+
+class MigrateReactionsTests(QueryBudgetTestCase):
+    def test_legacy_reactions_moved_once(self):
+        post = self.posts[10]
+        post.liked_users.add(self.authors[0], self.authors[1])
+        # Пользователь в обеих таблицах: остаётся лайк
+        post.disliked_users.add(self.authors[1], self.authors[2])
+
+        call_command('migrate_reactions', '--clear-legacy', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.dislikes_count), (2, 1))
+        self.assertEqual(Reaction.objects.get(post=post, user=self.authors[1]).kind, 'like')
+        self.assertFalse(Post.liked_users.through.objects.exists())
+
+        out = StringIO()
+        with self.assertNumQueries(2):
+            call_command('migrate_reactions', '--clear-legacy', stdout=out)
+        self.assertIn('Устаревших реакций нет', out.getvalue())
+
+
+class AsyncEndpointTests(QueryBudgetTestCase):
+    """JSON-эндпоинты - async view: проверяются через ASGI-обработчик тестового клиента"""
+
+    async def test_react(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.post(reverse('blog:post_react', args=[self.posts[10].id]), {'kind': 'like'})
+        self.assertEqual(response.json()['likes_count'], 1)
+
+    async def test_react_requires_login(self):
+        response = await self.async_client.post(reverse('blog:post_react', args=[self.posts[10].id]), {'kind': 'like'})
+        self.assertEqual(response.status_code, 302)
+
+    async def test_favorite_toggle(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.post(reverse('blog:post_favorite_toggle', args=[self.posts[10].id]))
+        self.assertEqual(response.json(), {'is_favorite': True, 'favorites_count': 1})
+
+    async def test_add_reply(self):
+        await self.async_client.aforce_login(self.reader)
+        parent = await Comment.objects.filter(post=self.posts[0], parent__isnull=True).afirst()
+        response = await self.async_client.post(
+            reverse('blog:add_comment', args=[self.posts[0].id]),
+            {'text': 'Асинхронный ответ', 'parent_id': parent.id}
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['comments_count'], 16)
+        self.assertIn('Асинхронный ответ', data['comment_html'])
+
+    async def test_load_more_posts(self):
+        response = await self.async_client.get(reverse('blog:load_more_posts'), {'offset': 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_more'])
+
+    async def test_load_more_comments(self):
+        response = await self.async_client.get(reverse('blog:load_more_comments', args=[self.posts[0].id]))
+        self.assertEqual(response.json()['html'].count('comment-container'), 15)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem-бэкенд, который считает открытые соединения и не доставляет письма на адреса из failing"""
+    failing = set()
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(address in self.failing for message in messages for address in message.to):
+            raise OSError('Получатель отклонён')
+        return super().send_messages(messages)
+
+
+@override_settings(**TEST_SETTINGS, EMAIL_BACKEND='blog.tests.FlakyEmailBackend')
+class EmailNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author', email='author@example.com', password='password')
+        cls.subscribers = [
+            User.objects.create_user(
+                username=f'subscriber{i}', email=f'subscriber{i}@example.com', password='password',
+                subscribed_to_important_news=True
+            )
+            for i in range(5)
+        ]
+        post = Post.objects.create(title='Важная новость', text='Текст', author=author)
+        cls.news = News.objects.create(post_item=post, is_important=True, news_type='announcement', pinned=False)
+        post.status = 'published'
+        post.save()
+        # Повторное сохранение не ставит вторую рассылку
+        post.save()
+
+    def setUp(self):
+        FlakyEmailBackend.failing = set()
+        FlakyEmailBackend.opened = 0
+        self.job = EmailNotificationJob.objects.get()
+
+    def test_one_job_per_news(self):
+        self.assertEqual(self.job.news, self.news)
+        self.assertEqual(EmailNotificationJob.objects.count(), 1)
+        # Письма отправляет только воркер
+        self.assertEqual(mail.outbox, [])
+
+    def test_batched_sending(self):
+        self.assertEqual(process_pending_jobs(size=2), (1, 5))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [user.email for user in self.subscribers])
+        # Одно соединение на порцию из двух писем
+        self.assertEqual(FlakyEmailBackend.opened, 3)
+
+        self.job.refresh_from_db()
+        self.news.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.last_error), ('done', ''))
+        self.assertTrue(self.news.email_notifications_sent)
+
+    def test_retry_only_failed_recipients(self):
+        FlakyEmailBackend.failing = {'subscriber1@example.com'}
+        self.assertEqual(process_pending_jobs(), (1, 4))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.last_error), ('pending', 'Не доставлено писем: 1'))
+
+        FlakyEmailBackend.failing = set()
+        mail.outbox.clear()
+        self.assertEqual(process_pending_jobs(), (1, 1))
+        self.assertEqual([message.to for message in mail.outbox], [['subscriber1@example.com']])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'done')
+
+    @override_settings(EMAIL_NOTIFICATIONS_MAX_ATTEMPTS=2)
+    def test_permanent_failures_recorded(self):
+        FlakyEmailBackend.failing = {'subscriber1@example.com', 'subscriber2@example.com'}
+        process_pending_jobs()
+        process_pending_jobs()
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'failed')
+        self.assertEqual(self.job.last_error, 'Не доставлено писем после 2 попыток: 2')
+        # Больше задание не берётся
+        self.assertEqual(process_pending_jobs(), (0, 0))
+
+    def test_stale_worker_takeover(self):
+        EmailNotificationJob.objects.update(status='running', started_at=timezone.now())
+        self.assertFalse(claim_jobs().exists())
+        self.assertEqual(process_job(self.job), 0)
+
+        EmailNotificationJob.objects.update(started_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(list(claim_jobs()), [self.job])
+        self.assertEqual(process_job(self.job), 5)
+
+
+def make_upload(name='photo.jpg', size=(2000, 1000), orientation=None):
+    """JPEG с EXIF: производитель камеры и, при orientation, поворот"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(**TEST_SETTINGS)
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.media.cleanup)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        # Пост создаётся на уровне класса: вместе с ним создаётся таблица поиска FTS,
+        # которую нельзя откатывать вместе с транзакцией отдельного теста
+        cls.author = User.objects.create_user(username='author', email='author@example.com', password='password')
+        # Поворот на 90° по EXIF: после применения картинка 1000x2000
+        cls.post = Post.objects.create(
+            title='Пост с картинкой',
+            text='Текст',
+            author=cls.author,
+            status='published',
+            image=make_upload(orientation=6)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_built(self):
+        self.assertEqual(process_pending(10), 1)
+        self.post.refresh_from_db()
+        data = self.post.image_variants
+
+        self.assertEqual((data['width'], data['height']), (1000, 2000))
+        self.assertEqual([item['width'] for item in data['variants']['webp']], [320, 640, 960, 1000])
+        self.assertEqual(data['variants']['jpeg'][0]['height'], 640)
+        for name in variant_names(data):
+            self.assertTrue(default_storage.exists(name))
+
+        with default_storage.open(data['variants']['jpeg'][-1]['name']) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (1000, 2000))
+            self.assertFalse(image.getexif())
+
+    def test_card_uses_variants(self):
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, self.post.image.url)
+        self.assertNotContains(response, 'srcset=')
+
+        # Закэшированная для анонимных посетителей лента сбрасывается после фиксации транзакции,
+        # закэшированная карточка - по версии
+        card_version = Post.objects.get(id=self.post.id).card_version
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending(10)
+        self.assertGreater(Post.objects.get(id=self.post.id).card_version, card_version)
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '.jpg 320w')
+        self.assertContains(response, 'width="1000" height="2000"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_replacing_image_resets_variants(self):
+        process_pending(10)
+        self.post.refresh_from_db()
+        old_names = variant_names(self.post.image_variants)
+
+        self.post.image = make_upload('other.jpg', size=(400, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+
+        self.assertEqual(self.post.image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+
+        process_pending(10)
+        self.post.refresh_from_db()
+        self.assertEqual([item['width'] for item in self.post.image_variants['variants']['webp']], [320, 400])
+
+    def test_stale_post_keeps_variants(self):
+        # Пост открыт в форме редактирования до того, как process_images построила варианты
+        stale = Post.objects.get(id=self.post.id)
+        process_pending(10)
+        data = Post.objects.get(id=self.post.id).image_variants
+
+        stale.title = 'Новый заголовок'
+        stale.save()
+        self.assertEqual(Post.objects.get(id=self.post.id).image_variants, data)
+        self.assertTrue(all(default_storage.exists(name) for name in variant_names(data)))
+
+        # Замена картинки в устаревшем объекте удаляет файлы, записанные в базе
+        stale.image = make_upload('other.jpg', size=(400, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.save()
+        self.assertEqual(Post.objects.get(id=self.post.id).image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in variant_names(data)))
+
+    def test_avatar_variants(self):
+        self.author.avatar = make_upload('avatar.jpg', size=(500, 500))
+        self.author.save()
+
+        process_pending(10)
+        self.author.refresh_from_db()
+        self.assertEqual([item['width'] for item in self.author.avatar_variants['variants']['jpeg']], [80, 160, 240])
+
+
+class QueryPlanTests(QueryBudgetTestCase):
+    def test_query_plans(self):
+        # Падает, если запрос какого-либо view читает таблицу целиком или сортирует во временном B-дереве
+        call_command('check_query_plans', stdout=StringIO(), stderr=StringIO())
+
+    def test_virtual_table_in_nested_loop(self):
+        command = check_query_plans.Command()
+        outer = [
+            (2, 0, 'SCAN blog_posts_search VIRTUAL TABLE INDEX 0:M4'),
+            (5, 0, 'SEARCH blog_posts USING INTEGER PRIMARY KEY (rowid=?)'),
+        ]
+        nested = [
+            (2, 0, 'SEARCH blog_posts USING COVERING INDEX post_status_created_idx (status=?)'),
+            (5, 0, 'SCAN blog_posts_search VIRTUAL TABLE INDEX 0:=M4'),
+        ]
+        correlated = [
+            (2, 0, 'SEARCH blog_posts USING INDEX post_status_created_idx (status=?)'),
+            (4, 0, 'CORRELATED SCALAR SUBQUERY 1'),
+            (7, 4, 'SCAN blog_posts_search VIRTUAL TABLE INDEX 0:M4'),
+        ]
+        self.assertEqual(command.plan_problems('', outer), [])
+        self.assertEqual(len(command.plan_problems('', nested)), 1)
+        self.assertEqual(len(command.plan_problems('', correlated)), 1)
+
+    def test_search_count_starts_from_index(self):
+        results = search.SearchResults('python', search_category=True, search_tag=True)
+        self.assertEqual(results.count(), 20)
+        sql, params = results._from_where()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN SELECT COUNT(*) {sql}', params)
+            plan = [row[3] for row in cursor.fetchall()]
+        self.assertRegex(plan[0], r'^SCAN blog_posts_search VIRTUAL TABLE')
+
+
+@skipUnless(settings.SQLITE_CONCURRENT_MODE and connection.vendor == 'sqlite', "режим SQLite выключен")
+class SQLiteConcurrentModeTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        # Тестовая база в памяти журнал WAL не поддерживает, остальные PRAGMA применяются
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+
+    def test_write_transactions_begin_immediate(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    DATABASE_ROUTERS=['config.db_router.PrimaryReplicaRouter'],
+    DATABASE_READ_REPLICAS=['replica'],
+    MIDDLEWARE=['config.db_router.PrimaryPinMiddleware', *settings.MIDDLEWARE]
+)
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    """
+    Реплика - отдельный файл SQLite, в который копируется основная база (replicate).
+    Алиас добавляется после подготовки тестовых баз: создавать для него тестовую базу не нужно
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': str(Path(cls.directory.name) / 'replica.sqlite3'),
+        }
+        cls.databases = {*cls.databases, 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='password')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='password')
+        self.post = Post.objects.create(title='Старый заголовок', text='Текст', author=self.author, status='published')
+
+    def tearDown(self):
+        view_buffer.take()
+
+    def replicate(self):
+        connections['replica'].close()
+        target = sqlite3.connect(connections['replica'].settings_dict['NAME'])
+        try:
+            connections['default'].connection.backup(target)
+        finally:
+            target.close()
+
+    def test_reads_go_to_replica(self):
+        self.replicate()
+        Post.objects.filter(id=self.post.id).update(title='Новый заголовок')
+
+        with replica_reads():
+            self.assertEqual(Post.objects.get(id=self.post.id).title, 'Старый заголовок')
+        # Вне запроса чтение идёт из основной базы
+        self.assertEqual(Post.objects.get(id=self.post.id).title, 'Новый заголовок')
+
+    def test_write_pins_request_to_primary(self):
+        self.replicate()
+
+        with replica_reads() as state:
+            Post.objects.filter(id=self.post.id).update(title='Новый заголовок')
+            self.assertTrue(state.pinned)
+            self.assertEqual(Post.objects.get(id=self.post.id).title, 'Новый заголовок')
+
+    def test_pin_cookie_after_write(self):
+        self.client.force_login(self.reader)
+        self.replicate()
+
+        response = self.client.post(reverse('blog:post_react', args=[self.post.id]), {'kind': 'like'})
+        self.assertEqual(response.json()['likes_count'], 1)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Следующий запрос того же пользователя читает свою запись из основной базы
+        response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertEqual(response.context['likes_count'], 1)
+
+        # Без cookie чтение идёт с реплики, где лайка ещё нет
+        self.client.cookies.pop(PIN_COOKIE)
+        response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertEqual(response.context['likes_count'], 0)
+
+
+@override_settings(**TEST_SETTINGS, MIDDLEWARE=['blog.query_budget.QueryBudgetMiddleware', *settings.MIDDLEWARE])
+class QueryBudgetMiddlewareTests(TestCase):
+    def test_headers(self):
+        with self.assertLogs('query_budget', level='INFO') as logs:
+            response = self.client.get(reverse('blog:post_list'))
+
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertIn('"url_name": "blog:post_list"', logs.output[0])
+
+    def test_sql_shape_collapses_parameter_lists(self):
+        self.assertEqual(
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            sql_shape('SELECT * FROM t WHERE id IN (%s)'.replace('(%s)', '(%s, %s)'))
+        )
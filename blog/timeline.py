@@ -0,0 +1,146 @@
+"""
+Лента подписок (filter=following).
+
+При публикации пост раскладывается (fan-out) в TimelineEntry каждого подписчика автора порциями.
+Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, не раскладываются: их посты
+дочитываются при чтении ленты (pull) и сливаются с материализованной частью по (created_at, id).
+Чтение ленты - проход по индексу (user, created_at, post) и, для таких авторов, по их постам.
+"""
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+
+from users.cache import forget_user
+from users.models import Follow
+from .models import Post, TimelineEntry
+from .pagination import decode_cursor, encode_cursor, keyset_filter
+
+User = get_user_model()
+
+FEED_ORDERING = ('-created_at', '-id')
+ENTRY_ORDERING = ('-created_at', '-post_id')
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    """Сколько подписчиков может быть у автора, чтобы его посты раскладывались по лентам"""
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+def backfill_size():
+    """Сколько последних постов автора добавляется в ленту при подписке"""
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 20)
+
+
+def feed_posts():
+    return Post.objects.filter(status='published', news_item__isnull=True)
+
+
+def is_pulled(author):
+    return author.followers_count > fanout_limit()
+
+
+def fan_out_post(post):
+    """Раскладывает опубликованный пост по лентам подписчиков автора"""
+    if is_pulled(post.author):
+        return
+
+    follower_ids = Follow.objects.filter(author_id=post.author_id).values_list('follower_id', flat=True)
+    for chunk in batched(follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE), FANOUT_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+                for user_id in chunk
+            ],
+            ignore_conflicts=True
+        )
+
+
+def remove_post(post_id):
+    """Убирает пост из всех лент (снят с публикации или стал новостью)"""
+    TimelineEntry.objects.filter(post_id=post_id).delete()
+
+
+def follow(user, author):
+    """Подписывает user на author. Возвращает False, если подписка уже была"""
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(follower=user, author=author)
+        if not created:
+            return False
+
+        User.objects.filter(id=author.id).update(followers_count=F('followers_count') + 1)
+        forget_user(author.id)
+        author.refresh_from_db(fields=['followers_count'])
+
+        # Последние посты автора сразу появляются в ленте
+        if not is_pulled(author):
+            recent = feed_posts().filter(author=author).order_by(*FEED_ORDERING)[:backfill_size()]
+            TimelineEntry.objects.bulk_create(
+                [
+                    TimelineEntry(user=user, post_id=post.id, author=author, created_at=post.created_at)
+                    for post in recent.only('id', 'created_at')
+                ],
+                ignore_conflicts=True
+            )
+
+    return True
+
+
+def unfollow(user, author):
+    """Отписывает user от author. Возвращает False, если подписки не было"""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=user, author=author).delete()
+        if not deleted:
+            return False
+
+        User.objects.filter(id=author.id, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+        forget_user(author.id)
+        author.refresh_from_db(fields=['followers_count'])
+        TimelineEntry.objects.filter(user=user, author=author).delete()
+
+    return True
+
+
+def load_following_feed(user, limit, cursor=None, offset=0, prepare_queryset=None):
+    """
+    Порция ленты подписок: (посты, есть_ли_ещё, следующий_курсор), как у paginate_keyset.
+    Курсор совместим с лентой "Все" (created_at, id).
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    pulled = feed_posts().filter(
+        author__in=user.following.filter(followers_count__gt=fanout_limit())
+    )
+
+    if cursor:
+        values = decode_cursor(cursor, Post, FEED_ORDERING)
+        entries = entries.filter(keyset_filter(ENTRY_ORDERING, values))
+        pulled = pulled.filter(keyset_filter(FEED_ORDERING, values))
+        offset = 0
+
+    # Из каждого источника достаточно offset + limit + 1 строк, чтобы слить их по порядку
+    size = offset + limit + 1
+    keys = {
+        post_id: created_at
+        for created_at, post_id in entries.order_by(*ENTRY_ORDERING).values_list('created_at', 'post_id')[:size]
+    }
+    # Автор мог стать "крупным" уже после раскладки его постов - совпадения схлопываются по id
+    keys.update(pulled.order_by(*FEED_ORDERING).values_list('id', 'created_at')[:size])
+
+    page_ids = sorted(keys, key=lambda post_id: (keys[post_id], post_id), reverse=True)[offset:size]
+    has_more = len(page_ids) > limit
+    page_ids = page_ids[:limit]
+
+    # Записи ленты могли устареть (пост снят с публикации без сигналов) - показываются только видимые посты
+    queryset = feed_posts().filter(id__in=page_ids)
+    if prepare_queryset:
+        queryset = prepare_queryset(queryset)
+    posts_by_id = {post.id: post for post in queryset}
+    posts = [posts_by_id[post_id] for post_id in page_ids if post_id in posts_by_id]
+
+    next_cursor = encode_cursor(posts[-1], FEED_ORDERING) if has_more and posts else None
+
+    return posts, has_more, next_cursor
@@ -13,11 +13,12 @@ urlpatterns = [
     path('posts/<slug:post_slug>/', views.PostDetailView.as_view(), name="post_detail"),
     path('posts/category/<slug:category_slug>/', views.CategoryPostsView.as_view(), name="category_posts"),
     path('posts/tag/<slug:tag_slug>/', views.TagPostsView.as_view(), name="tag_posts"),
-    path('posts/<int:post_id>/like/', views.PostLikeToggleView.as_view(), name="post_like"),
-    path('posts/<int:post_id>/dislike/', views.PostDislikeToggleView.as_view(), name="post_dislike"),
+    path('posts/<int:post_id>/react/', views.PostReactView.as_view(), name="post_react"),
     path('posts/<int:post_id>/toggle-favorite/', views.PostFavoriteToggleView.as_view(), name="post_favorite_toggle"),
     path("posts/<int:post_id>/comments/add/", views.AddCommentView.as_view(), name="add_comment"),
     path('posts/<int:post_id>/comments/load-more/', views.LoadMoreCommentsView.as_view(), name="load_more_comments"),
+    path('posts/<int:post_id>/comments/<int:comment_id>/replies/', views.LoadMoreRepliesView.as_view(), name="load_more_replies"),
+    path('autocomplete/', views.AutocompleteView.as_view(), name='autocomplete'),
     path('news/important/toggle-subscription/', views.ToggleImportantNewsSubscriptionView.as_view(), name='toggle_important_news_subscription'),
     path('', views.MainPageView.as_view(), name='main_page'),
 ]
@@ -0,0 +1,197 @@
+"""
+Отложенная запись просмотров постов (write-behind).
+
+PostDetailView не пишет в базу: прирост просмотров и пары "пост - пользователь"
+копятся в буфере процесса и сбрасываются фоновым потоком раз в VIEW_BUFFER_FLUSH_INTERVAL секунд
+(или раньше, если буфер разросся до VIEW_BUFFER_MAX_SIZE). Сброс - одна транзакция:
+UPDATE ... CASE по всем постам порции, bulk_create(ignore_conflicts=True) для просмотревших
+и поправка статистики сайта. Каждый сброс записывается в ViewCounterFlush для мониторинга в админке.
+При VIEW_BUFFER_FLUSH_INTERVAL = 0 буфер сбрасывается сразу (удобно для тестов).
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Post, SiteStatistics, ViewCounterFlush
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Сколько постов обновляется одним UPDATE ... CASE
+FLUSH_BATCH_SIZE = 500
+# Сколько последних записей о сбросах хранится в базе
+FLUSH_HISTORY_SIZE = 1000
+
+
+def flush_interval():
+    return getattr(settings, 'VIEW_BUFFER_FLUSH_INTERVAL', 10)
+
+
+def max_size():
+    return getattr(settings, 'VIEW_BUFFER_MAX_SIZE', 1000)
+
+
+class ViewBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.reset()
+
+    def reset(self):
+        self.views = Counter()
+        self.viewers = set()
+        # Время самого старого несброшенного события - из него считается задержка
+        self.oldest = None
+        self.last_flush = None
+
+    def record(self, post_id, user_id=None, count_view=True):
+        """Запоминает просмотр поста (и пользователя, если он авторизован)"""
+        with self.lock:
+            if count_view:
+                self.views[post_id] += 1
+            if user_id is not None:
+                self.viewers.add((post_id, user_id))
+            if self.oldest is None and (self.views or self.viewers):
+                self.oldest = time.monotonic()
+            size = len(self.views) + len(self.viewers)
+
+        if not flush_interval():
+            self.flush()
+            return
+
+        self.start()
+        if size >= max_size():
+            self.wakeup.set()
+
+    def pending_views(self, post_id):
+        """Несброшенные просмотры поста (добавляются к значению из базы при показе)"""
+        return self.views.get(post_id, 0)
+
+    def is_viewed(self, post_id, user_id):
+        return (post_id, user_id) in self.viewers
+
+    def stats(self):
+        with self.lock:
+            return {
+                'posts': len(self.views),
+                'views': sum(self.views.values()),
+                'viewers': len(self.viewers),
+                'lag': time.monotonic() - self.oldest if self.oldest is not None else 0,
+                'last_flush': self.last_flush,
+            }
+
+    def take(self):
+        with self.lock:
+            views, viewers, oldest = self.views, self.viewers, self.oldest
+            self.views, self.viewers, self.oldest = Counter(), set(), None
+        return views, viewers, oldest
+
+    def restore(self, views, viewers, oldest):
+        """Возвращает в буфер данные неудачного сброса, чтобы они ушли со следующим"""
+        with self.lock:
+            self.views.update(views)
+            self.viewers |= viewers
+            if self.oldest is None or oldest < self.oldest:
+                self.oldest = oldest
+
+    def flush(self):
+        """Записывает буфер в базу, возвращает количество сброшенных просмотров"""
+        views, viewers, oldest = self.take()
+        if not views and not viewers:
+            return 0
+
+        started = time.monotonic()
+        try:
+            write_views(views, viewers)
+        except Exception:
+            logger.exception("Не удалось сбросить буфер просмотров")
+            self.restore(views, viewers, oldest)
+            return 0
+
+        finished = time.monotonic()
+        self.last_flush = finished
+        try:
+            record_flush(views, viewers, lag=finished - oldest, duration=(finished - started) * 1000)
+        except Exception:
+            logger.exception("Не удалось записать метрики сброса буфера просмотров")
+
+        return sum(views.values())
+
+    def start(self):
+        """Запускает фоновый поток сброса (один на процесс)"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='view-buffer-flush', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(flush_interval())
+            self.wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+    def after_fork(self):
+        # Дочерний процесс (например, воркер gunicorn с --preload) начинает с пустым буфером
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.reset()
+
+
+def write_views(views, viewers):
+    """Один сброс: просмотры через UPDATE ... CASE, просмотревшие - через bulk_create"""
+    post_ids = sorted(views)
+
+    with transaction.atomic():
+        for start in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+            batch = post_ids[start:start + FLUSH_BATCH_SIZE]
+            increment = Case(
+                *[When(id=post_id, then=Value(views[post_id])) for post_id in batch],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            Post.objects.filter(id__in=batch).update(views=F('views') + increment, trending_dirty=True)
+
+            counted_ids = SiteStatistics.counted_posts().filter(id__in=batch).values_list('id', flat=True)
+            SiteStatistics.apply_delta(total_views=sum(views[post_id] for post_id in counted_ids))
+
+        through = Post.viewed_users.through
+        user_field = f'{User._meta.model_name}_id'
+        through.objects.bulk_create(
+            [through(post_id=post_id, **{user_field: user_id}) for post_id, user_id in viewers],
+            batch_size=FLUSH_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+def record_flush(views, viewers, lag, duration):
+    flush = ViewCounterFlush.objects.create(
+        process=f'{socket.gethostname()}:{os.getpid()}',
+        posts=len(views),
+        views=sum(views.values()),
+        viewers=len(viewers),
+        lag=lag,
+        duration=duration
+    )
+    # Старые записи не нужны для мониторинга
+    ViewCounterFlush.objects.filter(id__lte=flush.id - FLUSH_HISTORY_SIZE).delete()
+
+
+buffer = ViewBuffer()
+
+atexit.register(buffer.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=buffer.after_fork)
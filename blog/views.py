@@ -1,178 +1,173 @@
 # blog/views.py
+from django.conf import settings
 from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect
 from django.views.generic import View, ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.db.models import F, Q, Count, Sum
-from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.db.models import Q
 from django.contrib import messages
 from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 
-from .models import Post, Category, Tag, Comment
+from . import autocomplete, page_cache, search, timeline, view_buffer
+from .models import Post, Category, Tag, Comment, Reaction, SiteStatistics
+from .page_cache import AnonymousPageCacheMixin
 from .forms import PostForm
+from .pagination import InvalidCursor, apaginate_keyset, paginate_keyset
+from .comment_tree import aload_root_comments, load_replies, load_root_comments
+from .feeds import PostFeedMixin, aattach_post_cards, attach_post_cards, feed_queryset
+from .reactions import get_reaction, toggle_reaction
+from .seen_posts import SeenPosts
+from .tags import sync_post_tags
 
 User = get_user_model()
 
 
-class PostListView(ListView):
+# Сортировки ленты постов. Последним ключом всегда идёт id, чтобы ключ курсора был уникальным
+POST_FEED_ORDERINGS = {
+    'trending': ('-trending_score', '-id'),  # Активность с затуханием по времени (Post.trending_score)
+    'popular': ('-favorites_count', '-created_at', '-id'),  # Самые популярные по добавлениям в избранное
+}
+DEFAULT_POST_FEED_ORDERING = ('-created_at', '-id')
+
+
+def get_post_feed(request):
+    """Возвращает queryset ленты постов и его сортировку с учётом параметра filter"""
+    queryset = Post.objects.filter(
+        status="published", 
+        news_item__isnull=True
+    )
+    
+    filter_type = request.GET.get('filter', 'all')
+    
+    # new, following и all (по умолчанию) - самые новые
+    return queryset, POST_FEED_ORDERINGS.get(filter_type, DEFAULT_POST_FEED_ORDERING)
+
+
+def load_post_feed(request, limit, cursor=None, offset=0):
+    """Порция ленты постов: (посты, есть_ли_ещё, следующий_курсор)"""
+    if request.GET.get('filter') == 'following' and request.user.is_authenticated:
+        # Посты от авторов, на которых подписан пользователь - из материализованной ленты
+        return timeline.load_following_feed(
+            request.user, limit, cursor=cursor, offset=offset, prepare_queryset=feed_queryset
+        )
+
+    queryset, ordering = get_post_feed(request)
+    return paginate_keyset(feed_queryset(queryset), ordering, limit, cursor=cursor, offset=offset)
+
+
+async def aload_post_feed(request, user, limit, cursor=None, offset=0):
+    """load_post_feed для async view"""
+    if request.GET.get('filter') == 'following' and user.is_authenticated:
+        # Лента подписок дочитывает посты нескольких источников - выполняется в потоке целиком
+        return await sync_to_async(timeline.load_following_feed)(
+            user, limit, cursor=cursor, offset=offset, prepare_queryset=feed_queryset
+        )
+
+    queryset, ordering = get_post_feed(request)
+    return await apaginate_keyset(feed_queryset(queryset), ordering, limit, cursor=cursor, offset=offset)
+
+
+async def get_request_user(request):
+    """
+    Пользователь запроса в async view. request.user загружается из сессии синхронно
+    и в async-коде недоступен, поэтому он заменяется уже загруженным через request.auser()
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """LoginRequiredMixin для async view"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not (await get_request_user(request)).is_authenticated:
+            return self.handle_no_permission()
+        # LoginRequiredMixin.dispatch проверяет request.user синхронно - сразу вызываем View.dispatch
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+def render_comments(comments, request):
+    return ''.join([
+        render_to_string("blog/includes/comment_container.html", {"comment": comment}, request)
+        for comment in comments
+    ])
+
+
+class PostListView(AnonymousPageCacheMixin, ListView):
     model = Post
     template_name = 'blog/pages/post_list.html'
     context_object_name = 'posts'
     posts_per_batch = 6
 
     def get_queryset(self):
-        # Базовый queryset
-        queryset = Post.objects.filter(
-            status="published", 
-            news_item__isnull=True
-        )
-        
-        # Фильтрация по параметру filter
-        filter_type = self.request.GET.get('filter', 'all')
-        
-        if filter_type == 'trending':
-            # Посты с наибольшим количеством просмотров
-            queryset = queryset.filter(views__gt=0).order_by('-views', '-created_at')
-        
-        elif filter_type == 'popular':
-            # Самые популярные по добавлениям в избранное
-            queryset = queryset.annotate(
-                favorites_count=Count('favorites')
-            ).order_by('-favorites_count', '-created_at')
-        
-        elif filter_type == 'new':
-            # Самые новые
-            queryset = queryset.order_by('-created_at')
-        
-        elif filter_type == 'following' and self.request.user.is_authenticated:
-            # Посты от авторов, на которых подписан пользователь
-            if hasattr(self.request.user, 'following'):
-                queryset = queryset.filter(
-                    author__in=self.request.user.following.all()
-                ).order_by('-created_at')
-            else:
-                queryset = queryset.order_by('-created_at')
-        
-        else:
-            # Все посты (по умолчанию)
-            queryset = queryset.order_by('-created_at')
-        
-        return queryset
+        queryset, ordering = get_post_feed(self.request)
+        return queryset.order_by(*ordering)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Получаем отфильтрованный queryset из get_queryset
-        filtered_posts = self.get_queryset()
-
-        # Основные посты для отображения (с пагинацией)
-        context["posts"] = filtered_posts[:self.posts_per_batch]
-        context["has_more_posts"] = filtered_posts.count() > self.posts_per_batch
+        # Первая порция постов; дальше лента подгружается по курсору
+        posts, has_more_posts, next_cursor = load_post_feed(self.request, self.posts_per_batch)
+        context["posts"] = attach_post_cards(posts, self.request)
+        context["has_more_posts"] = has_more_posts
+        context["next_cursor"] = next_cursor or ''
         context["posts_per_batch"] = self.posts_per_batch
 
-        # Получаем все опубликованные посты (для статистики)
-        all_posts = Post.objects.filter(
-            status="published", 
-            news_item__isnull=True
-        )
+        # === СТАТИСТИКА ===
+        # Снимок поддерживается сигналами, поэтому чтение не зависит от количества постов
+        statistics = SiteStatistics.load()
 
-        # === РАСЧЁТ СТАТИСТИКИ ===
-        
-        # 1. Общее количество постов
-        context["total_posts"] = all_posts.count()
-        
-        # 2. Общее количество авторов (уникальных)
-        context["total_authors"] = User.objects.filter(
-            posts__in=all_posts
-        ).distinct().count()
+        context["total_posts"] = statistics.total_posts
+        context["total_authors"] = statistics.total_authors
+        context["total_comments"] = statistics.total_comments
+        context["total_favorites"] = statistics.total_favorites
+        context["total_views"] = statistics.total_views
+        context["total_likes"] = statistics.total_likes
         
-        # 3. Общее количество комментариев
-        context["total_comments"] = Comment.objects.filter(
-            post__in=all_posts
-        ).count()
-        
-        # 4. Общее количество добавлений в избранное
-        total_favorites = 0
-        for post in all_posts:
-            total_favorites += post.favorites.count()
-        context["total_favorites"] = total_favorites
-        
-        # 5. Общее количество просмотров
-        context["total_views"] = all_posts.aggregate(
-            total=Coalesce(Sum('views'), 0)
-        )['total']
-        
-        # 6. Общее количество лайков
-        total_likes = 0
-        for post in all_posts:
-            total_likes += post.liked_users.count()
-        context["total_likes"] = total_likes
-        
-        # 7. Для авторизованных пользователей
+        # Для авторизованных пользователей
         if self.request.user.is_authenticated:
             context["user_favorites"] = self.request.user.favorite_posts.count()
-            if hasattr(self.request.user, 'following'):
-                context["user_following"] = self.request.user.following.count()
-            else:
-                context["user_following"] = 0
+            context["user_following"] = self.request.user.following.count()
         else:
             context["user_favorites"] = 0
             context["user_following"] = 0
         
-        # 8. Текущий фильтр
+        # Текущий фильтр
         context["current_filter"] = self.request.GET.get('filter', 'all')
 
         return context
 
 
 class LoadMorePostsView(View):
-    def get(self, request):
-        offset = int(request.GET.get("offset", 0))
+    async def get(self, request):
         posts_per_batch = PostListView.posts_per_batch
-        filter_type = request.GET.get('filter', 'all')
-        
-        # Базовый queryset
-        posts_query = Post.objects.filter(
-            status="published", 
-            news_item__isnull=True
-        )
-        
-        # Применяем тот же фильтр, что и в PostListView
-        if filter_type == 'trending':
-            posts_query = posts_query.filter(views__gt=0).order_by('-views', '-created_at')
-        elif filter_type == 'popular':
-            posts_query = posts_query.annotate(
-                favorites_count=Count('favorites')
-            ).order_by('-favorites_count', '-created_at')
-        elif filter_type == 'new':
-            posts_query = posts_query.order_by('-created_at')
-        elif filter_type == 'following' and request.user.is_authenticated:
-            if hasattr(request.user, 'following'):
-                posts_query = posts_query.filter(
-                    author__in=request.user.following.all()
-                ).order_by('-created_at')
-            else:
-                posts_query = posts_query.order_by('-created_at')
-        else:
-            posts_query = posts_query.order_by('-created_at')
-
-        posts = posts_query[offset:offset + posts_per_batch]
+        user = await get_request_user(request)
+
+        try:
+            posts, has_more_posts, next_cursor = await aload_post_feed(
+                request,
+                user,
+                posts_per_batch,
+                cursor=request.GET.get("cursor"),
+                offset=int(request.GET.get("offset", 0))
+            )
+        except (InvalidCursor, ValueError) as error:
+            return JsonResponse({'error': str(error)}, status=400)
 
-        posts_html = ''.join([
-            render_to_string("blog/includes/post_container.html", {"post": post}, request)
-            for post in posts
-        ])
-        has_more_posts = offset + posts_per_batch < posts_query.count()
+        posts_html = ''.join(post.card_html for post in await aattach_post_cards(posts, request, user))
 
         return JsonResponse({
             'html': posts_html,
-            'has_more': has_more_posts
+            'has_more': has_more_posts,
+            'next_cursor': next_cursor
         })
 
 
-class PostSearchView(ListView):
+class PostSearchView(PostFeedMixin, ListView):
     model = Post
     template_name = "blog/pages/post_search.html"
     context_object_name = 'posts'
@@ -189,14 +184,23 @@ class PostSearchView(ListView):
         search_query = self.request.GET.get("search")
 
         if search_query:
+            search_category = self.request.GET.get("search_category")
+            search_tag = self.request.GET.get("search_tag")
+
+            # Полнотекстовый индекс (SQLite FTS5) с сортировкой по релевантности
+            if search.is_enabled():
+                return search.SearchResults(
+                    search_query,
+                    search_category=bool(search_category),
+                    search_tag=bool(search_tag),
+                    prepare_queryset=feed_queryset
+                )
+
             queryset = Post.objects.filter(
                 status="published", 
                 news_item__isnull=True
             )
 
-            search_category = self.request.GET.get("search_category")
-            search_tag = self.request.GET.get("search_tag")
-
             query = Q(title__icontains=search_query) | Q(text__icontains=search_query)
 
             if search_category:
@@ -205,19 +209,22 @@ class PostSearchView(ListView):
             if search_tag:
                 query |= Q(tags__name__icontains=search_query)
 
-            return queryset.filter(query).order_by("-created_at")
+            return feed_queryset(queryset.filter(query).distinct().order_by("-created_at"))
         
         return Post.objects.none()
 
 
-class CategoryPostsView(ListView):
+class CategoryPostsView(AnonymousPageCacheMixin, PostFeedMixin, ListView):
     model = Post
     template_name = 'blog/pages/category_posts.html'
     context_object_name = 'posts'
+    paginate_by = 10
 
     def get_queryset(self):
         self.category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
-        return Post.objects.filter(category=self.category, status='published').order_by('-created_at')
+        return feed_queryset(
+            Post.objects.filter(category=self.category, status='published').order_by('-created_at')
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -227,18 +234,19 @@ class CategoryPostsView(ListView):
         return context
 
 
-class TagPostsView(ListView):
+class TagPostsView(AnonymousPageCacheMixin, PostFeedMixin, ListView):
     model = Post
     template_name = 'blog/pages/tag_posts.html'
     context_object_name = 'posts'
+    paginate_by = 10
 
     def get_queryset(self):
         self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
-        return Post.objects.filter(
+        return feed_queryset(Post.objects.filter(
             tags=self.tag, 
             status='published',
             news_item__isnull=True
-        ).order_by('-created_at')
+        ).order_by('-created_at'))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -248,7 +256,7 @@ class TagPostsView(ListView):
         return context
 
 
-class PostDetailView(DetailView):
+class PostDetailView(AnonymousPageCacheMixin, DetailView):
     model = Post
     template_name = 'blog/pages/post_detail.html'
     # context_object_name = 'post' Необязательно
@@ -256,22 +264,49 @@ class PostDetailView(DetailView):
     slug_field = 'slug' # Необязательно
     comments_per_batch = 5
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('author', 'category').prefetch_related('tags')
+
+    def get(self, request, *args, **kwargs):
+        # Просмотренные посты - в подписанной cookie, сессия при просмотре не меняется
+        self.seen_posts = SeenPosts.from_request(request)
+        response = super().get(request, *args, **kwargs)
+        return self.seen_posts.save(response)
+
+    def page_cache_versions(self):
+        # Страница поста зависит только от него самого (комментарии и реакции сдвигают его версию)
+        self.cached_post = Post.objects.filter(slug=self.kwargs[self.slug_url_kwarg]).values('id', 'updated_at').first()
+        if self.cached_post is None:
+            return None
+        return [page_cache.post_version(self.cached_post['id'])]
+
+    def page_modified_at(self):
+        return self.cached_post['updated_at']
+
+    def page_cache_hit(self, request, response):
+        # Ответ из кэша - тоже просмотр: он учитывается так же, как в get_object (посетитель анонимный)
+        seen_posts = SeenPosts.from_request(request)
+        if seen_posts.add(self.cached_post['id']):
+            view_buffer.buffer.record(self.cached_post['id'])
+        return seen_posts.save(response)
+
     def get_object(self, queryset=None):
         post = super().get_object(queryset)
 
-        session_key = f'post_{post.id}_viewed'
+        count_view = self.seen_posts.add(post.id)
 
-        if not self.request.session.get(session_key, False):
-            Post.objects.filter(id=post.id).update(views=F("views") + 1)
+        user = self.request.user
+        viewer_id = user.id if user.is_authenticated and user.id != post.author_id else None
 
-            post.views = post.views + 1
+        # Просмотр только попадает в буфер, в базу он будет записан фоновым сбросом
+        pending_views = view_buffer.buffer.pending_views(post.id)
+        if count_view or viewer_id is not None:
+            view_buffer.buffer.record(post.id, viewer_id, count_view=count_view)
 
-            self.request.session[session_key] = True
+        if count_view:
+            pending_views += 1
 
-        user = self.request.user
-        if user.is_authenticated and user != post.author:
-            if not post.viewed_users.filter(id=user.id).exists():
-                post.viewed_users.add(user)
+        post.views += pending_views
 
         return post
     
@@ -281,20 +316,18 @@ class PostDetailView(DetailView):
         user = self.request.user
         post = self.object
 
-        context['is_liked'] = False
-        context['is_disliked'] = False
-        
-        if user.is_authenticated:
-            context['is_liked'] = post.liked_users.filter(id=user.id).exists()
-            context['is_disliked'] = post.disliked_users.filter(id=user.id).exists()
+        reaction = get_reaction(post, user)
+        context['is_liked'] = reaction == 'like'
+        context['is_disliked'] = reaction == 'dislike'
 
-        context['likes_count'] = post.liked_users.count()
-        context['dislikes_count'] = post.disliked_users.count()
+        context['likes_count'] = post.likes_count
+        context['dislikes_count'] = post.dislikes_count
 
-        # Берем только корневые комментарии (без родителей)
-        comments_query = post.comments.filter(parent__isnull=True).order_by('-created_at')
-        context["comments"] = comments_query[:self.comments_per_batch]
-        context["has_more_comments"] = comments_query.count() > self.comments_per_batch
+        # Корневые комментарии вместе с деревьями ответов
+        comments, has_more_comments, next_cursor = load_root_comments(post, self.comments_per_batch)
+        context["comments"] = comments
+        context["has_more_comments"] = has_more_comments
+        context["next_comments_cursor"] = next_cursor or ''
         context["comments_per_batch"] = self.comments_per_batch
 
         return context
@@ -314,10 +347,7 @@ class CreatePostView(LoginRequiredMixin, CreateView):
         post.author = self.request.user
         post.save()
 
-        tags = form.cleaned_data.get('tags_input', [])
-        for tag_name in tags:
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            post.tags.add(tag)
+        sync_post_tags(post, form.cleaned_data.get('tags_input', []))
 
         messages.success(self.request, 'Пост успешно создан!')
 
@@ -342,11 +372,8 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
     def form_valid(self, form):
         updated_post = form.save()
 
-        tags = form.cleaned_data.get('tags_input', [])
-        updated_post.tags.clear()
-        for tag_name in tags:
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            updated_post.tags.add(tag)
+        # Добавляются и убираются только изменившиеся теги
+        sync_post_tags(updated_post, form.cleaned_data.get('tags_input', []))
 
         return redirect('blog:post_detail', post_slug=self.object.slug)
 
@@ -359,7 +386,7 @@ class PostDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('blog:post_list')
 
 
-class MainPageView(TemplateView):
+class MainPageView(AnonymousPageCacheMixin, TemplateView):
     template_name = 'blog/pages/index.html'
 
     def get_context_data(self, **kwargs):
@@ -379,86 +406,68 @@ class MainPageView(TemplateView):
         return context
 
 
-class PostLikeToggleView(View):
-    def post(self, request, post_id, *args, **kwargs):
-        post = get_object_or_404(Post, id=post_id)
-        user = request.user
-
-        has_liked = post.liked_users.filter(id=user.id).exists()
-        has_disliked = post.disliked_users.filter(id=user.id).exists()
+class PostReactView(AsyncLoginRequiredMixin, View):
+    """Лайк/дизлайк: kind=like|dislike, повторная реакция того же вида снимается"""
 
-        if has_liked:
-            post.liked_users.remove(user)
-            has_liked = False
-        else:
-            post.liked_users.add(user)
-            has_liked = True
+    async def post(self, request, post_id, *args, **kwargs):
+        kind = request.POST.get('kind')
+        if kind not in Reaction.COUNTER_FIELDS:
+            return JsonResponse({'error': 'Неизвестный вид реакции'}, status=400)
 
-            if has_disliked:
-                post.disliked_users.remove(user)
-                has_disliked = False
+        post = await aget_object_or_404(Post.objects.only('id'), id=post_id)
+        # Асинхронных транзакций в ORM нет: переключение целиком выполняется в потоке
+        reaction = await sync_to_async(toggle_reaction)(post, request.user, kind)
 
-        likes_count = post.liked_users.count()
-        dislikes_count = post.disliked_users.count()
+        # Счётчики уже обновлены в транзакции переключения, перечитываем только их
+        await post.arefresh_from_db(fields=['likes_count', 'dislikes_count'])
 
         return JsonResponse({
-            'likes_count': likes_count,
-            'dislikes_count': dislikes_count,
-            'has_liked': has_liked,
-            'has_disliked': has_disliked
+            'reaction': reaction,
+            'likes_count': post.likes_count,
+            'dislikes_count': post.dislikes_count,
+            'has_liked': reaction == 'like',
+            'has_disliked': reaction == 'dislike'
         })
 
 
-class PostDislikeToggleView(View):
-    def post(self, request, post_id, *args, **kwargs):
-        post = get_object_or_404(Post, id=post_id)
-        user = request.user
-
-        has_disliked = post.disliked_users.filter(id=user.id).exists()
-        has_liked = post.liked_users.filter(id=user.id).exists()
-
-        if has_disliked:
-            post.disliked_users.remove(user)
-            has_disliked = False
+def toggle_favorite(post, user):
+    """Добавляет пост в избранное пользователя или убирает из него, возвращает новое состояние"""
+    with transaction.atomic():
+        if post.favorites.filter(id=user.id).exists():
+            post.favorites.remove(user)
+            is_favorite = False
         else:
-            post.disliked_users.add(user)
-            has_disliked = True
+            post.favorites.add(user)
+            is_favorite = True
 
-            if has_liked:
-                post.liked_users.remove(user)
-                has_liked = False
+        post.refresh_from_db(fields=['favorites_count'])
 
-        dislikes_count = post.disliked_users.count()
-        likes_count = post.liked_users.count()
+    return is_favorite
 
-        return JsonResponse({
-            'dislikes_count': dislikes_count,
-            'likes_count': likes_count,
-            'has_disliked': has_disliked,
-            'has_liked': has_liked
-        })
+
+def create_comment(comment_data):
+    # Комментарий и счётчик комментариев поста сохраняются в одной транзакции
+    with transaction.atomic():
+        return Comment.objects.create(**comment_data)
 
 
 class PostFavoriteToggleView(View):
-    def post(self, request, post_id, *args, **kwargs):
-        post = get_object_or_404(Post, id=post_id)
+    async def post(self, request, post_id, *args, **kwargs):
+        user = await get_request_user(request)
+        post = await aget_object_or_404(Post, id=post_id)
 
-        if request.user in post.favorites.all():
-            post.favorites.remove(request.user)
-            is_favorite = False
-        else:
-            post.favorites.add(request.user)
-            is_favorite = True
+        is_favorite = await sync_to_async(toggle_favorite)(post, user)
 
         return JsonResponse({
             'is_favorite': is_favorite,
-            'favorites_count': post.favorites.count()
+            'favorites_count': post.favorites_count
         })
 
 
 class AddCommentView(View):
-    def post(self, request, post_id, *args, **kwargs):
-        post = get_object_or_404(Post, id=post_id)
+    async def post(self, request, post_id, *args, **kwargs):
+        user = await get_request_user(request)
+        post = await aget_object_or_404(Post, id=post_id)
         
         text = request.POST.get('text', '').strip()
         parent_id = request.POST.get('parent_id', '')
@@ -468,54 +477,109 @@ class AddCommentView(View):
         
         comment_data = {
             'post': post,
-            'author': request.user,
+            'author': user,
             'text': text
         }
         
         if parent_id:
-            comment_data['parent'] = Comment.objects.get(id=parent_id)
+            # Автор родителя выводится в цитате ответа
+            comment_data['parent'] = await aget_object_or_404(
+                Comment.objects.select_related('author'), id=parent_id, post=post
+            )
         
-        comment = Comment.objects.create(**comment_data)
+        comment = await sync_to_async(create_comment)(comment_data)
+
+        await post.arefresh_from_db(fields=['comments_count'])
+
+        # У нового комментария ещё нет ответов
+        comment.children = []
+        comment.has_more_replies = False
         
-        comment_html = render_to_string(
-            "blog/includes/comment_container.html", 
-            {"comment": comment}, 
-            request
-        )
+        # Контекст-процессоры шаблона могут читать сессию - рендеринг выполняется в потоке
+        comment_html = await sync_to_async(render_comments)([comment], request)
         
         return JsonResponse({
             'success': True,
             'comment_html': comment_html,
-            'comments_count': post.comments.count()
+            'comments_count': post.comments_count
         })
 
 
 class LoadMoreCommentsView(View):
-    def get(self, request, post_id):
-        # from time import sleep
-        # sleep(0.5)
+    async def get(self, request, post_id):
+        await get_request_user(request)
+        post = await aget_object_or_404(Post.objects.only('id'), id=post_id)
+
+        try:
+            # Корневые комментарии вместе с деревьями ответов
+            comments, has_more_comments, next_cursor = await aload_root_comments(
+                post.id,
+                PostDetailView.comments_per_batch,
+                cursor=request.GET.get("cursor"),
+                offset=int(request.GET.get("offset", 0))
+            )
+        except (InvalidCursor, ValueError) as error:
+            return JsonResponse({'error': str(error)}, status=400)
 
-        offset = int(request.GET.get("offset", 0))
-        comments_per_batch = PostDetailView.comments_per_batch
+        comments_html = await sync_to_async(render_comments)(comments, request)
+
+        return JsonResponse({
+            'html': comments_html,
+            'has_more': has_more_comments,
+            'next_cursor': next_cursor
+        })
 
-        post = get_object_or_404(Post, id=post_id)
-        # Берем только корневые комментарии (без родителей)
-        comments_query = post.comments.filter(parent__isnull=True).order_by('-created_at')
-        
-        comments = comments_query[offset:offset + comments_per_batch]
 
-        comments_html = ''.join([
-            render_to_string("blog/includes/comment_container.html", {"comment": comment}, request)
-            for comment in comments
-        ])
-        has_more_comments = offset + comments_per_batch < comments_query.count()
+class LoadMoreRepliesView(View):
+    replies_per_batch = 10
+
+    def get(self, request, post_id, comment_id):
+        comment = get_object_or_404(Comment, id=comment_id, post_id=post_id)
+
+        try:
+            replies, has_more_replies, next_cursor = load_replies(
+                comment,
+                self.replies_per_batch,
+                cursor=request.GET.get("cursor")
+            )
+        except InvalidCursor as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        replies_html = render_comments(replies, request)
 
         return JsonResponse({
-            'html': comments_html,
-            'has_more': has_more_comments
+            'html': replies_html,
+            'has_more': has_more_replies,
+            'next_cursor': next_cursor
         })
 
 
+class AutocompleteView(View):
+    """
+    Подсказки тегов и категорий по префиксу: q - начало названия, kind=tag|category (по умолчанию оба),
+    limit - количество (до AUTOCOMPLETE_MAX_LIMIT). Ответ из индекса в памяти, без запросов к базе
+    """
+
+    def get(self, request):
+        kind = request.GET.get('kind')
+        if kind is not None and kind not in autocomplete.KINDS:
+            return JsonResponse({'error': 'Неизвестный вид подсказок'}, status=400)
+
+        try:
+            limit = int(request.GET.get('limit', 10))
+        except ValueError:
+            return JsonResponse({'error': 'limit должен быть числом'}, status=400)
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_LIMIT))
+
+        entries = autocomplete.index.search(
+            request.GET.get('q', ''),
+            kinds={kind} if kind else None,
+            limit=limit
+        )
+
+        return JsonResponse({'results': [entry.as_dict() for entry in entries]})
+
+
 class ToggleImportantNewsSubscriptionView(View):
     """Переключение подписки на важные новости"""
     
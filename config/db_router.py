@@ -0,0 +1,100 @@
+"""
+Чтение с реплик базы.
+
+PrimaryReplicaRouter направляет запись в default (основная база), а чтение внутри HTTP-запроса -
+в одну из реплик DATABASE_READ_REPLICAS. Первая запись закрепляет запрос за основной базой до конца,
+а PrimaryPinMiddleware ставит cookie, которая закрепляет следующие запросы пользователя
+на DATABASE_REPLICA_PIN_SECONDS секунд (время, за которое реплика догоняет основную базу):
+пользователь всегда видит то, что сам только что записал.
+Вне HTTP-запросов (команды, фоновые потоки) и внутри транзакций чтение идёт из основной базы.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_db_pin'
+
+# Состояние маршрутизации текущего запроса; None - вне запроса
+routing_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """Внутри блока чтение идёт с реплик, пока не было записи (или сразу из основной базы при pinned)"""
+    state = RoutingState(pinned)
+    token = routing_state.set(state)
+    try:
+        yield state
+    finally:
+        routing_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        replicas = settings.DATABASE_READ_REPLICAS
+        # Внутри транзакции чтение должно видеть её же незафиксированные изменения
+        if state is None or state.pinned or not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, объекты из разных алиасов могут ссылаться друг на друга
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """Работает и в синхронном, и в асинхронном стеке middleware (WSGI и ASGI)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with replica_reads(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        # Состояние - изменяемый объект: sync_to_async копирует контекст в поток вместе со ссылкой на него,
+        # поэтому запись из потока видна и здесь
+        with replica_reads(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self.pin(response, state)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE,
+                '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+
+        return response
@@ -166,3 +166,155 @@ SITE_URL = 'http://127.0.0.1:8000' # нужно будет внести изме
 
 # Ключ доступа к firebase приложению
 FIREBASE_API_KEY = os.getenv('FIREBASE_API_KEY')
+
+# Дерево комментариев: сколько уровней ответов и сколько ответов всего загружать вместе с комментарием,
+# остальные подгружаются кнопкой "Показать ещё ответы"
+COMMENTS_TREE_MAX_DEPTH = 4
+COMMENTS_TREE_MAX_NODES = 200
+
+# Рассылка уведомлений о важных новостях (команда send_email_notifications):
+# сколько писем отправлять через одно SMTP-соединение и сколько раз повторять доставку получателю
+EMAIL_NOTIFICATIONS_BATCH_SIZE = 100
+EMAIL_NOTIFICATIONS_MAX_ATTEMPTS = 5
+
+# Буфер просмотров постов: как часто (в секундах) сбрасывать его в базу
+# и при каком количестве записей сбрасывать досрочно. 0 - писать сразу, без буфера
+VIEW_BUFFER_FLUSH_INTERVAL = 10
+VIEW_BUFFER_MAX_SIZE = 1000
+
+# Рейтинг ленты "В тренде": вес каждого счётчика поста и период полураспада активности в часах.
+# После изменения нужно выполнить recompute_trending_scores --all
+TRENDING_WEIGHTS = {
+    'views': 1,
+    'likes_count': 3,
+    'comments_count': 4,
+    'favorites_count': 5,
+}
+TRENDING_HALF_LIFE_HOURS = 24
+
+# Лента подписок: посты авторов, у которых подписчиков не больше TIMELINE_FANOUT_LIMIT,
+# раскладываются по лентам при публикации; посты остальных дочитываются при просмотре ленты.
+# TIMELINE_BACKFILL_SIZE - сколько последних постов автора попадает в ленту сразу после подписки
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL_SIZE = 20
+
+# Сколько секунд хранится в кэше HTML карточки поста (ключ включает версию поста,
+# поэтому устаревшие карточки не показываются, а просто вытесняются)
+POST_CARD_CACHE_TIMEOUT = 24 * 3600
+
+# Учёт SQL-запросов по view (blog/query_budget.py): заголовки X-Query-* в ответах
+# и лог query_budget.log в корне проекта. Включается переменной окружения QUERY_BUDGET_ENABLED=1
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED') == '1'
+
+if QUERY_BUDGET_ENABLED:
+    MIDDLEWARE.insert(0, 'blog.query_budget.QueryBudgetMiddleware')
+
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'query_budget': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': BASE_DIR / 'query_budget.log',
+                'maxBytes': 5 * 1024 * 1024,
+                'backupCount': 3,
+                'encoding': 'utf-8',
+            },
+        },
+        'loggers': {
+            'query_budget': {
+                'handlers': ['query_budget'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    }
+
+# Режим SQLite для параллельной записи: журнал WAL (чтение не ждёт записи), synchronous=NORMAL,
+# ожидание чужой блокировки вместо ошибки "database is locked", кэш страниц и mmap - PRAGMA выполняются
+# при создании каждого подключения. Транзакции (atomic) начинаются с BEGIN IMMEDIATE: блокировка записи
+# берётся сразу, а не при первом UPDATE, поэтому две транзакции не ждут друг друга до ошибки.
+# Подключения живут SQLITE_CONN_MAX_AGE секунд. Отключается переменной окружения SQLITE_CONCURRENT_MODE=0,
+# замер пропускной способности - команда stress_database
+SQLITE_CONCURRENT_MODE = os.getenv('SQLITE_CONCURRENT_MODE', '1') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,  # мс
+    'cache_size': -65536,  # отрицательное значение - в КиБ, т. е. 64 МБ на подключение
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+SQLITE_CONCURRENT_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+}
+SQLITE_CONN_MAX_AGE = 600
+
+if SQLITE_CONCURRENT_MODE:
+    DATABASES['default']['OPTIONS'] = SQLITE_CONCURRENT_OPTIONS
+    DATABASES['default']['CONN_MAX_AGE'] = SQLITE_CONN_MAX_AGE
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Чтение с реплик (config/db_router.py): DATABASE_REPLICAS - пути к файлам реплик SQLite через запятую
+# (реплики обновляются извне, например Litestream). Запись всегда идёт в default, чтение в HTTP-запросах -
+# с реплик; после записи запрос, а также запросы того же пользователя в следующие
+# DATABASE_REPLICA_PIN_SECONDS секунд читают из основной базы. Без DATABASE_REPLICAS маршрутизация выключена
+DATABASE_REPLICAS = [path for path in os.getenv('DATABASE_REPLICAS', '').split(',') if path]
+DATABASE_READ_REPLICAS = [f'replica{number}' for number in range(1, len(DATABASE_REPLICAS) + 1)]
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+if DATABASE_REPLICAS:
+    for alias, path in zip(DATABASE_READ_REPLICAS, DATABASE_REPLICAS):
+        # В тестах реплика указывает на тестовую базу default
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': path, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+    MIDDLEWARE.insert(0, 'config.db_router.PrimaryPinMiddleware')
+
+# Варианты картинок постов и аватаров (blog/images.py, команда process_images): ширины в пикселях,
+# форматы и качество сжатия. После изменения нужно выполнить process_images --rebuild
+POST_IMAGE_WIDTHS = (320, 640, 960, 1280)
+AVATAR_IMAGE_WIDTHS = (80, 160, 240)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+
+# Просмотренные посты посетителя (blog/seen_posts.py): не больше SEEN_POSTS_MAX_IDS id в подписанной cookie
+# (около 1-2 КБ), cookie живёт SEEN_POSTS_COOKIE_AGE секунд
+SEEN_POSTS_MAX_IDS = 500
+SEEN_POSTS_COOKIE_AGE = 30 * 24 * 60 * 60
+
+# Кэш пользователей для аутентификации по сессии (users/cache.py), секунды
+USER_CACHE_TIMEOUT = 300
+
+# Подсказки тегов и категорий (blog/autocomplete.py): индекс в памяти процесса полностью перестраивается
+# раз в AUTOCOMPLETE_MAX_AGE секунд, AUTOCOMPLETE_MAX_LIMIT - наибольшее количество подсказок в ответе
+AUTOCOMPLETE_MAX_AGE = 300
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+# Кэш страниц целиком для анонимных посетителей (blog/page_cache.py): главная, лента, категории, теги и
+# страницы постов. Изменения сбрасывают страницы сразу (сигналы), PAGE_CACHE_TIMEOUT ограничивает время,
+# на которое может отстать число просмотров и рейтинг. PAGE_CACHE_ENABLED=0 в окружении отключает кэш
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_TIMEOUT = 120
+
+# Кэши. default - в памяти процесса: карточки постов и страницы для анонимных посетителей, ключи которых
+# содержат версии данных, поэтому каждый процесс gunicorn может держать свою копию.
+# shared - общий для всех процессов: пользователи для аутентификации (users/cache.py), которые сбрасываются
+# при смене пароля и деактивации, иначе другой процесс продолжил бы пускать по старой сессии, и версии
+# страниц (blog/page_cache.py), иначе изменение не сбросило бы страницы, закэшированные другими процессами.
+# По умолчанию - файлы в SHARED_CACHE_DIR, с SHARED_CACHE_URL (redis://...) - Redis (нужен пакет redis).
+# Кэш в памяти процесса для shared не допускается (проверка users.E001)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SHARED_CACHE_DIR', BASE_DIR / 'cache'),
+    },
+}
+if os.getenv('SHARED_CACHE_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SHARED_CACHE_URL'),
+    }
@@ -1,4 +1,18 @@
 from django.contrib import admin
-from .models import CustomUser
+from .models import CustomUser, Follow
 
 admin.site.register(CustomUser)
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+  list_display = ['follower', 'author', 'created_at']
+  search_fields = ['follower__username', 'author__username']
+  raw_id_fields = ['follower', 'author']
+
+  # Подписки меняются через blog.timeline (счётчик подписчиков и ленты), здесь только просмотр
+  def has_add_permission(self, request):
+    return False
+
+  def has_change_permission(self, request, obj=None):
+    return False
@@ -1,18 +1,61 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .cache import aget_cached_user, get_cached_user
 
 User = get_user_model()
 
 
 class EmailOrUsernameBackend(ModelBackend):
-  def authenticate(self, request, username = ..., password = ..., **kwargs):
-    try:
-      user = User.objects.get(Q(username=username) | Q(email=username))
-    except User.DoesNotExist:
+  def authenticate(self, request, username = None, password = None, **kwargs):
+    if username is None:
+      username = kwargs.get(User.USERNAME_FIELD)
+    if username is None or password is None:
+      return None
+
+    # Без учёта регистра, по индексам user_username_lower_idx и user_email_lower_idx
+    login = username.lower()
+    candidates = list(
+      User.objects.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+      .filter(Q(username_lower=login) | Q(email_lower=login))[:10]
+    )
+    user = self.choose_user(candidates, username)
+
+    if user is None:
+      # Хэширование пароля выравнивает время ответа для существующих и несуществующих логинов
+      User().set_password(password)
       return None
-    
-    if user.check_password(password):
+
+    if user.check_password(password) and self.user_can_authenticate(user):
       return user
-    
+
     return None
+
+  async def aauthenticate(self, request, username = None, password = None, **kwargs):
+    return await sync_to_async(self.authenticate)(request, username, password, **kwargs)
+
+  def choose_user(self, candidates, login):
+    """
+    Логин без учёта регистра может совпасть у нескольких пользователей ("Bob" и "bob",
+    или имя одного совпадает с почтой другого): тогда нужно точное совпадение
+    """
+    if len(candidates) == 1:
+      return candidates[0]
+
+    for field in ('username', 'email'):
+      for user in candidates:
+        if getattr(user, field) == login:
+          return user
+
+    return None
+
+  # Неактивные пользователи в кэш не попадают: ModelBackend.get_user для них возвращает None,
+  # а деактивация проходит через save() и сбрасывает кэш
+  def get_user(self, user_id):
+    return get_cached_user(user_id, super().get_user)
+
+  async def aget_user(self, user_id):
+    return await aget_cached_user(user_id, super().aget_user)
@@ -0,0 +1,53 @@
+"""
+Кэш пользователей для аутентификации по сессии.
+
+AuthenticationMiddleware на каждый запрос загружает пользователя по id из сессии
+(EmailOrUsernameBackend.get_user). Объект пользователя кэшируется по id на USER_CACHE_TIMEOUT секунд
+и сбрасывается при сохранении или удалении пользователя (users/signals.py), а также после
+UPDATE по queryset, который сигналов не отправляет (forget_user вызывается явно).
+
+Кэш - CACHES['shared'], общий для всех процессов (проверка users.E001): сброс после смены пароля
+или деактивации должен действовать во всех процессах, а не только в том, где изменили пользователя.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def user_cache():
+  return caches['shared']
+
+
+def user_cache_key(user_id):
+  return f'auth_user:{user_id}'
+
+
+def get_cached_user(user_id, load):
+  """Пользователь из кэша или load(user_id) с записью в кэш (None не кэшируется)"""
+  key = user_cache_key(user_id)
+  cache = user_cache()
+  user = cache.get(key)
+  if user is None:
+    user = load(user_id)
+    if user is not None:
+      cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+  return user
+
+
+async def aget_cached_user(user_id, load):
+  key = user_cache_key(user_id)
+  cache = user_cache()
+  user = await cache.aget(key)
+  if user is None:
+    user = await load(user_id)
+    if user is not None:
+      await cache.aset(key, user, settings.USER_CACHE_TIMEOUT)
+  return user
+
+
+def forget_user(user_id):
+  key = user_cache_key(user_id)
+  cache = user_cache()
+  cache.delete(key)
+  # Пока транзакция не зафиксирована, параллельный запрос может снова закэшировать старую строку
+  transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые не видны другим процессам
+PROCESS_LOCAL_CACHES = (
+  'django.core.cache.backends.locmem.LocMemCache',
+  'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+  """
+  Кэш пользователей (users/cache.py) и версии страниц в кэше (blog/page_cache.py)
+  должны быть общими для всех процессов
+  """
+  backend = settings.CACHES.get('shared', {}).get('BACKEND')
+  if backend is None or backend in PROCESS_LOCAL_CACHES:
+    return [
+      Error(
+        "CACHES['shared'] должен быть общим для всех процессов (файлы, Redis, Memcached)",
+        hint=(
+          "В кэше в памяти процесса смена пароля или деактивация пользователя "
+          "не сбрасывает его копии в других процессах, а изменение поста - страницы, "
+          "закэшированные другими процессами"
+        ),
+        id='users.E001',
+      )
+    ]
+  return []
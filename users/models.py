@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -15,12 +16,54 @@ class CustomUser(AbstractUser):
   phone_number_verified = models.BooleanField(default=False, verbose_name='Номер телефона подтверждён')
   
   avatar = models.ImageField(upload_to="user_avatars/", null=True, blank=True)
+  # Уменьшенные копии аватара и его размеры (blog/images.py), строятся командой process_images
+  avatar_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты аватара')
   selected_theme = models.CharField(choices=THEME_CHOICES, default="dark")
   subscribed_to_important_news = models.BooleanField(
     default=False,
     verbose_name="Подписан на важные новости"
   )
 
+  following = models.ManyToManyField(
+    'self',
+    through='Follow',
+    symmetrical=False,
+    related_name='followers',
+    blank=True,
+    verbose_name="Подписки на авторов"
+  )
+  # Обновляется вместе с Follow, по нему выбирается способ доставки постов в ленту подписок
+  followers_count = models.PositiveIntegerField(default=0, verbose_name="Количество подписчиков")
+
   class Meta:
     verbose_name = 'Пользователь'
     verbose_name_plural = "Пользователи"
+    indexes = [
+      # Проверка, не подтверждён ли номер у другого пользователя
+      models.Index(fields=['phone_number'], name='user_phone_number_idx'),
+      # Вход по имени пользователя или почте без учёта регистра (EmailOrUsernameBackend)
+      models.Index(Lower('username'), name='user_username_lower_idx'),
+      models.Index(Lower('email'), name='user_email_lower_idx'),
+    ]
+
+
+class Follow(models.Model):
+  """Подписка пользователя (follower) на автора (author)"""
+  follower = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='following_relations')
+  author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='follower_relations')
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    verbose_name = 'Подписка на автора'
+    verbose_name_plural = "Подписки на авторов"
+    constraints = [
+      models.UniqueConstraint(fields=['follower', 'author'], name='unique_follow'),
+      models.CheckConstraint(condition=~models.Q(follower=models.F('author')), name='follow_not_self'),
+    ]
+    indexes = [
+      # Рассылка поста подписчикам автора
+      models.Index(fields=['author', 'follower'], name='follow_author_idx'),
+    ]
+
+  def __str__(self):
+    return f"{self.follower} -> {self.author}"
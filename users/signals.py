@@ -0,0 +1,14 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import forget_user
+
+User = get_user_model()
+
+
+# Смена темы, телефона, подписки, пароля, last_login при входе - всё проходит через save()
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+  forget_user(instance.pk)
@@ -0,0 +1,26 @@
+import { postAction } from "../../../../static/js/utils.js";
+
+document.addEventListener('click', async (event) => {
+  const followBtnElement = event.target.closest('.follow-btn');
+  if (!followBtnElement) {
+    return;
+  }
+
+  const isFollowing = followBtnElement.dataset.isFollowing === 'true';
+  const url = isFollowing ? followBtnElement.dataset.unfollowUrl : followBtnElement.dataset.followUrl;
+
+  const data = await postAction(url);
+  if (!data || data.error) {
+    return;
+  }
+
+  followBtnElement.dataset.isFollowing = data.is_following ? 'true' : 'false';
+  followBtnElement.textContent = data.is_following ? 'Отписаться' : 'Подписаться';
+  followBtnElement.classList.toggle('btn-primary', !data.is_following);
+  followBtnElement.classList.toggle('btn-outline-secondary', data.is_following);
+
+  const followersCountElement = document.querySelector('.followers-count');
+  if (followersCountElement) {
+    followersCountElement.textContent = data.followers_count;
+  }
+});
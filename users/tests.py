@@ -1,3 +1,135 @@
-from django.test import TestCase
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from blog.timeline import follow
+
+from .cache import user_cache_key
+from .checks import check_shared_cache
+
+User = get_user_model()
+
+# Загрузка пользователя по id из сессии (ModelBackend.get_user)
+AUTH_QUERY = 'FROM "users_customuser" WHERE "users_customuser"."id" = '
+
+
+# Общий кэш в тестах - в памяти, отдельно от кэша по умолчанию
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+def auth_queries(queries):
+    return [query['sql'] for query in queries if AUTH_QUERY in query['sql']]
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], CACHES=TEST_CACHES)
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='password')
+        cls.author = User.objects.create_user(username='author', email='author@example.com', password='password')
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.client.force_login(self.user)
+
+    def test_no_auth_queries_on_cache_hit(self):
+        self.client.get(reverse('users:settings'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:settings'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(auth_queries(queries.captured_queries), [])
+
+    def test_save_invalidates_cached_user(self):
+        self.client.get(reverse('users:settings'))
+        self.client.post(reverse('users:toggle_theme'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:settings'))
+        self.assertEqual(response.context['current_theme'], 'light')
+        self.assertEqual(len(auth_queries(queries.captured_queries)), 1)
+
+    def test_queryset_update_invalidates_cached_user(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('users:settings'))
+
+        follow(self.user, self.author)
+        response = self.client.get(reverse('users:settings'))
+        self.assertEqual(response.context['user'].followers_count, 1)
+
+    def test_user_cached_in_shared_cache(self):
+        self.client.get(reverse('users:settings'))
+        self.assertIsNotNone(caches['shared'].get(user_cache_key(self.user.id)))
+        self.assertIsNone(caches['default'].get(user_cache_key(self.user.id)))
+
+    def test_deactivation_and_password_change_end_session(self):
+        for change in ('is_active', 'password'):
+            with self.subTest(change=change):
+                user = User.objects.create_user(username=change, email=f'{change}@example.com', password='password')
+                self.client.force_login(user)
+                self.assertTrue(self.client.get(reverse('users:login')).wsgi_request.user.is_authenticated)
+
+                if change == 'is_active':
+                    user.is_active = False
+                else:
+                    user.set_password('new-password')
+                with self.captureOnCommitCallbacks(execute=True):
+                    user.save()
+
+                self.assertFalse(self.client.get(reverse('users:login')).wsgi_request.user.is_authenticated)
+
+    def test_anonymous_theme_from_session(self):
+        self.client.logout()
+        self.client.post(reverse('users:toggle_theme'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:login'))
+        self.assertEqual(response.context['current_theme'], 'light')
+        self.assertFalse([query for query in queries.captured_queries if 'users_customuser' in query['sql']])
+
+
+class EmailOrUsernameBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='Alice', email='Alice@Example.com', password='password')
+        cls.bob = User.objects.create_user(username='bob', email='bob@example.com', password='password')
+        cls.big_bob = User.objects.create_user(username='Bob', email='big.bob@example.com', password='password')
+
+    def test_case_insensitive_login(self):
+        self.assertEqual(authenticate(username='alice', password='password'), self.alice)
+        self.assertEqual(authenticate(username='ALICE@example.COM', password='password'), self.alice)
+        self.assertIsNone(authenticate(username='alice', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody', password='password'))
+
+    def test_ambiguous_login_needs_exact_match(self):
+        self.assertEqual(authenticate(username='bob', password='password'), self.bob)
+        self.assertEqual(authenticate(username='Bob', password='password'), self.big_bob)
+        self.assertIsNone(authenticate(username='BOB', password='password'))
+
+    def test_login_uses_expression_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            authenticate(username='alice', password='password')
+        sql = queries.captured_queries[0]['sql']
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('user_username_lower_idx', plan)
+        self.assertIn('user_email_lower_idx', plan)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_process_local_cache_rejected(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            with self.subTest(backend=backend):
+                caches_setting = {**TEST_CACHES, 'shared': {'BACKEND': f'django.core.cache.backends.{backend}'}}
+                with override_settings(CACHES=caches_setting):
+                    self.assertEqual([error.id for error in check_shared_cache(None)], ['users.E001'])
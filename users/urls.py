@@ -56,5 +56,7 @@ urlpatterns = [
 
     path("favorite-posts/", views.FavoritePostsView.as_view(), name="favorite_posts"),
     path('settings/', views.SettingsView.as_view(), name='settings'),
+    path("follow/<str:user_username>/", views.follow_user, name='follow'),
+    path("unfollow/<str:user_username>/", views.unfollow_user, name='unfollow'),
     path("<str:user_username>/", views.ProfileView.as_view(), name='profile'),
 ]
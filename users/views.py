@@ -6,7 +6,7 @@ from django.urls import reverse_lazy
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -19,6 +19,8 @@ from django.contrib.auth.decorators import login_required
 
 from config.settings import LOGIN_REDIRECT_URL, DEFAULT_FROM_EMAIL, FIREBASE_API_KEY
 from blog.models import Post
+from blog import timeline
+from blog.feeds import PostFeedMixin, attach_post_cards, feed_queryset
 from .forms import CustomAuthenticationForm, CustomUserCreationForm
 
 User = get_user_model()
@@ -220,6 +222,33 @@ def toggle_theme(request):
     return JsonResponse({'new_theme': new_theme})
 
 
+def follow_response(request, author, changed):
+    return JsonResponse({
+        'changed': changed,
+        'is_following': request.user.following.filter(id=author.id).exists(),
+        'followers_count': author.followers_count,
+    })
+
+
+@require_POST
+@login_required
+def follow_user(request, user_username):
+    author = get_object_or_404(User, username=user_username)
+    if author == request.user:
+        return JsonResponse({'error': 'Нельзя подписаться на самого себя'}, status=400)
+
+    changed = timeline.follow(request.user, author)
+    return follow_response(request, author, changed)
+
+
+@require_POST
+@login_required
+def unfollow_user(request, user_username):
+    author = get_object_or_404(User, username=user_username)
+    changed = timeline.unfollow(request.user, author)
+    return follow_response(request, author, changed)
+
+
 class ProfileView(DetailView, MultipleObjectMixin):
     model = User
     template_name = 'users/pages/profile.html'
@@ -229,28 +258,32 @@ class ProfileView(DetailView, MultipleObjectMixin):
     paginate_by = 5
 
     def get_context_data(self, **kwargs):
-        posts = Post.objects.filter(
+        posts = feed_queryset(Post.objects.filter(
             author=self.object
-        ).order_by('-created_at')
+        ).order_by('-created_at'))
 
         # Контекст теперь включает paginator, page_obj, is_paginated
         context = super().get_context_data(object_list=posts, **kwargs)
         
-        context['posts'] = context['object_list']
+        context['posts'] = attach_post_cards(context['object_list'], self.request)
+        context['is_following'] = (
+            self.request.user.is_authenticated and
+            self.request.user.following.filter(id=self.object.id).exists()
+        )
         
         del context['object_list']
 
         return context
 
 
-class FavoritePostsView(ListView):
+class FavoritePostsView(PostFeedMixin, ListView):
     model = Post
     template_name = 'users/pages/favorite_posts.html'
     context_object_name = "posts"
     paginate_by = 2
 
     def get_queryset(self):
-        return self.request.user.favorite_posts.all()
+        return feed_queryset(self.request.user.favorite_posts.order_by('-created_at'))
 
 
 class SettingsView(TemplateView):